@@ -1,40 +1,80 @@
-from typing import Dict, Any
-import boto3
+import json
+import threading
+import time
+import uuid
+from typing import Dict, Any, Iterator, List, Optional, Union
 from botocore.exceptions import ClientError, NoCredentialsError
 from pathlib import Path
+from app.core.database.athena.resilience import FATAL, classify_error, get_retry_policy
 from app.core.models.athena_models import AthenaConnectionConfig
+from app.core.models.query_result import QueryResult
 from app.core.logger.config import LoggerConfig
+from app.utils.sql import bind_parameters, normalize_sql, query_fingerprint, sql_literal
+from app.utils.tracing import current_span, span, traced
 
 # Nota: Path(__file__).stem == __name__.split('.')[-1]
 logger = LoggerConfig(file_name=Path(__file__).stem,debug=True,root_file=__name__).get_logger()
 
+# Estados en los que una consulta ya terminó y no se puede cancelar
+TERMINAL_STATES = ("SUCCEEDED", "FAILED", "CANCELLED")
+
 class AthenaClient:
-    def __init__(self, config: AthenaConnectionConfig):
+    # Segundos entre consultas de estado mientras la consulta está en cola o ejecutándose
+    poll_interval = 2
+
+    def __init__(self, config: AthenaConnectionConfig, client=None):
+        """
+        Args:
+            config: Configuración de conexión
+            client: Backend compatible con boto3.client('athena'); si es None se crea el cliente de AWS bajo demanda
+        """
         self.config = config
-        self._client = None
+        self._client = client
+        # Consultas iniciadas por este proceso que aún no terminan: query_execution_id -> hora de inicio
+        self._in_flight: Dict[str, float] = {}
+        self._in_flight_lock = threading.Lock()
+        # Prepared statements registrados por este cliente: nombre -> huella del SQL registrado
+        self._prepared: Dict[str, str] = {}
+        self._prepared_lock = threading.Lock()
+        # Reintentos y circuito compartidos por todos los clientes de la misma base de datos
+        self._retry = get_retry_policy(config.database)
         
     @property
     def client(self):
         if self._client is None:
             logger.info("Iniciando cliente Athena...")
+            # boto3 se importa aquí para mantenerlo fuera de la ruta crítica de importación de app.main
+            import boto3
+            from botocore.config import Config
             try:
                 session = boto3.Session(
                     aws_access_key_id=self.config.aws_access_key_id,
                     aws_secret_access_key=self.config.aws_secret_access_key,
                     region_name=self.config.region
                 )
-                self._client = session.client('athena')
+                # Los reintentos los maneja RetryPolicy (con presupuesto y circuito), no botocore
+                self._client = session.client('athena', config=Config(retries={'max_attempts': 1, 'mode': 'standard'}))
             except NoCredentialsError:
                 logger.error("Credenciales AWS no encontradas")
                 raise
         return self._client
     
+    def _call(self, operation: str, guarded: bool = False, **params) -> Any:
+        """
+        Llama a la API de Athena con la política de reintentos de la base de datos.
+        guarded=True para las llamadas que inician trabajo nuevo: fallan de inmediato si el circuito está abierto.
+        """
+        with span(f"athena.{operation}", database=self.config.database, workgroup=self.config.workgroup):
+            return self._retry.call(operation, getattr(self.client, operation), guarded=guarded, **params)
+
     def test_connection(self) -> Dict[str, Any]:
         """
         Test connection to specific Athena database
         """
         try:
-            response = self.client.list_databases(
+            response = self._call(
+                'list_databases',
+                guarded=True,
                 CatalogName='AwsDataCatalog',
                 MaxResults=20
             )
@@ -69,27 +109,58 @@ class AthenaClient:
                 "database": self.config.database
             }
     
-    def execute_query(self, query: str) -> Dict[str, Any]:
+    def execute_query(
+        self,
+        query: str,
+        parameters: Optional[List[Any]] = None,
+        prepared_statement: Optional[str] = None
+    ) -> Dict[str, Any]:
         """
-        Ejecutar consulta en la base de datos específica
+        Ejecutar consulta en la base de datos específica.
+
+        Args:
+            query: SQL con marcadores '?' para los parámetros
+            parameters: Valores que se envían como ExecutionParameters (no se concatenan al SQL)
+            prepared_statement: Si se indica, la consulta se registra como prepared statement y se ejecuta con EXECUTE
         """
+        fingerprint = query_fingerprint(query, parameters, self.config.database)
         try:
-            # Iniciar ejecución de query
-            response = self.client.start_query_execution(
-                QueryString=query,
-                QueryExecutionContext={
+            params = {
+                "QueryString": query,
+                "QueryExecutionContext": {
                     'Database': self.config.database
                 },
-                ResultConfiguration={
+                "ResultConfiguration": {
                     'OutputLocation': self.config.s3_output_location
+                },
+                "WorkGroup": self.config.workgroup,
+                # Un token por ejecución lógica, igual en todos los reintentos: si Athena recibió un intento cuya
+                # respuesta se perdió, el reintento devuelve la misma ejecución en lugar de iniciar otra
+                "ClientRequestToken": str(uuid.uuid4())
+            }
+            if prepared_statement:
+                params["QueryString"] = f"EXECUTE {self.prepare_statement(prepared_statement, query)}"
+            if parameters:
+                params["ExecutionParameters"] = [sql_literal(p) for p in parameters]
+            if self.config.result_reuse_minutes:
+                params["ResultReuseConfiguration"] = {
+                    'ResultReuseByAgeConfiguration': {
+                        'Enabled': True,
+                        'MaxAgeInMinutes': self.config.result_reuse_minutes
+                    }
                 }
-            )
+
+            # Iniciar ejecución de query
+            response = self._call('start_query_execution', guarded=True, **params)
             
             query_execution_id = response['QueryExecutionId']
+            with self._in_flight_lock:
+                self._in_flight[query_execution_id] = time.time()
             
             return {
                 "status": "success",
                 "query_execution_id": query_execution_id,
+                "query_fingerprint": fingerprint,
                 "database": self.config.database
             }
             
@@ -103,76 +174,327 @@ class AthenaClient:
                 "message": f"Error ejecutando query: {error_message}",
                 "error_code": error_code
             }
+
+    def prepare_statement(self, name: str, query: str) -> str:
+        """
+        Registra (o actualiza si el SQL cambió) un prepared statement en el workgroup y devuelve su nombre.
+        Los statements son por workgroup, por eso el nombre incluye la base de datos del cliente.
+        Solo se consulta a Athena la primera vez que se usa cada statement en el proceso.
+        """
+        statement_name = f"{name}_{self.config.database}"
+        fingerprint = query_fingerprint(query)
+        with self._prepared_lock:
+            if self._prepared.get(statement_name) == fingerprint:
+                return statement_name
+
+            try:
+                current = self._call(
+                    'get_prepared_statement',
+                    guarded=True,
+                    StatementName=statement_name,
+                    WorkGroup=self.config.workgroup
+                )['PreparedStatement']['QueryStatement']
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ResourceNotFoundException':
+                    raise
+                current = None
+
+            if current is None:
+                logger.info(f"Creando prepared statement {statement_name}")
+                self._call(
+                    'create_prepared_statement',
+                    guarded=True,
+                    StatementName=statement_name,
+                    WorkGroup=self.config.workgroup,
+                    QueryStatement=query
+                )
+            elif normalize_sql(current) != normalize_sql(query):
+                logger.info(f"Actualizando prepared statement {statement_name}")
+                self._call(
+                    'update_prepared_statement',
+                    guarded=True,
+                    StatementName=statement_name,
+                    WorkGroup=self.config.workgroup,
+                    QueryStatement=query
+                )
+
+            self._prepared[statement_name] = fingerprint
+            return statement_name
         
-    def get_query_results(self, query_execution_id: str) -> Dict[str, Any]:
+    def list_table_metadata(self) -> Iterator[Dict[str, Any]]:
         """
-        Obtiene los resultados de una consulta ejecutada
+        Recorre los metadatos (columnas, tipos y particiones) de todas las tablas de la base de datos
         """
-        try:
-            response = self.client.get_query_results(
-                QueryExecutionId=query_execution_id
-            )
+        next_token = None
+        while True:
+            params = {"CatalogName": 'AwsDataCatalog', "DatabaseName": self.config.database, "MaxResults": 50}
+            if next_token:
+                params["NextToken"] = next_token
+            response = self._call('list_table_metadata', **params)
+            yield from response.get('TableMetadataList', [])
+            next_token = response.get('NextToken')
+            if not next_token:
+                break
+
+    def get_table_metadata(self, table: str) -> Dict[str, Any]:
+        """
+        Metadatos de una sola tabla; los errores de Athena se propagan como ClientError
+        """
+        response = self._call(
+            'get_table_metadata',
+            CatalogName='AwsDataCatalog',
+            DatabaseName=self.config.database,
+            TableName=table
+        )
+        return response['TableMetadata']
+
+    def iter_query_results(self, query_execution_id: str, next_token: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Recorre los resultados página por página (Athena entrega máximo 1000 filas por página) sin acumularlos.
+        Cada elemento es {"columns": [...], "column_types": [...], "data": [...], "next_token": ...}; los errores de Athena
+        se propagan como ClientError. Con next_token se continúa un recorrido anterior desde esa página.
+        """
+        columns = None
+        column_types: List[str] = []
+        while True:
+            params = {"QueryExecutionId": query_execution_id}
+            if next_token:
+                params["NextToken"] = next_token
+            response = self._call('get_query_results', **params)
+
             # Procesar resultados
-            rows = []
-            for row in response['ResultSet']['Rows']:
-                row_data = [data.get('VarCharValue', '') for data in row['Data']]
-                rows.append(row_data)
+            rows = [
+                [data.get('VarCharValue', '') for data in row['Data']]
+                for row in response['ResultSet']['Rows']
+            ]
+            if columns is None:
+                column_info = response['ResultSet'].get('ResultSetMetadata', {}).get('ColumnInfo', [])
+                column_types = [info.get('Type', 'varchar') for info in column_info]
+                if 'NextToken' in params:
+                    # Al continuar un recorrido los nombres se toman de los metadatos
+                    columns = [info['Name'] for info in column_info]
+                else:
+                    # La primera fila de la primera página son los nombres de las columnas
+                    columns = rows[0] if rows else []
+                    rows = rows[1:]
+
+            next_token = response.get('NextToken')
+            yield {"columns": columns, "column_types": column_types, "data": rows, "next_token": next_token}
+
+            if not next_token:
+                break
+
+        # Si hay resultados la consulta ya terminó
+        self._forget(query_execution_id)
+
+    def get_query_results(self, query_execution_id: str, statistics: Optional[Dict[str, Any]] = None) -> Union[QueryResult, Dict[str, Any]]:
+        """
+        Obtiene los resultados de una consulta ejecutada, recorriendo todas las páginas (Athena entrega máximo 1000 filas por página).
+        Devuelve un QueryResult columnar, o el dict de error.
+        """
+        try:
+            return QueryResult.from_pages(query_execution_id, self.iter_query_results(query_execution_id), statistics)
             
-            # La primera fila son los nombres de las columnas
-            columns = rows[0] if rows else []
-            data_rows = rows[1:] if len(rows) > 1 else []
+        except ClientError as e:
+            error_code = e.response['Error']['Code']
+            error_message = e.response['Error']['Message']
+            logger.error(f"Error obteniendo resultados: {error_code} - {error_message}")
             
+            return {
+                "status": "error",
+                "message": f"Error obteniendo resultados: {error_message}",
+                "error_code": error_code
+            }
+
+    def get_query_statistics(self, query_execution_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Statistics de una ejecución (DataScannedInBytes, tiempos); None si Athena no las entrega
+        """
+        try:
+            response = self._call('get_query_execution', QueryExecutionId=query_execution_id)
+        except ClientError as e:
+            logger.warning(f"No se pudieron obtener las estadísticas de {query_execution_id}: {e.response['Error']['Message']}")
+            return None
+        return response['QueryExecution'].get('Statistics')
+
+    def explain_io(self, query: str, parameters: Optional[List[Any]] = None, timeout: int = 60) -> Dict[str, Any]:
+        """
+        Ejecuta `EXPLAIN (TYPE IO, FORMAT JSON)` de la consulta: Athena la planea sin leer datos y estima filas y bytes
+        de entrada por tabla. Los parámetros se sustituyen como literales (sql_literal) porque EXPLAIN no es un
+        prepared statement. Devuelve {"status": "success", "plan": {...}} o el dict de error.
+        """
+        try:
+            statement = bind_parameters(query, [sql_literal(p) for p in parameters or []])
+        except ValueError as e:
+            return {"status": "error", "message": f"Parámetros inválidos: {str(e)}"}
+
+        execution = self.execute_query(f"EXPLAIN (TYPE IO, FORMAT JSON) {statement}")
+        if execution["status"] == "error":
+            return execution
+        result = self.wait_for_query_completion(execution["query_execution_id"], timeout=timeout)
+        if result["status"] == "error":
+            return result
+
+        # El plan llega como texto en la columna "Query Plan", a veces repartido en varias filas
+        text = "\n".join(str(row[0]) for row in result.iter_rows())
+        try:
+            plan = json.loads(text)
+        except ValueError:
+            return {"status": "error", "message": "EXPLAIN no devolvió un plan JSON", "plan_text": text}
+        return {"status": "success", "query_execution_id": execution["query_execution_id"], "plan": plan}
+
+    def stop_query(self, query_execution_id: str) -> Dict[str, Any]:
+        """
+        Cancela una consulta en Athena para liberar su lugar en la cuota de concurrencia.
+        Si la consulta ya había terminado no se cancela y se devuelve su estado real (SUCCEEDED, FAILED o CANCELLED).
+        """
+        try:
+            state = self._call(
+                'get_query_execution',
+                QueryExecutionId=query_execution_id
+            )['QueryExecution']['Status']['State']
+        except ClientError as e:
+            # Sin el estado se intenta cancelar de todos modos para no dejar la consulta ocupando concurrencia
+            logger.warning(f"No se pudo leer el estado de {query_execution_id} antes de cancelarla: {e.response['Error']['Code']}")
+            state = None
+
+        if state in TERMINAL_STATES:
+            self._forget(query_execution_id)
+            logger.info(f"La consulta {query_execution_id} ya había terminado ({state}), no se cancela")
             return {
                 "status": "success",
                 "query_execution_id": query_execution_id,
-                "columns": columns,
-                "data": data_rows,
-                "row_count": len(data_rows)
+                "query_state": state
+            }
+
+        try:
+            self._call('stop_query_execution', QueryExecutionId=query_execution_id)
+            logger.warning(f"Consulta cancelada: {query_execution_id}")
+            return {
+                "status": "success",
+                "query_execution_id": query_execution_id,
+                "query_state": "CANCELLED"
             }
-            
         except ClientError as e:
             error_code = e.response['Error']['Code']
             error_message = e.response['Error']['Message']
-            logger.error(f"Error obteniendo resultados: {error_code} - {error_message}")
-            
+            logger.error(f"Error cancelando query: {error_code} - {error_message}")
             return {
                 "status": "error",
-                "message": f"Error obteniendo resultados: {error_message}",
+                "message": f"Error cancelando query: {error_message}",
                 "error_code": error_code
             }
+        finally:
+            self._forget(query_execution_id)
+
+    @property
+    def outstanding(self) -> int:
+        """Número de consultas en ejecución iniciadas por este cliente"""
+        with self._in_flight_lock:
+            return len(self._in_flight)
 
-    def wait_for_query_completion(self, query_execution_id: str, timeout: int = 300) -> Dict[str, Any]:
+    def list_in_flight(self) -> Dict[str, float]:
         """
-        Espera a que la consulta termine y devuelve los resultados
+        Consultas de este proceso aún en ejecución con sus segundos transcurridos
         """
-        import time
-        
+        now = time.time()
+        with self._in_flight_lock:
+            return {qid: round(now - started, 1) for qid, started in self._in_flight.items()}
+
+    def cancel_in_flight(self) -> Dict[str, Any]:
+        """
+        Cancela todas las consultas en ejecución de este cliente (se usa al apagar la aplicación)
+        """
+        with self._in_flight_lock:
+            pending = list(self._in_flight)
+        return {qid: self.stop_query(qid)["status"] for qid in pending}
+
+    def _forget(self, query_execution_id: str) -> None:
+        with self._in_flight_lock:
+            self._in_flight.pop(query_execution_id, None)
+
+    @staticmethod
+    def _record_statistics(response: Dict[str, Any]) -> None:
+        """
+        Agrega al span activo los tiempos de cola y ejecución que reporta Athena
+        """
+        current = current_span()
+        if current is None:
+            return
+        statistics = response['QueryExecution'].get('Statistics', {})
+        current.set(**{
+            "athena.queue_ms": statistics.get('QueryQueueTimeInMillis', 0),
+            "athena.engine_ms": statistics.get('EngineExecutionTimeInMillis', 0),
+            "athena.total_ms": statistics.get('TotalExecutionTimeInMillis', 0),
+            "athena.scanned_bytes": statistics.get('DataScannedInBytes', 0),
+        })
+
+    @traced()
+    def wait_for_query_completion(
+        self,
+        query_execution_id: str,
+        timeout: int = 300,
+        cancel_event: Optional[threading.Event] = None,
+        fetch_results: bool = True
+    ) -> Union[QueryResult, Dict[str, Any]]:
+        """
+        Espera a que la consulta termine y devuelve los resultados.
+        Si se agota el timeout o se activa cancel_event (p. ej. el cliente HTTP se desconectó) la consulta se cancela en Athena.
+        Con fetch_results=False solo espera y devuelve el estado, para leer después con iter_query_results.
+        """
+        cancel_event = cancel_event or threading.Event()
         start_time = time.time()
         
         while time.time() - start_time < timeout:
+            if cancel_event.is_set():
+                self.stop_query(query_execution_id)
+                return {
+                    "status": "error",
+                    "message": "Query cancelled: la petición fue abandonada",
+                    "query_execution_id": query_execution_id,
+                    "query_state": "CANCELLED"
+                }
             try:
                 # Verificar estado de la consulta
-                response = self.client.get_query_execution(
+                response = self._call(
+                    'get_query_execution',
                     QueryExecutionId=query_execution_id
                 )
                 
                 state = response['QueryExecution']['Status']['State']
                 
                 if state in ['SUCCEEDED']:
+                    self._forget(query_execution_id)
+                    self._record_statistics(response)
+                    statistics = response['QueryExecution'].get('Statistics', {})
+                    if not fetch_results:
+                        return {
+                            "status": "success",
+                            "query_execution_id": query_execution_id,
+                            "query_state": state,
+                            "statistics": statistics
+                        }
                     # Consulta completada, obtener resultados
-                    return self.get_query_results(query_execution_id)
+                    return self.get_query_results(query_execution_id, statistics)
                 elif state in ['FAILED', 'CANCELLED']:
+                    self._forget(query_execution_id)
                     error_message = response['QueryExecution']['Status'].get('StateChangeReason', 'Unknown error')
+                    athena_error = response['QueryExecution']['Status'].get('AthenaError', {})
                     return {
                         "status": "error",
                         "message": f"Query failed: {error_message}",
-                        "query_state": state
+                        "query_state": state,
+                        "retryable": bool(athena_error.get('Retryable', False))
                     }
                 # Si está en RUNNING o QUEUED, continuar esperando
                 logger.warning(f"Consulta en cola de espera, state: {state}")
-                time.sleep(2)
+                cancel_event.wait(self.poll_interval)
                 
             except ClientError as e:
+                # La consulta sigue en Athena aunque no se pueda consultar su estado: ante limitación se sigue esperando
+                if classify_error(e) != FATAL:
+                    cancel_event.wait(self.poll_interval)
+                    continue
                 error_code = e.response['Error']['Code']
                 error_message = e.response['Error']['Message']
                 return {
@@ -181,7 +503,11 @@ class AthenaClient:
                     "error_code": error_code
                 }
         
+        # Nadie leerá el resultado: se cancela para no seguir ocupando concurrencia ni escaneando datos
+        self.stop_query(query_execution_id)
         return {
             "status": "error",
-            "message": f"Query timeout after {timeout} seconds"
+            "message": f"Query timeout after {timeout} seconds",
+            "query_execution_id": query_execution_id,
+            "query_state": "CANCELLED"
         }
\ No newline at end of file
@@ -1,38 +1,188 @@
-from typing import Dict, Optional
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
 from app.core.database.athena.athena_client import AthenaClient
-from app.core.models.athena_models import AthenaConnectionConfig
+from app.core.database.athena.resilience import describe_circuit_breakers
+from app.core.models.athena_models import AthenaConnectionConfig, AthenaWorkgroupConfig
 from app.core.settings.environments import settings
 
+# Ejecuciones recordadas para saber a qué workgroup/región pertenece cada query_execution_id
+MAX_TRACKED_EXECUTIONS = 5000
+
 class AthenaClientFactory:
     def __init__(self):
-        self._clients: Dict[str, AthenaClient] = {}
+        # Un cliente por (base de datos, workgroup)
+        self._clients: Dict[Tuple[str, str], AthenaClient] = {}
+        # Backends compartidos por región: los ids de ejecución de Athena son regionales
+        self._backends: Dict[str, Any] = {}
+        self._executions: "OrderedDict[str, AthenaClient]" = OrderedDict()
+        self._lock = threading.Lock()
         self.available_databases = settings.athena_databases
-    
-    def get_client(self, database_key: str) -> AthenaClient:
-        """
-        Obtiene un cliente de tipo Athena para la base de datos solicitada
-        """
-        if database_key not in self._clients:
-            if database_key not in self.available_databases:
-                raise ValueError(f"Base de datos '{database_key}' no configurada")
-            
-            database_name = self.available_databases[database_key]
-            
-            config = AthenaConnectionConfig(
-                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                region=settings.AWS_REGION,
-                database=database_name,
-                s3_output_location=settings.ATHENA_S3_OUTPUT_LOCATION
+        self.workgroups = [AthenaWorkgroupConfig(**wg) for wg in settings.athena_workgroups]
+
+    def get_client(self, database_key: str, workgroup: Optional[str] = None) -> AthenaClient:
+        """
+        Obtiene un cliente de tipo Athena para la base de datos solicitada.
+        Sin workgroup se usa el primero que atiende a la base de datos (health checks, consultas por ID, etc.)
+        """
+        if database_key not in self.available_databases:
+            raise ValueError(f"Base de datos '{database_key}' no configurada")
+
+        if workgroup is None:
+            workgroup = self._eligible_workgroups(database_key)[0].name
+
+        with self._lock:
+            key = (database_key, workgroup)
+            if key not in self._clients:
+                wg = next((w for w in self.workgroups if w.name == workgroup), None)
+                if wg is None:
+                    raise ValueError(f"Workgroup '{workgroup}' no configurado")
+
+                region = wg.region or settings.AWS_REGION
+                config = AthenaConnectionConfig(
+                    aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+                    region=region,
+                    database=self.available_databases[database_key],
+                    s3_output_location=wg.s3_output_location or settings.ATHENA_S3_OUTPUT_LOCATION,
+                    workgroup=wg.name,
+                    result_reuse_minutes=settings.ATHENA_RESULT_REUSE_MINUTES
+                )
+
+                self._clients[key] = AthenaClient(config, client=self._get_backend(region))
+
+            return self._clients[key]
+
+    def route(self, database_key: str, priority: str = "interactive") -> AthenaClient:
+        """
+        Elige el workgroup con menos consultas pendientes (ponderado por max_concurrency) entre los que atienden
+        a la base de datos y a la prioridad solicitada
+        """
+        candidates = self._eligible_workgroups(database_key, priority)
+        if len(candidates) == 1:
+            return self.get_client(database_key, candidates[0].name)
+
+        load = self.outstanding_by_workgroup()
+        chosen = min(
+            candidates,
+            key=lambda wg: load.get(wg.name, 0) / (wg.max_concurrency or 1)
+        )
+        return self.get_client(database_key, chosen.name)
+
+    def remember_execution(self, query_execution_id: str, client: AthenaClient) -> None:
+        """
+        Registra el cliente que inició una ejecución para consultarla o cancelarla después por su ID
+        """
+        with self._lock:
+            self._executions[query_execution_id] = client
+            self._executions.move_to_end(query_execution_id)
+            while len(self._executions) > MAX_TRACKED_EXECUTIONS:
+                self._executions.popitem(last=False)
+
+    def client_for_execution(self, database_key: str, query_execution_id: str) -> AthenaClient:
+        """
+        Cliente que inició la ejecución; si no se conoce (otro proceso, reinicio) se usa el cliente por defecto
+        """
+        with self._lock:
+            client = self._executions.get(query_execution_id)
+        return client or self.get_client(database_key)
+
+    def outstanding_by_workgroup(self) -> Dict[str, int]:
+        """Consultas en ejecución por workgroup, sumando todas las bases de datos"""
+        with self._lock:
+            clients = list(self._clients.items())
+        load: Dict[str, int] = {}
+        for (_, workgroup), client in clients:
+            load[workgroup] = load.get(workgroup, 0) + client.outstanding
+        return load
+
+    def describe_workgroups(self) -> List[Dict[str, Any]]:
+        """Configuración y carga actual de cada workgroup"""
+        load = self.outstanding_by_workgroup()
+        return [
+            {
+                **wg.model_dump(),
+                "region": wg.region or settings.AWS_REGION,
+                "outstanding": load.get(wg.name, 0),
+            }
+            for wg in self.workgroups
+        ]
+
+    def describe_circuit_breakers(self) -> Dict[str, Dict[str, Any]]:
+        """Estado del circuito y presupuesto de reintentos de cada base de datos usada"""
+        return describe_circuit_breakers()
+
+    def _eligible_workgroups(self, database_key: str, priority: Optional[str] = None) -> List[AthenaWorkgroupConfig]:
+        candidates = [
+            wg for wg in self.workgroups
+            if (wg.databases is None or database_key in wg.databases)
+            and (priority is None or wg.priorities is None or priority in wg.priorities)
+        ]
+        if not candidates:
+            raise ValueError(f"Ningún workgroup configurado atiende '{database_key}' con prioridad '{priority}'")
+        return candidates
+
+    def _get_backend(self, region: str):
+        """
+        Backend compartido por región; None deja que AthenaClient cree el cliente boto3 bajo demanda
+        """
+        if region not in self._backends:
+            self._backends[region] = self._create_backend()
+        return self._backends[region]
+
+    def _create_backend(self):
+        """
+        Crea el backend configurado; None deja que AthenaClient cree el cliente boto3 bajo demanda
+        """
+        if settings.ATHENA_BACKEND == "local":
+            from app.core.database.athena.local_engine import LocalAthenaEngine
+            return LocalAthenaEngine(
+                data_dir=settings.ATHENA_LOCAL_DATA_DIR,
+                queue_seconds=settings.ATHENA_LOCAL_QUEUE_SECONDS,
+                run_seconds=settings.ATHENA_LOCAL_RUN_SECONDS,
+                failure_rate=settings.ATHENA_LOCAL_FAILURE_RATE,
+                throttle_rate=settings.ATHENA_LOCAL_THROTTLE_RATE,
             )
-            
-            self._clients[database_key] = AthenaClient(config)
-        
-        return self._clients[database_key]
-    
+        if settings.ATHENA_BACKEND != "aws":
+            raise ValueError(f"ATHENA_BACKEND '{settings.ATHENA_BACKEND}' no soportado")
+        return None
+
     def get_available_databases(self) -> Dict[str, str]:
         """Retorna las bases de datos disponibles"""
         return self.available_databases
 
+    def list_in_flight(self) -> Dict[str, Dict[str, float]]:
+        """
+        Consultas en ejecución de todos los clientes creados, agrupadas por base de datos
+        """
+        with self._lock:
+            clients = list(self._clients.items())
+        results: Dict[str, Dict[str, float]] = {db_key: {} for db_key in self.available_databases}
+        for (database_key, _), client in clients:
+            results[database_key].update(client.list_in_flight())
+        return results
+
+    def cancel_all_in_flight(self) -> Dict[str, Any]:
+        """
+        Cancela las consultas en ejecución de todos los clientes creados
+        """
+        with self._lock:
+            clients = list(self._clients.items())
+        return {f"{db_key}/{workgroup}": client.cancel_in_flight() for (db_key, workgroup), client in clients}
+
+    def warm_up(self) -> Dict[str, str]:
+        """
+        Crea por adelantado los clientes de todas las bases y workgroups configurados (sesión boto3 incluida, sin llamadas de red)
+        """
+        results = {}
+        for database_key in self.available_databases:
+            for wg in self._eligible_workgroups(database_key):
+                try:
+                    self.get_client(database_key, wg.name).client
+                    results[f"{database_key}/{wg.name}"] = "ok"
+                except Exception as e:
+                    results[f"{database_key}/{wg.name}"] = f"error: {str(e)}"
+        return results
+
 # Instancia global de AthenaClientFactory
-athena_factory = AthenaClientFactory()
\ No newline at end of file
+athena_factory = AthenaClientFactory()
@@ -0,0 +1,87 @@
+import argparse
+import datetime as dt
+import random
+from pathlib import Path
+from typing import Optional
+
+from app.core.settings.environments import settings
+
+UDNS = ['MONTERREY', 'GUADALAJARA', 'QUERETARO', 'SALTILLO', 'TOLUCA']
+TIPOS_DE_VIAJE = ['N', 'N', 'N', 'E', 'VA']
+
+
+def generar_viajes_facturacion(
+    filas: int = 50_000,
+    dias: int = 70,
+    clientes: int = 200,
+    fecha_fin: Optional[dt.date] = None,
+    seed: int = 42,
+):
+    """
+    Genera un DataFrame sintético con las columnas de viajes_facturacion (schema_vf) para el motor local.
+    Una parte de los clientes deja de operar a mitad del periodo para que el reporte tenga cambios de estado.
+    """
+    import polars as pl
+    from app.domain.schemas.viajes_facturacion import schema_vf
+
+    rng = random.Random(seed)
+    fecha_fin = fecha_fin or dt.date.today()
+    fecha_ini = fecha_fin - dt.timedelta(days=dias - 1)
+
+    catalogo = [(rng.choice(UDNS), f"CLIENTE {i:04d}") for i in range(clientes)]
+    catalogo.append((UDNS[0], 'GRUPO VIAJES ESPECIALES - EVENTOS'))
+    # Cliente -> último día con operación (None si opera todo el periodo)
+    bajas = {i: rng.randint(dias // 2, dias - 1) if rng.random() < 0.1 else None for i in range(len(catalogo))}
+
+    columnas = {name: [] for name in schema_vf}
+    for i in range(filas):
+        idx = rng.randrange(len(catalogo))
+        dia = rng.randrange(bajas[idx] or dias)
+        udn, cliente = catalogo[idx]
+        inicio = dt.datetime.combine(fecha_ini + dt.timedelta(days=dia), dt.time(rng.randrange(24), rng.randrange(60)))
+        fin = inicio + dt.timedelta(minutes=rng.randint(20, 240))
+
+        fila = {
+            'id': i + 1,
+            'id_servicio': f"S{i + 1:08d}",
+            'business_unit': udn,
+            'des': f"RUTA {rng.randrange(50)}",
+            'tipo_de_viaje': rng.choice(TIPOS_DE_VIAJE),
+            'id_ruta': rng.randrange(1, 500),
+            'car': rng.randrange(1000, 9999),
+            'status': rng.choice([1, 1, 1, 2, 9]),
+            'shift': rng.choice(['MATUTINO', 'VESPERTINO', 'NOCTURNO']),
+            'group': cliente,
+            'start_date': inicio.strftime('%Y-%m-%d'),
+            'start_time': inicio.strftime('%H:%M:%S'),
+            'end_date': fin.strftime('%Y-%m-%d'),
+            'end_time': fin.strftime('%H:%M:%S'),
+            'km_cotizado': round(rng.uniform(5, 120), 2),
+            'worker_id': rng.randrange(1, 3000),
+            'aforo': rng.randrange(1, 45),
+            'start_datetime': inicio,
+            'end_datetime': fin,
+        }
+        for name in columnas:
+            columnas[name].append(fila.get(name))
+
+    return pl.DataFrame(columnas, schema=schema_vf)
+
+
+if __name__ == "__main__":
+    # Uso: python -m app.core.database.athena.local_data --filas 50000 --dias 70
+    parser = argparse.ArgumentParser(description="Genera datos sintéticos para el motor Athena local")
+    parser.add_argument("--database-key", default="bustrax")
+    parser.add_argument("--filas", type=int, default=50_000)
+    parser.add_argument("--dias", type=int, default=70)
+    parser.add_argument("--clientes", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    database = settings.athena_databases[args.database_key]
+    destino = Path(settings.ATHENA_LOCAL_DATA_DIR) / database
+    destino.mkdir(parents=True, exist_ok=True)
+
+    df = generar_viajes_facturacion(args.filas, args.dias, args.clientes, seed=args.seed)
+    df.write_parquet(destino / "viajes_facturacion.parquet")
+    print(f"{df.height} filas escritas en {destino / 'viajes_facturacion.parquet'}")
@@ -0,0 +1,387 @@
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from botocore.exceptions import ClientError
+
+from app.core.logger.config import LoggerConfig
+from app.utils.sql import bind_parameters
+
+# Nota: Path(__file__).stem == __name__.split('.')[-1]
+logger = LoggerConfig(file_name=Path(__file__).stem,debug=True,root_file=__name__).get_logger()
+
+# Athena devuelve como máximo 1000 filas por llamada a get_query_results
+MAX_RESULTS_PER_PAGE = 1000
+
+# Ejecuciones conservadas en memoria, las más antiguas se descartan
+MAX_EXECUTIONS = 1000
+
+# EXPLAIN con estimación de entrada (la única forma de EXPLAIN que simula el motor local)
+_EXPLAIN_IO = re.compile(r"^\s*EXPLAIN\s*\(\s*TYPE\s+IO\s*,\s*FORMAT\s+JSON\s*\)\s*(.+)$", re.IGNORECASE | re.DOTALL)
+
+
+def _client_error(code: str, message: str, operation: str) -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": message}}, operation)
+
+
+class LocalAthenaEngine:
+    """
+    Sustituto local del cliente boto3 de Athena para pruebas y benchmarks sin red.
+
+    Ejecuta el SQL con el motor SQL de Polars sobre archivos locales organizados como
+    `<data_dir>/<database>/<tabla>.parquet`, `<tabla>.csv` o `<tabla>/` (dataset Parquet particionado estilo hive).
+    Respeta el ciclo start_query_execution → get_query_execution → get_query_results, incluyendo la paginación
+    con NextToken, y simula la latencia de cola y de ejecución, fallos aleatorios y limitación (TooManyRequestsException).
+    DataScannedInBytes y `EXPLAIN (TYPE IO, FORMAT JSON)` usan el tamaño en disco de las tablas que lee la consulta.
+    """
+
+    def __init__(
+        self,
+        data_dir: str,
+        queue_seconds: float = 0.0,
+        run_seconds: float = 0.0,
+        failure_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+    ):
+        self.data_dir = Path(data_dir)
+        self.queue_seconds = queue_seconds
+        self.run_seconds = run_seconds
+        self.failure_rate = failure_rate
+        self.throttle_rate = throttle_rate
+        self._executions: Dict[str, Dict[str, Any]] = {}
+        self._prepared_statements: Dict[tuple, str] = {}
+        # ClientRequestToken -> query_execution_id, para que un reintento no inicie otra ejecución
+        self._request_tokens: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------ #
+    # API compatible con boto3.client('athena')
+    # ------------------------------------------------------------------ #
+    def list_databases(self, CatalogName: str = "AwsDataCatalog", MaxResults: int = 50, **kwargs) -> Dict[str, Any]:
+        databases = sorted(p.name for p in self.data_dir.iterdir() if p.is_dir()) if self.data_dir.exists() else []
+        return {"DatabaseList": [{"Name": name} for name in databases[:MaxResults]]}
+
+    def list_table_metadata(
+        self,
+        CatalogName: str = "AwsDataCatalog",
+        DatabaseName: str = "",
+        MaxResults: int = 50,
+        NextToken: Optional[str] = None,
+        **kwargs
+    ) -> Dict[str, Any]:
+        try:
+            tables = self._tables(DatabaseName)
+        except RuntimeError as e:
+            raise _client_error("MetadataException", str(e), "ListTableMetadata")
+        names = sorted(tables)
+        offset = int(NextToken or 0)
+        response = {"TableMetadataList": [self._table_metadata(name, tables[name]) for name in names[offset:offset + MaxResults]]}
+        if offset + MaxResults < len(names):
+            response["NextToken"] = str(offset + MaxResults)
+        return response
+
+    def get_table_metadata(self, CatalogName: str = "AwsDataCatalog", DatabaseName: str = "", TableName: str = "", **kwargs) -> Dict[str, Any]:
+        try:
+            tables = self._tables(DatabaseName)
+        except RuntimeError as e:
+            raise _client_error("MetadataException", str(e), "GetTableMetadata")
+        if TableName not in tables:
+            raise _client_error("MetadataException", f"Table {TableName} not found", "GetTableMetadata")
+        return {"TableMetadata": self._table_metadata(TableName, tables[TableName])}
+
+    def create_prepared_statement(self, StatementName: str, WorkGroup: str, QueryStatement: str, **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            if (WorkGroup, StatementName) in self._prepared_statements:
+                raise _client_error("InvalidRequestException", f"Prepared Statement {StatementName} already exists", "CreatePreparedStatement")
+            self._prepared_statements[(WorkGroup, StatementName)] = QueryStatement
+        return {}
+
+    def update_prepared_statement(self, StatementName: str, WorkGroup: str, QueryStatement: str, **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            if (WorkGroup, StatementName) not in self._prepared_statements:
+                raise _client_error("ResourceNotFoundException", f"Prepared Statement {StatementName} was not found", "UpdatePreparedStatement")
+            self._prepared_statements[(WorkGroup, StatementName)] = QueryStatement
+        return {}
+
+    def get_prepared_statement(self, StatementName: str, WorkGroup: str) -> Dict[str, Any]:
+        with self._lock:
+            statement = self._prepared_statements.get((WorkGroup, StatementName))
+        if statement is None:
+            raise _client_error("ResourceNotFoundException", f"Prepared Statement {StatementName} was not found", "GetPreparedStatement")
+        return {"PreparedStatement": {"StatementName": StatementName, "QueryStatement": statement, "WorkGroupName": WorkGroup}}
+
+    def start_query_execution(
+        self,
+        QueryString: str,
+        QueryExecutionContext: Optional[Dict[str, str]] = None,
+        ResultConfiguration: Optional[Dict[str, str]] = None,
+        WorkGroup: str = "primary",
+        ExecutionParameters: Optional[List[str]] = None,
+        ClientRequestToken: Optional[str] = None,
+        **kwargs
+    ) -> Dict[str, Any]:
+        self._maybe_throttle("StartQueryExecution")
+        if ClientRequestToken:
+            with self._lock:
+                existing = self._request_tokens.get(ClientRequestToken)
+            if existing is not None:
+                return {"QueryExecutionId": existing}
+        database = (QueryExecutionContext or {}).get("Database")
+        if not database:
+            raise _client_error("InvalidRequestException", "QueryExecutionContext.Database es requerido", "StartQueryExecution")
+
+        query = QueryString
+        words = QueryString.split()
+        if len(words) == 2 and words[0].upper() == "EXECUTE":
+            query = self.get_prepared_statement(words[1], WorkGroup)["PreparedStatement"]["QueryStatement"]
+        try:
+            query = bind_parameters(query, ExecutionParameters or [])
+        except ValueError as e:
+            raise _client_error("InvalidRequestException", str(e), "StartQueryExecution")
+
+        query_execution_id = str(uuid.uuid4())
+        with self._lock:
+            if len(self._executions) >= MAX_EXECUTIONS:
+                self._executions.pop(next(iter(self._executions)))
+            if len(self._request_tokens) >= MAX_EXECUTIONS:
+                self._request_tokens.pop(next(iter(self._request_tokens)))
+            if ClientRequestToken:
+                self._request_tokens[ClientRequestToken] = query_execution_id
+            self._executions[query_execution_id] = {
+                "query": query,
+                "database": database,
+                "submitted": time.time(),
+                "state": "QUEUED",
+                "reason": None,
+                "result": None,
+                "statistics": {},
+                "lock": threading.Lock(),
+            }
+        return {"QueryExecutionId": query_execution_id}
+
+    def get_query_execution(self, QueryExecutionId: str) -> Dict[str, Any]:
+        self._maybe_throttle("GetQueryExecution")
+        execution = self._get_execution(QueryExecutionId, "GetQueryExecution")
+        self._advance(execution)
+
+        status = {"State": execution["state"]}
+        if execution["reason"]:
+            status["StateChangeReason"] = execution["reason"]
+        if execution["state"] == "FAILED":
+            status["AthenaError"] = {"ErrorCategory": 2, "Retryable": False, "ErrorMessage": execution["reason"]}
+
+        return {
+            "QueryExecution": {
+                "QueryExecutionId": QueryExecutionId,
+                "Query": execution["query"],
+                "QueryExecutionContext": {"Database": execution["database"]},
+                "Status": status,
+                "Statistics": execution["statistics"],
+            }
+        }
+
+    def get_query_results(self, QueryExecutionId: str, NextToken: Optional[str] = None, MaxResults: int = MAX_RESULTS_PER_PAGE) -> Dict[str, Any]:
+        execution = self._get_execution(QueryExecutionId, "GetQueryResults")
+        self._advance(execution)
+
+        if execution["state"] != "SUCCEEDED":
+            raise _client_error(
+                "InvalidRequestException",
+                f"Query has not yet finished. Current state: {execution['state']}",
+                "GetQueryResults",
+            )
+
+        df = execution["result"]
+        offset = int(NextToken) if NextToken else 0
+        limit = min(MaxResults, MAX_RESULTS_PER_PAGE)
+
+        rows: List[Dict[str, Any]] = []
+        # Igual que Athena, la primera página incluye los nombres de columna como primera fila
+        if offset == 0:
+            rows.append({"Data": [{"VarCharValue": name} for name in df.columns]})
+            limit -= 1
+
+        page = df.slice(offset, limit)
+        for row in page.iter_rows():
+            rows.append({"Data": [{} if value is None else {"VarCharValue": value} for value in row]})
+
+        response = {
+            "ResultSet": {
+                "Rows": rows,
+                "ResultSetMetadata": {"ColumnInfo": execution["column_info"]},
+            }
+        }
+        next_offset = offset + page.height
+        if next_offset < df.height:
+            response["NextToken"] = str(next_offset)
+        return response
+
+    def stop_query_execution(self, QueryExecutionId: str) -> Dict[str, Any]:
+        execution = self._get_execution(QueryExecutionId, "StopQueryExecution")
+        with execution["lock"]:
+            if execution["state"] in ("QUEUED", "RUNNING"):
+                execution["state"] = "CANCELLED"
+                execution["reason"] = "Query was cancelled by user"
+        return {}
+
+    # ------------------------------------------------------------------ #
+    # Simulación
+    # ------------------------------------------------------------------ #
+    def _maybe_throttle(self, operation: str) -> None:
+        if self.throttle_rate and random.random() < self.throttle_rate:
+            raise _client_error("TooManyRequestsException", "Rate exceeded (simulado)", operation)
+
+    def _get_execution(self, query_execution_id: str, operation: str) -> Dict[str, Any]:
+        with self._lock:
+            execution = self._executions.get(query_execution_id)
+        if execution is None:
+            raise _client_error("InvalidRequestException", f"QueryExecution {query_execution_id} was not found", operation)
+        return execution
+
+    def _advance(self, execution: Dict[str, Any]) -> None:
+        """
+        Avanza el estado de la ejecución según el tiempo transcurrido; el SQL se ejecuta al terminar la latencia simulada
+        """
+        with execution["lock"]:
+            if execution["state"] in ("SUCCEEDED", "FAILED", "CANCELLED"):
+                return
+
+            elapsed = time.time() - execution["submitted"]
+            if elapsed < self.queue_seconds:
+                return
+            if elapsed < self.queue_seconds + self.run_seconds:
+                execution["state"] = "RUNNING"
+                return
+
+            self._run(execution)
+
+    def _run(self, execution: Dict[str, Any]) -> None:
+        import polars as pl
+
+        start = time.perf_counter()
+        try:
+            if self.failure_rate and random.random() < self.failure_rate:
+                raise RuntimeError("Simulated failure: HIVE_CURSOR_ERROR")
+
+            tables = self._tables(execution["database"])
+            explain = _EXPLAIN_IO.match(execution["query"])
+            if explain:
+                df = pl.DataFrame({"Query Plan": [json.dumps(self._explain_io(execution["database"], explain.group(1), tables))]})
+                scanned = 0
+            else:
+                df = pl.SQLContext(tables).execute(execution["query"], eager=True)
+                # Como Athena, se cobra lo que se lee de las tablas de entrada, no el tamaño del resultado
+                scanned = sum(self._input_bytes(execution["database"], execution["query"], tables).values())
+
+            execution["column_info"] = [
+                {"Name": name, "Label": name, "Type": self._athena_type(dtype)} for name, dtype in df.schema.items()
+            ]
+            # Athena entrega todos los valores como texto
+            execution["result"] = df.select(pl.all().cast(pl.String))
+            execution["state"] = "SUCCEEDED"
+        except Exception as e:
+            logger.warning(f"Consulta local fallida: {str(e)}")
+            scanned = 0
+            execution["state"] = "FAILED"
+            execution["reason"] = str(e)
+
+        engine_ms = int((time.perf_counter() - start) * 1000 + self.run_seconds * 1000)
+        queue_ms = int(self.queue_seconds * 1000)
+        execution["statistics"] = {
+            "EngineExecutionTimeInMillis": engine_ms,
+            "DataScannedInBytes": scanned,
+            "TotalExecutionTimeInMillis": engine_ms + queue_ms,
+            "QueryQueueTimeInMillis": queue_ms,
+        }
+
+    def _tables(self, database: str) -> Dict[str, Any]:
+        """
+        Registra como LazyFrames las tablas disponibles para la base de datos
+        """
+        import polars as pl
+
+        database_dir = self.data_dir / database
+        if not database_dir.exists():
+            raise RuntimeError(f"SCHEMA_NOT_FOUND: Schema '{database}' does not exist")
+
+        tables = {}
+        for path in database_dir.iterdir():
+            if path.is_dir():
+                tables[path.name] = pl.scan_parquet(path / "**" / "*.parquet", hive_partitioning=True)
+            elif path.suffix == ".parquet":
+                tables[path.stem] = pl.scan_parquet(path)
+            elif path.suffix == ".csv":
+                tables[path.stem] = pl.scan_csv(path)
+        return tables
+
+    def _input_bytes(self, database: str, query: str, tables: Dict[str, Any]) -> Dict[str, int]:
+        """
+        Bytes en disco de cada tabla que menciona la consulta; no simula la poda de particiones ni de columnas
+        """
+        database_dir = self.data_dir / database
+        sizes = {}
+        for name in tables:
+            if not re.search(rf"\b{re.escape(name)}\b", query):
+                continue
+            path = database_dir / name
+            if path.is_dir():
+                sizes[name] = sum(f.stat().st_size for f in path.rglob("*.parquet"))
+            else:
+                source = next((database_dir / f"{name}{suffix}" for suffix in (".parquet", ".csv") if (database_dir / f"{name}{suffix}").exists()), None)
+                sizes[name] = source.stat().st_size if source is not None else 0
+        return sizes
+
+    def _explain_io(self, database: str, query: str, tables: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Plan de entrada con la forma de `EXPLAIN (TYPE IO, FORMAT JSON)` de Athena: una estimación por tabla leída
+        """
+        import polars as pl
+
+        # Valida la consulta como lo haría Athena al planearla
+        pl.SQLContext(tables).execute(query, eager=False)
+
+        infos = []
+        for name, size in self._input_bytes(database, query, tables).items():
+            rows = tables[name].select(pl.len()).collect().item()
+            infos.append({
+                "table": {"catalog": "awsdatacatalog", "schemaTable": {"schema": database, "table": name}},
+                "columnConstraints": [],
+                "estimate": {"outputRowCount": float(rows), "outputSizeInBytes": float(size)},
+            })
+        return {
+            "inputTableColumnInfos": infos,
+            "estimate": {
+                "outputRowCount": sum(i["estimate"]["outputRowCount"] for i in infos),
+                "outputSizeInBytes": sum(i["estimate"]["outputSizeInBytes"] for i in infos),
+            },
+        }
+
+    def _table_metadata(self, name: str, lazy_frame) -> Dict[str, Any]:
+        schema = lazy_frame.collect_schema()
+        return {
+            "Name": name,
+            "TableType": "EXTERNAL_TABLE",
+            "Columns": [{"Name": column, "Type": self._athena_type(dtype)} for column, dtype in schema.items()],
+            "PartitionKeys": [],
+        }
+
+    @staticmethod
+    def _athena_type(dtype) -> str:
+        import polars as pl
+
+        if dtype.is_integer():
+            return "bigint"
+        if dtype.is_float():
+            return "double"
+        if dtype == pl.Boolean:
+            return "boolean"
+        if dtype == pl.Date:
+            return "date"
+        if dtype == pl.Datetime:
+            return "timestamp"
+        return "varchar"
@@ -1,6 +1,24 @@
-from typing import Dict, Any, List
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, Iterator, List, Optional, Union
 from app.core.database.athena.athena_factory import athena_factory
+from app.core.database.athena.scan_budget import SCAN_BUDGET_CODE, format_bytes, scan_budget
+from app.core.database.result_store import result_store
+from app.core.database.shared_cache import shared_cache
+from app.core.logger.config import LoggerConfig
 from app.core.models.athena_models import QueryRequest
+from app.core.models.query_result import QueryResult
+from app.core.settings.environments import settings
+from app.utils.file_lock import FileLock
+from app.utils.sql import query_fingerprint
+from app.utils.tracing import traced
+
+# Nota: Path(__file__).stem == __name__.split('.')[-1]
+logger = LoggerConfig(file_name=Path(__file__).stem,debug=True,root_file=__name__).get_logger()
+
+# Espacio de la caché compartida con la última ejecución exitosa de cada huella de consulta
+EJECUCIONES = "athena_executions"
 
 class AthenaRepository:
     def __init__(self):
@@ -32,12 +50,83 @@ class AthenaRepository:
         
         return results
     
-    def execute_query(self, query_request: QueryRequest) -> Dict[str, Any]:
+    @traced()
+    def execute_query(
+        self,
+        query_request: QueryRequest,
+        scan: Optional[Dict[str, Any]] = None,
+        prepared_statement: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Ejecutar consulta en una base de datos configurada desde settings, en el workgroup menos cargado para su prioridad.
+        `scan` es la estimación del pre-flight; sin ella se estima solo con el historial.
+        `prepared_statement` solo lo indican los servicios internos: la API no puede elegir el statement que se registra.
+        """
+        estimate = scan or self._estimate(query_request)
+        client = self.factory.route(query_request.database_key, query_request.priority)
+        result = client.execute_query(
+            query_request.query,
+            query_request.parameters,
+            prepared_statement
+        )
+        if result["status"] == "success":
+            self.factory.remember_execution(result["query_execution_id"], client)
+            scan_budget.track(result["query_execution_id"], estimate)
+            result["scan"] = scan_budget.report(estimate)
+        return result
+
+    def preflight(
+        self,
+        query_request: QueryRequest,
+        cancel_event: Optional[threading.Event] = None,
+        explain: bool = False
+    ) -> Dict[str, Any]:
         """
-        Ejecutar consulta en una base de datos configurada desde settings
+        Estima el escaneo de una consulta antes de ejecutarla y aplica el presupuesto de su base de datos:
+        por encima del presupuesto se rechaza (error ScanBudgetExceeded) o, con QUERY_SCAN_OVER_BUDGET=batch,
+        se devuelve priority="batch" para que no ocupe los workgroups interactivos.
+        Sin historial de la huella se usa EXPLAIN cuando la base tiene presupuesto o si se pide explain=True.
         """
-        client = self.factory.get_client(query_request.database_key)
-        return client.execute_query(query_request.query)
+        database = self.factory.get_available_databases().get(query_request.database_key)
+        if database is None:
+            return {"status": "error", "message": f"Base de datos '{query_request.database_key}' no configurada"}
+
+        run_explain = None
+        if explain or (settings.QUERY_SCAN_EXPLAIN and scan_budget.budget_bytes(query_request.database_key) is not None):
+            client = self.factory.route(query_request.database_key, query_request.priority)
+
+            def run_explain() -> Dict[str, Any]:
+                result = client.explain_io(query_request.query, query_request.parameters, timeout=min(query_request.timeout or 60, 60))
+                if cancel_event is not None and cancel_event.is_set():
+                    return {"status": "error", "message": "Query cancelled: la petición fue abandonada"}
+                return result
+
+        estimate = scan_budget.estimate(
+            query_request.database_key,
+            database,
+            query_request.query,
+            query_request.parameters,
+            explain=run_explain
+        )
+        result = {"status": "success", "priority": query_request.priority, "scan_estimate": estimate}
+        if not estimate["over_budget"]:
+            return result
+
+        detalle = (
+            f"la consulta escanearía ~{format_bytes(estimate['estimated_bytes'])} ({estimate['estimate_source']}) "
+            f"y el presupuesto de '{query_request.database_key}' es {format_bytes(estimate['budget_bytes'])}"
+        )
+        if settings.QUERY_SCAN_OVER_BUDGET == "batch":
+            logger.warning(f"Consulta {estimate['query_fingerprint']} enviada con prioridad batch: {detalle}")
+            return {**result, "priority": "batch"}
+
+        logger.warning(f"Consulta {estimate['query_fingerprint']} rechazada: {detalle}")
+        return {
+            "status": "error",
+            "message": f"Presupuesto de escaneo excedido: {detalle}",
+            "error_code": SCAN_BUDGET_CODE,
+            "scan_estimate": estimate
+        }
     
     def list_available_databases(self) -> Dict[str, str]:
         """
@@ -46,28 +135,274 @@ class AthenaRepository:
         return self.factory.get_available_databases()
     
 
-    def get_query_results(self, database_key: str, query_execution_id: str) -> Dict[str, Any]:
+    @traced()
+    def get_query_results(self, database_key: str, query_execution_id: str) -> Union[QueryResult, Dict[str, Any]]:
         """
-        Obtiene resultados de una consulta por su ID
+        Obtiene resultados de una consulta por su ID; si ya están en el almacén local no se consulta a Athena
         """
-        client = self.factory.get_client(database_key)
-        return client.get_query_results(query_execution_id)
+        stored = self._load_stored(query_execution_id)
+        if stored is not None:
+            result = result_store.to_result(query_execution_id, stored)
+            result["scan"] = scan_budget.report(None, source=result["source"])
+            return result
+
+        client = self.factory.client_for_execution(database_key, query_execution_id)
+        result = client.get_query_results(query_execution_id)
+        if result["status"] == "success":
+            result["statistics"] = client.get_query_statistics(query_execution_id)
+            estimate = scan_budget.complete(query_execution_id, result["statistics"])
+            result["scan"] = scan_budget.report(estimate, result["statistics"])
+        self._store(result, database_key)
+        return result
 
-    def execute_and_wait_query(self, query_request: QueryRequest) -> Dict[str, Any]:
+    def iter_query_results(
+        self,
+        database_key: str,
+        query_execution_id: str,
+        next_token: Optional[str] = None,
+        source: Optional[str] = None
+    ) -> Iterator[Dict[str, Any]]:
         """
-        Ejecuta consulta SQL y espera por los resultados, por defecto tiene un timeout de 300, dado por la configuración de athena
+        Recorre los resultados de una consulta página por página (desde el almacén local si ya están guardados),
+        opcionalmente continuando desde el next_token de una página anterior.
+
+        Los next_token del almacén (fila donde empieza la página) y los de Athena (opacos) no son intercambiables:
+        quien continúa un recorrido indica con `source` ("store" o "athena", ver results_source) de dónde salió
+        su token. Con source="store" y el resultado ya expulsado del almacén se lanza LookupError.
         """
-        client = self.factory.get_client(query_request.database_key)
-        
+        if source != "athena":
+            stored = self._load_stored(query_execution_id)
+            if stored is not None:
+                return result_store.iter_pages(query_execution_id, stored, next_token)
+            if source == "store":
+                raise LookupError(f"El resultado de {query_execution_id} ya no está en el almacén local")
+
+        client = self.factory.client_for_execution(database_key, query_execution_id)
+        return client.iter_query_results(query_execution_id, next_token)
+
+    def results_source(self, query_execution_id: str) -> str:
+        """
+        De dónde leería hoy iter_query_results los resultados sin `source`: "store" o "athena"
+        """
+        return "store" if self._load_stored(query_execution_id) is not None else "athena"
+
+    def _load_stored(self, query_execution_id: str):
+        if not settings.RESULT_STORE_ENABLED:
+            return None
+        return result_store.load(query_execution_id)
+
+    def _store(self, result: Union[QueryResult, Dict[str, Any]], database_key: str, fingerprint: Optional[str] = None) -> None:
+        """
+        Guarda un resultado completo en el almacén local para lecturas posteriores (en este u otro proceso)
+        """
+        if not settings.RESULT_STORE_ENABLED or not isinstance(result, QueryResult) or result.source != "athena":
+            return
+        result_store.save(
+            result.query_execution_id,
+            result.frame,
+            result.column_types,
+            fingerprint=fingerprint,
+            database=database_key
+        )
+
+    @traced()
+    def cancel_query(self, database_key: str, query_execution_id: str) -> Dict[str, Any]:
+        """
+        Cancela una consulta por su ID
+        """
+        client = self.factory.client_for_execution(database_key, query_execution_id)
+        return client.stop_query(query_execution_id)
+
+    def list_in_flight(self) -> Dict[str, Dict[str, float]]:
+        """
+        Consultas en ejecución iniciadas por este proceso, agrupadas por base de datos
+        """
+        return self.factory.list_in_flight()
+
+    def describe_workgroups(self) -> List[Dict[str, Any]]:
+        """
+        Workgroups configurados con su región y consultas pendientes
+        """
+        return self.factory.describe_workgroups()
+
+    def describe_circuit_breakers(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Estado de los circuitos de Athena por base de datos
+        """
+        return self.factory.describe_circuit_breakers()
+
+    @traced()
+    def execute_and_wait_query(
+        self,
+        query_request: QueryRequest,
+        cancel_event: Optional[threading.Event] = None,
+        fetch_results: bool = True,
+        scan: Optional[Dict[str, Any]] = None,
+        prepared_statement: Optional[str] = None
+    ) -> Union[QueryResult, Dict[str, Any]]:
+        """
+        Ejecuta consulta SQL y espera por los resultados, por defecto tiene un timeout de 300, dado por la configuración de athena.
+        Con fetch_results=False solo espera a que termine; los resultados se leen después con iter_query_results.
+
+        Con SHARED_SINGLE_FLIGHT una consulta idéntica (misma huella) se ejecuta una sola vez aunque llegue a la vez
+        a varios workers o hilos: el primero toma el candado de la huella y la ejecuta; los demás esperan el candado
+        y usan la ejecución que terminó mientras esperaban en lugar de volver a escanear los datos en Athena.
+
+        El resultado lleva "scan" con los bytes estimados (`scan` del pre-flight, o el historial) y los escaneados.
+        """
+        estimate = scan or self._estimate(query_request)
+        result = self._single_flight(query_request, cancel_event, fetch_results, estimate, prepared_statement)
+        if result["status"] == "success":
+            result["scan"] = scan_budget.report(estimate, result.get("statistics"), result.get("source"))
+        return result
+
+    def _single_flight(
+        self,
+        query_request: QueryRequest,
+        cancel_event: Optional[threading.Event],
+        fetch_results: bool,
+        estimate: Dict[str, Any],
+        prepared_statement: Optional[str] = None
+    ) -> Union[QueryResult, Dict[str, Any]]:
+        # Reutiliza un resultado reciente de la misma consulta (misma huella) si está habilitado
+        reused = self._reuse_by_fingerprint(query_request, fetch_results)
+        if reused is not None:
+            return reused
+
+        if not settings.SHARED_SINGLE_FLIGHT:
+            return self._execute_and_wait(query_request, cancel_event, fetch_results, estimate, prepared_statement)
+
+        fingerprint = self._fingerprint(query_request)
+        lock = FileLock(f"query-{fingerprint}")
+        waiting_since = time.time()
+        if not lock.acquire(timeout=query_request.timeout or 300, cancel_event=cancel_event):
+            if cancel_event is not None and cancel_event.is_set():
+                return {
+                    "status": "error",
+                    "message": "Query cancelled: la petición fue abandonada mientras esperaba una ejecución idéntica"
+                }
+            # La otra ejecución no terminó a tiempo: se ejecuta sin coordinar
+            logger.warning(f"Tiempo agotado esperando una ejecución idéntica ({fingerprint}), se ejecuta de nuevo")
+            return self._execute_and_wait(query_request, cancel_event, fetch_results, estimate, prepared_statement)
+
+        try:
+            joined = self._join_execution(query_request, fingerprint, waiting_since, cancel_event, fetch_results)
+            if joined is not None:
+                return joined
+            result = self._execute_and_wait(query_request, cancel_event, fetch_results, estimate, prepared_statement)
+            if result["status"] == "success":
+                client = self.factory.client_for_execution(query_request.database_key, result["query_execution_id"])
+                shared_cache.put(EJECUCIONES, fingerprint, {
+                    "query_execution_id": result["query_execution_id"],
+                    "database_key": query_request.database_key,
+                    "workgroup": client.config.workgroup,
+                })
+            return result
+        finally:
+            lock.release()
+
+    def _execute_and_wait(
+        self,
+        query_request: QueryRequest,
+        cancel_event: Optional[threading.Event],
+        fetch_results: bool,
+        estimate: Dict[str, Any],
+        prepared_statement: Optional[str] = None
+    ) -> Union[QueryResult, Dict[str, Any]]:
         # Ejecuta la consulta
-        execution_result = client.execute_query(query_request.query)
+        execution_result = self.execute_query(query_request, estimate, prepared_statement)
         
         if execution_result["status"] == "error":
             return execution_result
         
         # Recupera la query_execution_id y manda una consulta al servidor para obtener los resultados de la misma
         query_execution_id = execution_result["query_execution_id"]
-        return client.wait_for_query_completion(
+        client = self.factory.client_for_execution(query_request.database_key, query_execution_id)
+        result = client.wait_for_query_completion(
             query_execution_id, 
-            timeout=query_request.timeout or 300
-        )
\ No newline at end of file
+            timeout=query_request.timeout or 300,
+            cancel_event=cancel_event,
+            fetch_results=fetch_results
+        )
+        # Con el escaneo real la siguiente estimación de esta huella ya sale del historial
+        scan_budget.complete(query_execution_id, result.get("statistics"))
+        result["query_fingerprint"] = execution_result["query_fingerprint"]
+        self._store(result, query_request.database_key, execution_result["query_fingerprint"])
+        return result
+
+    def _join_execution(
+        self,
+        query_request: QueryRequest,
+        fingerprint: str,
+        waiting_since: float,
+        cancel_event: Optional[threading.Event],
+        fetch_results: bool
+    ) -> Optional[Union[QueryResult, Dict[str, Any]]]:
+        """
+        Ejecución idéntica que terminó (en este u otro proceso) mientras se esperaba el candado de la huella.
+        Se obtiene con el mismo flujo que una ejecución propia, que ya está en SUCCEEDED; si no se puede leer
+        (p. ej. el backend local de otro proceso) devuelve None y la consulta se ejecuta normalmente.
+        """
+        entry = shared_cache.get(EJECUCIONES, fingerprint, max_age_seconds=time.time() - waiting_since)
+        if entry is None:
+            return None
+        meta, _ = entry
+        query_execution_id = meta["query_execution_id"]
+
+        # Los resultados completos los pudo haber guardado ya quien ejecutó la consulta
+        if fetch_results:
+            stored = self._load_stored(query_execution_id)
+            if stored is not None:
+                result = result_store.to_result(query_execution_id, stored)
+                result["query_fingerprint"] = fingerprint
+                return result
+
+        client = self.factory.client_for_execution(query_request.database_key, query_execution_id)
+        if meta.get("workgroup") and meta["workgroup"] != client.config.workgroup:
+            client = self.factory.get_client(query_request.database_key, meta["workgroup"])
+        result = client.wait_for_query_completion(
+            query_execution_id,
+            timeout=query_request.timeout or 300,
+            cancel_event=cancel_event,
+            fetch_results=fetch_results
+        )
+        if result["status"] == "error":
+            logger.warning(f"No se pudo usar la ejecución {query_execution_id} de otra petición: {result.get('message')}")
+            return None
+
+        logger.info(f"Consulta resuelta con la ejecución idéntica {query_execution_id} (single-flight)")
+        self.factory.remember_execution(query_execution_id, client)
+        result["query_fingerprint"] = fingerprint
+        self._store(result, query_request.database_key, fingerprint)
+        return result
+
+    def _estimate(self, query_request: QueryRequest) -> Dict[str, Any]:
+        """
+        Estimación de escaneo solo con el historial (sin EXPLAIN), para las consultas que no pasan por el pre-flight
+        """
+        database = self.factory.get_available_databases().get(query_request.database_key, "")
+        return scan_budget.estimate(query_request.database_key, database, query_request.query, query_request.parameters)
+
+    def _fingerprint(self, query_request: QueryRequest) -> str:
+        database = self.factory.get_available_databases().get(query_request.database_key, "")
+        return query_fingerprint(query_request.query, query_request.parameters, database)
+
+    def _reuse_by_fingerprint(self, query_request: QueryRequest, fetch_results: bool) -> Optional[Union[QueryResult, Dict[str, Any]]]:
+        if not settings.RESULT_STORE_ENABLED or settings.RESULT_STORE_REUSE_SECONDS <= 0:
+            return None
+
+        fingerprint = self._fingerprint(query_request)
+        query_execution_id = result_store.find_by_fingerprint(fingerprint, settings.RESULT_STORE_REUSE_SECONDS)
+        if query_execution_id is None:
+            return None
+
+        if fetch_results:
+            stored = result_store.load(query_execution_id)
+            if stored is None:
+                return None
+            result = result_store.to_result(query_execution_id, stored)
+        else:
+            # Los resultados se leerán con iter_query_results, que los sirve desde el almacén
+            result = {"status": "success", "query_execution_id": query_execution_id, "query_state": "SUCCEEDED", "source": "result_store"}
+        result["query_fingerprint"] = fingerprint
+        return result
\ No newline at end of file
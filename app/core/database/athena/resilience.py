@@ -0,0 +1,264 @@
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, HTTPClientError
+
+from app.core.logger.config import LoggerConfig
+from app.core.settings.environments import settings
+
+# Nota: Path(__file__).stem == __name__.split('.')[-1]
+logger = LoggerConfig(file_name=Path(__file__).stem,debug=True,root_file=__name__).get_logger()
+
+# Clasificación de errores de Athena
+THROTTLE = "throttle"
+TRANSIENT = "transient"
+FATAL = "fatal"
+
+THROTTLE_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+    "SlowDown",
+    "ProvisionedThroughputExceededException",
+}
+TRANSIENT_CODES = {
+    "InternalServerException",
+    "InternalFailure",
+    "ServiceUnavailable",
+    "ServiceUnavailableException",
+    "RequestTimeout",
+    "RequestTimeoutException",
+}
+
+# Código del error que se devuelve cuando el circuito está abierto
+CIRCUIT_OPEN_CODE = "CircuitOpenException"
+
+
+def classify_error(error: Exception) -> str:
+    """
+    Clasifica un error de boto3: THROTTLE (cuota/limitación), TRANSIENT (falla temporal o de red) o FATAL (no se reintenta)
+    """
+    if isinstance(error, ClientError):
+        code = error.response.get("Error", {}).get("Code", "")
+        if code in THROTTLE_CODES:
+            return THROTTLE
+        if code in TRANSIENT_CODES:
+            return TRANSIENT
+        return FATAL
+    if isinstance(error, (BotoConnectionError, HTTPClientError)):
+        return TRANSIENT
+    return FATAL
+
+
+def classify_error_result(result: Dict[str, Any]) -> str:
+    """
+    Clasifica un error devuelto como dict por el cliente o el repositorio. Un código de AWS se clasifica como en
+    classify_error (el circuito abierto y el presupuesto de escaneo son FATAL), una consulta FAILED según el
+    Retryable de Athena, y el resto (p. ej. el timeout de la espera) es TRANSIENT.
+    """
+    code = result.get("error_code")
+    if code in THROTTLE_CODES:
+        return THROTTLE
+    if code in TRANSIENT_CODES:
+        return TRANSIENT
+    if code:
+        return FATAL
+    if result.get("query_state") == "FAILED":
+        return TRANSIENT if result.get("retryable") else FATAL
+    return TRANSIENT
+
+
+class RetryBudget:
+    """
+    Presupuesto de reintentos (token bucket): cada llamada exitosa aporta `ratio` fichas y cada reintento cuesta una.
+    Limita los reintentos a una fracción del tráfico exitoso para que una ráfaga de errores no se multiplique.
+    """
+
+    def __init__(self, ratio: float, max_tokens: float):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    @property
+    def tokens(self) -> float:
+        return self._tokens
+
+
+class CircuitBreaker:
+    """
+    Circuito por base de datos: closed → open tras `failure_threshold` fallas consecutivas (limitación o transitorias),
+    open rechaza de inmediato durante `reset_seconds`, y half_open deja pasar hasta `half_open_probes` llamadas de prueba;
+    si una tiene éxito el circuito se cierra y si falla vuelve a abrirse.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float, half_open_probes: int):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.half_open_probes = half_open_probes
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.time() - self._opened_at >= self.reset_seconds:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Indica si se puede hacer una llamada; en half_open reserva uno de los lugares de prueba"""
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.time() - self._opened_at < self.reset_seconds:
+                    return False
+                self._state = self.HALF_OPEN
+                self._probes = 0
+            if self._state == self.HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    return False
+                self._probes += 1
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                logger.info(f"Circuito {self.name} cerrado")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probes = 0
+
+    def release_probe(self) -> None:
+        """Devuelve un lugar de prueba de half_open sin cambiar el estado (la llamada no dice nada de la salud de Athena)"""
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f"Circuito {self.name} abierto tras {self._failures} fallas")
+                self._state = self.OPEN
+                self._opened_at = time.time()
+                self._probes = 0
+
+    def describe(self) -> Dict[str, Any]:
+        state = self.state
+        with self._lock:
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "retry_in_seconds": round(max(0.0, self.reset_seconds - (time.time() - self._opened_at)), 1)
+                if state == self.OPEN else 0,
+            }
+
+
+class RetryPolicy:
+    """
+    Reintentos con backoff exponencial y jitter completo (espera aleatoria entre 0 y base × 2^intento, con tope),
+    limitados por un RetryBudget y protegidos por un CircuitBreaker. Solo se reintentan errores THROTTLE y TRANSIENT.
+    """
+
+    def __init__(self, breaker: CircuitBreaker, budget: RetryBudget):
+        self.breaker = breaker
+        self.budget = budget
+        self.max_attempts = settings.ATHENA_RETRY_MAX_ATTEMPTS
+        self.base_seconds = settings.ATHENA_RETRY_BASE_SECONDS
+        self.max_seconds = settings.ATHENA_RETRY_MAX_SECONDS
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_seconds, self.base_seconds * (2 ** attempt)))
+
+    def call(self, operation: str, func: Callable[..., Any], guarded: bool = True, **params) -> Any:
+        """
+        Ejecuta func(**params) con reintentos. Con guarded=True la llamada se rechaza con un ClientError
+        CircuitOpenException mientras el circuito esté abierto (admisión de trabajo nuevo); las demás llamadas
+        (estado, resultados, cancelación) siempre pasan y no cambian el circuito: solo una llamada guarded admitida
+        lo abre o lo cierra, así un sondeo de una consulta en curso no salta reset_seconds ni el límite de pruebas.
+        """
+        attempt = 0
+        while True:
+            if guarded and not self.breaker.allow():
+                raise ClientError(
+                    {"Error": {"Code": CIRCUIT_OPEN_CODE, "Message": f"Athena degradado para {self.breaker.name}, reintente más tarde"}},
+                    operation
+                )
+            try:
+                result = func(**params)
+            except Exception as e:
+                kind = classify_error(e)
+                if kind == FATAL:
+                    # Un error de la consulta (SQL inválido, etc.) no indica si Athena está degradado o no
+                    if guarded:
+                        self.breaker.release_probe()
+                    raise
+                if guarded:
+                    self.breaker.record_failure()
+                attempt += 1
+                if attempt >= self.max_attempts or not self.budget.withdraw():
+                    logger.warning(f"{operation} sin más reintentos ({kind}, intento {attempt}): {str(e)}")
+                    raise
+                delay = self.backoff(attempt)
+                logger.warning(f"{operation} con error {kind}, reintento {attempt} en {delay:.2f}s")
+                time.sleep(delay)
+                continue
+
+            if guarded:
+                self.breaker.record_success()
+            self.budget.deposit()
+            return result
+
+
+_policies: Dict[str, RetryPolicy] = {}
+_policies_lock = threading.Lock()
+
+
+def get_retry_policy(database: str) -> RetryPolicy:
+    """
+    Política compartida por todos los clientes (workgroups/regiones) de una misma base de datos
+    """
+    with _policies_lock:
+        policy = _policies.get(database)
+        if policy is None:
+            breaker = CircuitBreaker(
+                database,
+                failure_threshold=settings.ATHENA_BREAKER_FAILURE_THRESHOLD,
+                reset_seconds=settings.ATHENA_BREAKER_RESET_SECONDS,
+                half_open_probes=settings.ATHENA_BREAKER_HALF_OPEN_PROBES
+            )
+            budget = RetryBudget(settings.ATHENA_RETRY_BUDGET_RATIO, settings.ATHENA_RETRY_BUDGET_MAX)
+            policy = _policies[database] = RetryPolicy(breaker, budget)
+        return policy
+
+
+def describe_circuit_breakers() -> Dict[str, Dict[str, Any]]:
+    with _policies_lock:
+        policies = dict(_policies)
+    return {
+        database: {**policy.breaker.describe(), "retry_budget": round(policy.budget.tokens, 2)}
+        for database, policy in policies.items()
+    }
@@ -0,0 +1,258 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from app.core.logger.config import LoggerConfig
+from app.core.settings.environments import settings
+from app.utils.file_lock import FileLock
+from app.utils.sql import query_fingerprint
+
+# Nota: Path(__file__).stem == __name__.split('.')[-1]
+logger = LoggerConfig(file_name=Path(__file__).stem,debug=True,root_file=__name__).get_logger()
+
+# Código del error que se devuelve cuando una consulta excede el presupuesto de escaneo
+SCAN_BUDGET_CODE = "ScanBudgetExceeded"
+
+# Huellas conservadas por base de datos, las actualizadas hace más tiempo se descartan
+MAX_FINGERPRINTS = 5000
+
+# Vigencia de una estimación de EXPLAIN guardada (las tablas crecen)
+EXPLAIN_TTL_SECONDS = 3600
+
+# Ejecuciones iniciadas sin esperar (/athena/query) cuyo escaneo real se registra al leer sus resultados
+MAX_TRACKED_EXECUTIONS = 1000
+
+
+def format_bytes(value: Optional[float]) -> str:
+    if value is None:
+        return "desconocido"
+    for unit in ("B", "KB", "MB", "GB"):
+        if value < 1024:
+            return f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} TB"
+
+
+def explain_bytes(plan: Dict[str, Any]) -> Optional[int]:
+    """
+    Bytes de entrada estimados en un plan de `EXPLAIN (TYPE IO, FORMAT JSON)`: la suma de outputSizeInBytes de las
+    tablas leídas. None si alguna tabla no tiene estimación (Athena reporta NaN cuando la tabla no tiene estadísticas).
+    """
+    infos = plan.get("inputTableColumnInfos") or []
+    if not infos:
+        return None
+    total = 0.0
+    for info in infos:
+        try:
+            size = float(info.get("estimate", {}).get("outputSizeInBytes"))
+        except (TypeError, ValueError):
+            return None
+        if not math.isfinite(size):
+            return None
+        total += size
+    return int(total)
+
+
+class ScanBudget:
+    """
+    Pre-flight de costo de las consultas: estima los bytes que escaneará una consulta antes de enviarla a Athena
+    y la compara con el presupuesto de su base de datos (QUERY_SCAN_BUDGETS / QUERY_SCAN_BUDGET_MB).
+
+    La estimación sale de:
+        1. history: el mayor DataScannedInBytes de las últimas ejecuciones con la misma huella (SQL y parámetros)
+        2. si no hay, el mayor entre explain (`EXPLAIN (TYPE IO, FORMAT JSON)`, que Athena resuelve sin leer datos)
+           y template_history (lo mismo que history para la plantilla: mismo SQL con cualquier parámetro).
+           La plantilla sola no basta: una ejecución barata con un rango angosto ocultaría una consulta con un
+           rango amplio, por eso solo se usa sin EXPLAIN cuando está deshabilitado o falla.
+
+    El historial vive en `<DATA_DIR>/scan_history/<ambiente>/<database_key>.json`, compartido por los workers;
+    todas las consultas (también las de los reportes) lo alimentan al terminar.
+    """
+
+    def __init__(self, base_dir: Optional[Path] = None):
+        self.base_dir = base_dir or Path(settings.DATA_DIR) / "scan_history" / settings.ENVIRONMENT
+        self._lock = threading.Lock()
+        self._cache: Dict[Path, Any] = {}
+        self._tracked: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def budget_bytes(self, database_key: str) -> Optional[int]:
+        """
+        Bytes por consulta permitidos para la base de datos; None si no tiene límite
+        """
+        megabytes = settings.query_scan_budgets.get(database_key, settings.QUERY_SCAN_BUDGET_MB)
+        return int(megabytes * 1024 * 1024) if megabytes and megabytes > 0 else None
+
+    def estimate(
+        self,
+        database_key: str,
+        database: str,
+        query: str,
+        parameters: Optional[list] = None,
+        explain: Optional[Callable[[], Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Estimación de escaneo de una consulta. `explain` (que ejecuta el EXPLAIN en Athena) solo se llama si
+        no hay historial de la huella ni una estimación de EXPLAIN vigente.
+        """
+        fingerprint = query_fingerprint(query, parameters, database)
+        estimate = {
+            "database_key": database_key,
+            "query_fingerprint": fingerprint,
+            "template_fingerprint": query_fingerprint(query, None, database),
+            "estimated_bytes": None,
+            "estimate_source": None,
+            "samples": 0,
+            "budget_bytes": self.budget_bytes(database_key),
+        }
+
+        history = self._read(database_key)
+        scanned = history.get(fingerprint, {}).get("scanned") or []
+        if scanned:
+            estimate.update(estimated_bytes=max(scanned), estimate_source="history", samples=len(scanned))
+            return self._with_verdict(estimate)
+
+        explained_bytes = None
+        explained = history.get(fingerprint, {}).get("explained")
+        if explained and time.time() - explained["at"] <= EXPLAIN_TTL_SECONDS:
+            explained_bytes = explained["bytes"]
+        elif explain is not None:
+            result = explain()
+            if result["status"] == "success":
+                estimate["io_plan"] = result["plan"]
+                explained_bytes = explain_bytes(result["plan"])
+                if explained_bytes is not None:
+                    self._update(database_key, {fingerprint: {"explained": {"bytes": explained_bytes, "at": time.time()}}})
+            else:
+                logger.warning(f"No se pudo estimar la consulta {fingerprint} con EXPLAIN: {result.get('message')}")
+                estimate["explain_error"] = result.get("message")
+        if explained_bytes is not None:
+            estimate.update(estimated_bytes=explained_bytes, estimate_source="explain")
+
+        template_scanned = history.get(estimate["template_fingerprint"], {}).get("scanned") or []
+        if template_scanned and (explained_bytes is None or max(template_scanned) > explained_bytes):
+            estimate.update(estimated_bytes=max(template_scanned), estimate_source="template_history", samples=len(template_scanned))
+        return self._with_verdict(estimate)
+
+    @staticmethod
+    def _with_verdict(estimate: Dict[str, Any]) -> Dict[str, Any]:
+        budget, estimated = estimate["budget_bytes"], estimate["estimated_bytes"]
+        estimate["over_budget"] = budget is not None and estimated is not None and estimated > budget
+        return estimate
+
+    def track(self, query_execution_id: str, estimate: Dict[str, Any]) -> None:
+        """
+        Recuerda la estimación de una ejecución para registrar su escaneo real cuando se conozca (complete)
+        """
+        with self._lock:
+            self._tracked[query_execution_id] = estimate
+            while len(self._tracked) > MAX_TRACKED_EXECUTIONS:
+                self._tracked.popitem(last=False)
+
+    def complete(self, query_execution_id: str, statistics: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        Registra en el historial el escaneo real de una ejecución iniciada por este proceso y devuelve su estimación
+        """
+        with self._lock:
+            estimate = self._tracked.pop(query_execution_id, None)
+        if estimate is not None:
+            self.record(estimate, statistics)
+        return estimate
+
+    def record(self, estimate: Dict[str, Any], statistics: Optional[Dict[str, Any]]) -> None:
+        """
+        Agrega el DataScannedInBytes de una ejecución al historial de su huella y de su plantilla
+        """
+        scanned = (statistics or {}).get("DataScannedInBytes")
+        if scanned is None:
+            return
+        keep = settings.QUERY_SCAN_HISTORY_KEEP
+        self._update(estimate["database_key"], {
+            key: {"scanned": [int(scanned)], "keep": keep}
+            for key in (estimate["query_fingerprint"], estimate["template_fingerprint"])
+        })
+
+    @staticmethod
+    def report(
+        estimate: Optional[Dict[str, Any]],
+        statistics: Optional[Dict[str, Any]] = None,
+        source: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Escaneo estimado y real que acompaña a cada resultado. Un resultado servido desde el almacén local no escaneó nada.
+        """
+        scanned = (statistics or {}).get("DataScannedInBytes")
+        if scanned is None and source == "result_store":
+            scanned = 0
+        estimate = estimate or {}
+        return {
+            "estimated_bytes": estimate.get("estimated_bytes"),
+            "estimate_source": estimate.get("estimate_source"),
+            "budget_bytes": estimate.get("budget_bytes"),
+            "scanned_bytes": scanned,
+        }
+
+    def path_for(self, database_key: str) -> Path:
+        return self.base_dir / f"{database_key}.json"
+
+    def _read(self, database_key: str) -> Dict[str, Any]:
+        """
+        Historial guardado, cacheado en memoria mientras el archivo no cambie
+        """
+        path = self.path_for(database_key)
+        try:
+            mtime = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        with self._lock:
+            cached = self._cache.get(path)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+        try:
+            history = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Historial de escaneo ilegible para {database_key}, se ignora: {str(e)}")
+            return {}
+        with self._lock:
+            self._cache[path] = (mtime, history)
+        return history
+
+    def _update(self, database_key: str, changes: Dict[str, Dict[str, Any]]) -> None:
+        """
+        Aplica cambios por huella bajo un candado entre procesos; "scanned" se agrega a los anteriores.
+        Un fallo solo se registra porque el historial es una optimización.
+        """
+        path = self.path_for(database_key)
+        try:
+            with FileLock(f"scan-history-{database_key}"):
+                history = dict(self._read(database_key))
+                now = time.time()
+                for key, change in changes.items():
+                    entry = dict(history.get(key, {}))
+                    if "scanned" in change:
+                        entry["scanned"] = (entry.get("scanned", []) + change["scanned"])[-change["keep"]:]
+                    if "explained" in change:
+                        entry["explained"] = change["explained"]
+                    entry["updated"] = now
+                    history[key] = entry
+
+                if len(history) > MAX_FINGERPRINTS:
+                    recientes = sorted(history, key=lambda k: history[k].get("updated", 0), reverse=True)[:MAX_FINGERPRINTS]
+                    history = {k: history[k] for k in recientes}
+
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+                tmp_path.write_text(json.dumps(history), encoding="utf-8")
+                os.replace(tmp_path, path)
+                with self._lock:
+                    self._cache[path] = (path.stat().st_mtime_ns, history)
+        except OSError as e:
+            logger.warning(f"No se pudo actualizar el historial de escaneo de {database_key}: {str(e)}")
+
+
+# Instancia global de ScanBudget
+scan_budget = ScanBudget()
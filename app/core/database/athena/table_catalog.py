@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, TYPE_CHECKING
+
+from botocore.exceptions import ClientError
+
+from app.core.database.athena.athena_factory import athena_factory
+from app.core.logger.config import LoggerConfig
+from app.core.settings.environments import settings
+
+if TYPE_CHECKING:
+    import polars as pl
+
+# Nota: Path(__file__).stem == __name__.split('.')[-1]
+logger = LoggerConfig(file_name=Path(__file__).stem,debug=True,root_file=__name__).get_logger()
+
+INTEGER_TYPES = ("tinyint", "smallint", "int", "integer", "bigint")
+FLOAT_TYPES = ("float", "real", "double")
+
+
+def is_compatible(dtype: Any, athena_type: str) -> bool:
+    """
+    Indica si un tipo de Polars de los schemas del cliente puede leer una columna de Athena sin producir nulls.
+    String es compatible con todo porque Athena entrega los valores como texto.
+    """
+    import polars as pl
+
+    athena_type = athena_type.lower()
+    base = athena_type.split("(")[0]
+    if dtype == pl.String:
+        return True
+    if dtype.is_integer():
+        return base in INTEGER_TYPES
+    if dtype.is_float():
+        return base in INTEGER_TYPES or base in FLOAT_TYPES or base == "decimal"
+    if dtype == pl.Boolean:
+        return base == "boolean"
+    if dtype == pl.Date:
+        return base == "date"
+    if dtype == pl.Datetime:
+        return base.startswith("timestamp")
+    return False
+
+
+class TableCatalog:
+    """
+    Caché de metadatos de las tablas de Athena (Glue Data Catalog) por base de datos.
+
+    Se llena con list_table_metadata (todas las tablas en pocas llamadas paginadas) y se refresca cuando tiene más de
+    CATALOG_TTL_SECONDS; si el refresco falla se siguen usando los metadatos anteriores. Las peticiones nunca llaman
+    a la API de metadatos mientras la caché esté vigente.
+    """
+
+    def __init__(self):
+        self._tables: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._loaded_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def tables(self, database_key: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Tablas de la base de datos: nombre -> {"columns": {columna: tipo}, "partition_keys": [...]}
+        """
+        with self._lock:
+            stale = time.time() - self._loaded_at.get(database_key, 0) > settings.CATALOG_TTL_SECONDS
+            if stale:
+                try:
+                    self._tables[database_key] = self._load(database_key)
+                    self._loaded_at[database_key] = time.time()
+                except (ClientError, ValueError) as e:
+                    if database_key not in self._tables:
+                        raise
+                    logger.warning(f"No se pudo refrescar el catálogo de {database_key}, se usan los metadatos anteriores: {str(e)}")
+            return self._tables[database_key]
+
+    def columns(self, database_key: str, table: str) -> Dict[str, str]:
+        """
+        Columnas y tipos de una tabla; si no está en la caché (p. ej. se creó después de la última carga)
+        se consulta solo esa tabla con get_table_metadata
+        """
+        table_metadata = self.tables(database_key).get(table)
+        if table_metadata is None:
+            try:
+                metadata = athena_factory.get_client(database_key).get_table_metadata(table)
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'MetadataException':
+                    raise
+                raise ValueError(f"La tabla '{table}' no existe en '{database_key}'")
+            table_metadata = self._parse(metadata)
+            with self._lock:
+                self._tables.setdefault(database_key, {})[table] = table_metadata
+        return table_metadata["columns"]
+
+    def project(self, database_key: str, table: str, wanted: List[str]) -> List[str]:
+        """
+        Valida las columnas que un query builder quiere leer contra el catálogo y las devuelve en el mismo orden.
+        Una columna inexistente es un error explícito en lugar de una columna de nulls. Si el catálogo no está
+        disponible (sin permisos de Glue, etc.) se confía en las columnas solicitadas.
+        """
+        if not settings.CATALOG_ENABLED:
+            return wanted
+        try:
+            available = self.columns(database_key, table)
+        except ClientError as e:
+            logger.warning(f"Catálogo no disponible para {database_key}.{table}, no se valida la proyección: {str(e)}")
+            return wanted
+
+        missing = [c for c in wanted if c not in available]
+        if missing:
+            raise ValueError(f"Columnas inexistentes en {table}: {', '.join(missing)}")
+        return wanted
+
+    def validate_schema(self, database_key: str, table: str, schema: Dict[str, pl.DataType]) -> Dict[str, Any]:
+        """
+        Compara un schema del cliente (columna -> tipo de Polars) con la tabla real
+        """
+        available = self.columns(database_key, table)
+        return {
+            "missing_in_table": [c for c in schema if c not in available],
+            "missing_in_schema": [c for c in available if c not in schema],
+            "type_mismatches": {
+                c: {"schema": str(dtype), "athena": available[c]}
+                for c, dtype in schema.items()
+                if c in available and not is_compatible(dtype, available[c])
+            },
+        }
+
+    def validate_all(self) -> Dict[str, Any]:
+        """
+        Valida los schemas del cliente registrados en schemas_por_tabla contra cada base de datos configurada.
+        Las diferencias se registran como advertencias; un error de acceso al catálogo no detiene el arranque.
+        """
+        from app.domain.schemas.viajes_facturacion import schemas_por_tabla
+
+        report: Dict[str, Any] = {}
+        for database_key in athena_factory.get_available_databases():
+            for table, schema in schemas_por_tabla.items():
+                key = f"{database_key}.{table}"
+                try:
+                    result = self.validate_schema(database_key, table, schema)
+                except (ClientError, ValueError) as e:
+                    report[key] = {"status": "error", "message": str(e)}
+                    continue
+                drift = result["missing_in_table"] or result["type_mismatches"]
+                if drift:
+                    logger.warning(f"El schema de {key} no coincide con Athena: {result}")
+                report[key] = {"status": "drift" if drift else "ok", **result}
+        return report
+
+    def _load(self, database_key: str) -> Dict[str, Dict[str, Any]]:
+        client = athena_factory.get_client(database_key)
+        tables = {metadata["Name"]: self._parse(metadata) for metadata in client.list_table_metadata()}
+        logger.info(f"Catálogo de {database_key} cargado: {len(tables)} tablas")
+        return tables
+
+    @staticmethod
+    def _parse(metadata: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "columns": {
+                column["Name"]: column.get("Type", "string")
+                for column in metadata.get("Columns", []) + metadata.get("PartitionKeys", [])
+            },
+            "partition_keys": [column["Name"] for column in metadata.get("PartitionKeys", [])],
+        }
+
+
+# Instancia global de TableCatalog
+table_catalog = TableCatalog()
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, TYPE_CHECKING
+
+from app.core.database.report_store import write_parquet_atomic
+from app.core.logger.config import LoggerConfig
+from app.core.settings.environments import settings
+from app.utils.file_lock import FileLock
+
+if TYPE_CHECKING:
+    import polars as pl
+
+# Nota: Path(__file__).stem == __name__.split('.')[-1]
+logger = LoggerConfig(file_name=Path(__file__).stem,debug=True,root_file=__name__).get_logger()
+
+CLAVES = ['udn', 'cliente']
+
+
+class ClientDimension:
+    """
+    Dimensión de clientes por base de datos: todas las parejas (udn, cliente) que han aparecido en los reportes,
+    ordenadas, en `<DATA_DIR>/dimensiones/<ambiente>/<database_key>/clientes.parquet`.
+
+    Es el diccionario con el que alerta_clientes codifica udn y cliente como Enum (enteros) para los joins,
+    la malla udn × cliente × semana y las ventanas. Solo crece: cada reporte agrega las parejas nuevas, bajo un
+    candado entre procesos para que dos workers que agregan a la vez no pierdan las parejas del otro.
+    """
+
+    def __init__(self, base_dir: Optional[Path] = None):
+        self.base_dir = base_dir or Path(settings.DATA_DIR) / "dimensiones" / settings.ENVIRONMENT
+        self._lock = threading.Lock()
+        self._cache: Dict[Path, Any] = {}
+
+    def path_for(self, database_key: str) -> Path:
+        return self.base_dir / database_key / "clientes.parquet"
+
+    def read(self, database_key: str) -> Optional[pl.DataFrame]:
+        """
+        La dimensión guardada, cacheada en memoria mientras el archivo no cambie
+        """
+        import polars as pl
+
+        path = self.path_for(database_key)
+        try:
+            mtime = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            cached = self._cache.get(path)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+            df = pl.read_parquet(path)
+            self._cache[path] = (mtime, df)
+            return df
+
+    def update(self, database_key: str, pares: pl.DataFrame) -> pl.DataFrame:
+        """
+        Agrega a la dimensión las parejas (udn, cliente) que aún no tiene y devuelve la dimensión completa
+        """
+        import polars as pl
+
+        pares = pares.select(CLAVES).unique()
+        actual = self.read(database_key)
+        if actual is not None and pares.join(actual, on=CLAVES, how='anti', nulls_equal=True).height == 0:
+            return actual
+
+        # Se vuelve a leer con el candado tomado: otro proceso pudo agregar parejas mientras tanto
+        with FileLock(f"dimension-clientes-{database_key}"):
+            actual = self.read(database_key)
+            if actual is not None:
+                nuevas = pares.join(actual, on=CLAVES, how='anti', nulls_equal=True)
+                if nuevas.height == 0:
+                    return actual
+                dimension = pl.concat([actual, nuevas])
+            else:
+                nuevas = dimension = pares
+
+            dimension = dimension.sort(CLAVES)
+            path = self.path_for(database_key)
+            with self._lock:
+                write_parquet_atomic(dimension, path)
+                self._cache[path] = (path.stat().st_mtime_ns, dimension)
+        logger.info(f"Dimensión de clientes de {database_key}: {nuevas.height} parejas nuevas, {dimension.height} en total")
+        return dimension
+
+
+# Instancia global de ClientDimension
+client_dimension = ClientDimension()
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import datetime as dt
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, TYPE_CHECKING
+
+from app.core.logger.config import LoggerConfig
+from app.core.settings.environments import settings
+
+if TYPE_CHECKING:
+    import polars as pl
+
+# Nota: Path(__file__).stem == __name__.split('.')[-1]
+logger = LoggerConfig(file_name=Path(__file__).stem,debug=True,root_file=__name__).get_logger()
+
+
+class KpiStore:
+    """
+    Almacén local de agregados materializados en Parquet.
+
+    Guarda los viajes por udn, cliente y semana; los indicadores consolidados se calculan sobre este archivo
+    sin consultar Athena. Cada ambiente usa su propia carpeta porque prod y preprod comparten el volumen ./data.
+    """
+
+    VIAJES_SEMANALES = "viajes_udn_cliente_semana.parquet"
+    ESTADO = "estado.json"
+
+    def __init__(self, base_dir: Optional[Path] = None):
+        self.base_dir = base_dir or Path(settings.DATA_DIR) / "kpi" / settings.ENVIRONMENT
+        self._lock = threading.Lock()
+        self._cache: Dict[str, Any] = {}
+
+    @property
+    def viajes_path(self) -> Path:
+        return self.base_dir / self.VIAJES_SEMANALES
+
+    def read_viajes_semanales(self) -> Optional[pl.DataFrame]:
+        """
+        Devuelve los viajes semanales materializados, cacheados en memoria mientras el archivo no cambie
+        """
+        import polars as pl
+
+        path = self.viajes_path
+        if not path.exists():
+            return None
+
+        mtime = path.stat().st_mtime_ns
+        with self._lock:
+            cached = self._cache.get("viajes")
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+            df = pl.read_parquet(path)
+            self._cache["viajes"] = (mtime, df)
+            return df
+
+    def write_viajes_semanales(self, df: pl.DataFrame) -> None:
+        """
+        Reemplaza de forma atómica el archivo de viajes semanales
+        """
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.viajes_path.with_suffix(".parquet.tmp")
+        df.write_parquet(tmp_path, compression="zstd")
+        os.replace(tmp_path, self.viajes_path)
+
+    def read_estado(self) -> Dict[str, Any]:
+        """
+        Devuelve los metadatos de la última actualización; un archivo ilegible se ignora como si no existiera
+        """
+        path = self.base_dir / self.ESTADO
+        if not path.exists():
+            return {}
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Estado de indicadores ilegible, se ignora: {str(e)}")
+            return {}
+
+    def write_estado(self, estado: Dict[str, Any]) -> None:
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.base_dir / (self.ESTADO + ".tmp")
+        tmp_path.write_text(json.dumps(estado, default=str, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, self.base_dir / self.ESTADO)
+
+    def ultima_semana(self) -> Optional[dt.date]:
+        """
+        Lunes de la semana más reciente materializada
+        """
+        df = self.read_viajes_semanales()
+        if df is None or df.is_empty():
+            return None
+        return df["semana"].max()
+
+
+# Instancia global de KpiStore
+kpi_store = KpiStore()
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import datetime as dt
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, TYPE_CHECKING
+
+from app.core.logger.config import LoggerConfig
+from app.core.settings.environments import settings
+
+if TYPE_CHECKING:
+    import polars as pl
+
+# Nota: Path(__file__).stem == __name__.split('.')[-1]
+logger = LoggerConfig(file_name=Path(__file__).stem,debug=True,root_file=__name__).get_logger()
+
+
+def write_parquet_atomic(df: pl.DataFrame, path: Path, compression: str = "zstd") -> int:
+    """
+    Escribe un Parquet de forma atómica (archivo temporal + os.replace) y devuelve su tamaño en bytes;
+    se puede llamar desde el pool de procesos
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f".parquet.{os.getpid()}.tmp")
+    df.write_parquet(tmp_path, compression=compression)
+    size = tmp_path.stat().st_size
+    os.replace(tmp_path, path)
+    return size
+
+
+class ReportStore:
+    """
+    Historial local de la salida de los reportes en Parquet, un archivo por semana más reciente del reporte:
+    `<DATA_DIR>/reportes/<ambiente>/<reporte>/<database_key>/<AAAA-MM-DD>.parquet`. La llave no incluye la ventana
+    del reporte, por lo que solo se guarda la salida de la ventana completa (ver AlertaClientesService).
+    Regenerar el reporte de la misma semana reemplaza su archivo; se conservan las REPORT_HISTORY_KEEP semanas más recientes.
+    """
+
+    def __init__(self, base_dir: Optional[Path] = None):
+        self.base_dir = base_dir or Path(settings.DATA_DIR) / "reportes" / settings.ENVIRONMENT
+        self._lock = threading.Lock()
+        self._cache: Dict[Path, Any] = {}
+
+    def path_for(self, reporte: str, database_key: str, semana: dt.date) -> Path:
+        return self.base_dir / reporte / database_key / f"{semana.isoformat()}.parquet"
+
+    def semanas(self, reporte: str, database_key: str) -> List[dt.date]:
+        """
+        Semanas con salida guardada, de la más antigua a la más reciente
+        """
+        folder = self.base_dir / reporte / database_key
+        if not folder.exists():
+            return []
+        return sorted(dt.date.fromisoformat(p.stem) for p in folder.glob("*.parquet"))
+
+    def read(self, reporte: str, database_key: str, semana: dt.date) -> Optional[pl.DataFrame]:
+        """
+        Lee la salida guardada de una semana, cacheada en memoria mientras el archivo no cambie
+        """
+        import polars as pl
+
+        path = self.path_for(reporte, database_key, semana)
+        try:
+            mtime = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            cached = self._cache.get(path)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+            df = pl.read_parquet(path)
+            self._cache[path] = (mtime, df)
+            return df
+
+    def prune(self, reporte: str, database_key: str) -> None:
+        """
+        Elimina las salidas más antiguas que exceden REPORT_HISTORY_KEEP
+        """
+        semanas = self.semanas(reporte, database_key)
+        for semana in semanas[:max(0, len(semanas) - settings.REPORT_HISTORY_KEEP)]:
+            path = self.path_for(reporte, database_key, semana)
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            with self._lock:
+                self._cache.pop(path, None)
+
+
+# Instancia global de ReportStore
+report_store = ReportStore()
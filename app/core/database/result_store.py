@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, TYPE_CHECKING
+
+from app.core.logger.config import LoggerConfig
+from app.core.models.query_result import QueryResult
+from app.core.settings.environments import settings
+
+if TYPE_CHECKING:
+    import polars as pl
+
+# Nota: Path(__file__).stem == __name__.split('.')[-1]
+logger = LoggerConfig(file_name=Path(__file__).stem,debug=True,root_file=__name__).get_logger()
+
+# Filas por página al servir resultados almacenados, igual que Athena
+PAGE_SIZE = 1000
+
+
+class ResultStore:
+    """
+    Almacén persistente de resultados de Athena en Parquet, compartido entre procesos a través del volumen ./data.
+
+    Cada resultado se guarda en `<id>.parquet` con el texto exacto que entregó Athena, y sus metadatos (tipos
+    declarados incluidos) en `<id>.json`, así un resultado leído del almacén es idéntico al original; el índice por
+    huella de consulta vive en `by_fingerprint/<huella>` y contiene el id de la ejecución más reciente. Las escrituras son atómicas
+    (archivo temporal + os.replace) para que otro proceso nunca lea un archivo a medias.
+    """
+
+    def __init__(self, base_dir: Optional[Path] = None):
+        self.base_dir = base_dir or Path(settings.DATA_DIR) / "results" / settings.ENVIRONMENT
+        self.max_bytes = settings.RESULT_STORE_MAX_MB * 1024 * 1024
+        self.max_age_seconds = settings.RESULT_STORE_MAX_AGE_HOURS * 3600
+
+    def _path(self, query_execution_id: str) -> Path:
+        return self.base_dir / f"{query_execution_id}.parquet"
+
+    def save(
+        self,
+        query_execution_id: str,
+        df: pl.DataFrame,
+        column_types: List[str],
+        fingerprint: Optional[str] = None,
+        database: Optional[str] = None,
+    ) -> None:
+        """
+        Guarda un resultado de Athena como texto (QueryResult.frame) con sus tipos declarados
+        """
+        import polars as pl
+
+        try:
+            # Los valores se guardan como texto para no pasar por un tipo de Polars
+            df = df.select(pl.all().cast(pl.String))
+            self.base_dir.mkdir(parents=True, exist_ok=True)
+            path = self._path(query_execution_id)
+            tmp_path = path.with_suffix(f".parquet.{os.getpid()}.tmp")
+            df.write_parquet(tmp_path, compression="zstd")
+            os.replace(tmp_path, path)
+
+            self._write_json(path.with_suffix(".json"), {
+                "query_execution_id": query_execution_id,
+                "query_fingerprint": fingerprint,
+                "database": database,
+                "columns": df.columns,
+                "column_types": column_types,
+                "row_count": df.height,
+                "created": time.time(),
+            })
+            if fingerprint:
+                index_dir = self.base_dir / "by_fingerprint"
+                index_dir.mkdir(exist_ok=True)
+                tmp_index = index_dir / f"{fingerprint}.{os.getpid()}.tmp"
+                tmp_index.write_text(query_execution_id, encoding="utf-8")
+                os.replace(tmp_index, index_dir / fingerprint)
+
+            self.evict()
+        except Exception as e:
+            # El almacén es una optimización: un fallo al guardar no debe romper la consulta
+            logger.warning(f"No se pudo guardar el resultado {query_execution_id}: {str(e)}")
+
+    def load(self, query_execution_id: str) -> Optional[pl.DataFrame]:
+        """
+        Lee un resultado almacenado con memory map; None si no existe o expiró
+        """
+        import polars as pl
+
+        path = self._path(query_execution_id)
+        try:
+            if time.time() - path.stat().st_mtime > self.max_age_seconds:
+                return None
+            df = pl.read_parquet(path, memory_map=True)
+            # Se actualiza la fecha de acceso para que la expulsión por tamaño sea LRU
+            os.utime(path)
+            return df
+        except (FileNotFoundError, OSError):
+            return None
+
+    def metadata(self, query_execution_id: str) -> Dict[str, Any]:
+        try:
+            return json.loads(self._path(query_execution_id).with_suffix(".json").read_text(encoding="utf-8"))
+        except (FileNotFoundError, OSError, ValueError):
+            return {}
+
+    def find_by_fingerprint(self, fingerprint: str, max_age_seconds: int) -> Optional[str]:
+        """
+        Id de la ejecución más reciente con la misma huella si su resultado tiene menos de max_age_seconds
+        """
+        index = self.base_dir / "by_fingerprint" / fingerprint
+        try:
+            query_execution_id = index.read_text(encoding="utf-8").strip()
+            path = self._path(query_execution_id)
+            created = self.metadata(query_execution_id).get("created", 0)
+            if path.exists() and time.time() - created <= max_age_seconds:
+                return query_execution_id
+        except (FileNotFoundError, OSError):
+            pass
+        return None
+
+    def to_result(self, query_execution_id: str, df: pl.DataFrame) -> QueryResult:
+        """
+        Resultado almacenado como QueryResult, igual que AthenaClient.get_query_results
+        """
+        metadata = self.metadata(query_execution_id)
+        return QueryResult(
+            query_execution_id,
+            df,
+            column_types=metadata.get("column_types", []),
+            query_fingerprint=metadata.get("query_fingerprint"),
+            source="result_store"
+        )
+
+    def iter_pages(self, query_execution_id: str, df: pl.DataFrame, next_token: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Entrega un resultado almacenado en páginas con la misma forma que AthenaClient.iter_query_results;
+        el next_token de cada página es la fila donde empieza la siguiente
+        """
+        import polars as pl
+
+        column_types = self.metadata(query_execution_id).get("column_types", [])
+        as_text = df.select(pl.all().cast(pl.String).fill_null(""))
+        if as_text.height == 0:
+            yield {"columns": df.columns, "column_types": column_types, "data": [], "next_token": None}
+            return
+        for offset in range(int(next_token or 0), as_text.height, PAGE_SIZE):
+            page = as_text.slice(offset, PAGE_SIZE)
+            following = offset + PAGE_SIZE
+            yield {
+                "columns": df.columns,
+                "column_types": column_types,
+                "data": [list(row) for row in page.iter_rows()],
+                "next_token": str(following) if following < as_text.height else None,
+            }
+
+    def evict(self) -> Dict[str, int]:
+        """
+        Elimina los resultados más antiguos que RESULT_STORE_MAX_AGE_HOURS y, si se excede RESULT_STORE_MAX_MB,
+        los de acceso menos reciente hasta quedar por debajo del límite
+        """
+        now = time.time()
+        entries = []
+        for path in self.base_dir.glob("*.parquet"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        removed = 0
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in sorted(entries):
+            if now - mtime <= self.max_age_seconds and total <= self.max_bytes:
+                break
+            for stale in (path, path.with_suffix(".json")):
+                try:
+                    stale.unlink()
+                except FileNotFoundError:
+                    pass
+            total -= size
+            removed += 1
+
+        if removed:
+            self._prune_index()
+            logger.info(f"Resultados expulsados del almacén: {removed}")
+        return {"removed": removed, "bytes": total}
+
+    def _prune_index(self) -> None:
+        """
+        Borra las entradas de by_fingerprint que apuntan a resultados que ya no existen
+        """
+        for index in (self.base_dir / "by_fingerprint").glob("*"):
+            if index.name.endswith(".tmp"):
+                continue
+            try:
+                query_execution_id = index.read_text(encoding="utf-8").strip()
+                if not self._path(query_execution_id).exists():
+                    index.unlink()
+            except (FileNotFoundError, OSError):
+                continue
+
+    def _write_json(self, path: Path, payload: Dict[str, Any]) -> None:
+        tmp_path = path.with_suffix(f".json.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+
+# Instancia global de ResultStore
+result_store = ResultStore()
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.logger.config import LoggerConfig
+from app.core.settings.environments import settings
+
+# Nota: Path(__file__).stem == __name__.split('.')[-1]
+logger = LoggerConfig(file_name=Path(__file__).stem,debug=True,root_file=__name__).get_logger()
+
+
+def cache_key(*parts: Any) -> str:
+    """
+    Llave estable para un conjunto de parámetros (listas, fechas, None...)
+    """
+    payload = json.dumps(parts, ensure_ascii=False, default=str, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+class SharedCache:
+    """
+    Caché en disco compartida por todos los procesos que montan ./data (workers de uvicorn, prod y preprod usan
+    carpetas distintas por ambiente): `<DATA_DIR>/cache/<ambiente>/<espacio>/<llave>.json` con los metadatos y,
+    opcionalmente, `<llave>.bin` con el contenido (p. ej. el xlsx de un reporte).
+
+    El json se escribe al final y es la marca de que la entrada está completa; ambas escrituras son atómicas
+    (archivo temporal + os.replace), así otro proceso nunca lee una entrada a medias. La coordinación para no
+    calcular dos veces lo mismo se hace con FileLock.
+    """
+
+    def __init__(self, base_dir: Optional[Path] = None):
+        self.base_dir = base_dir or Path(settings.DATA_DIR) / "cache" / settings.ENVIRONMENT
+        self.max_bytes = settings.SHARED_CACHE_MAX_MB * 1024 * 1024
+        self.max_age_seconds = settings.SHARED_CACHE_MAX_AGE_HOURS * 3600
+
+    def _paths(self, namespace: str, key: str) -> Tuple[Path, Path]:
+        folder = self.base_dir / namespace
+        return folder / f"{key}.json", folder / f"{key}.bin"
+
+    def get(self, namespace: str, key: str, max_age_seconds: float) -> Optional[Tuple[Dict[str, Any], Optional[bytes]]]:
+        """
+        (metadatos, contenido) de una entrada con menos de max_age_seconds; None si no existe o es más antigua
+        """
+        meta_path, data_path = self._paths(namespace, key)
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            if time.time() - meta.get("created", 0) > max_age_seconds:
+                return None
+            data = data_path.read_bytes() if meta.get("has_data") else None
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+        return meta, data
+
+    def put(self, namespace: str, key: str, meta: Dict[str, Any], data: Optional[bytes] = None) -> None:
+        """
+        Guarda una entrada; un fallo solo se registra porque la caché es una optimización
+        """
+        meta_path, data_path = self._paths(namespace, key)
+        try:
+            meta_path.parent.mkdir(parents=True, exist_ok=True)
+            if data is not None:
+                self._write_atomic(data_path, data)
+            payload = {**meta, "created": time.time(), "pid": os.getpid(), "has_data": data is not None}
+            self._write_atomic(meta_path, json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8"))
+            self.evict()
+        except OSError as e:
+            logger.warning(f"No se pudo guardar {namespace}/{key} en la caché compartida: {str(e)}")
+
+    def evict(self) -> Dict[str, int]:
+        """
+        Elimina las entradas más antiguas que SHARED_CACHE_MAX_AGE_HOURS y, si se excede SHARED_CACHE_MAX_MB,
+        las más antiguas hasta quedar por debajo del límite
+        """
+        now = time.time()
+        entries = []
+        for meta_path in self.base_dir.glob("*/*.json"):
+            data_path = meta_path.with_suffix(".bin")
+            try:
+                stat = meta_path.stat()
+                size = stat.st_size + (data_path.stat().st_size if data_path.exists() else 0)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, size, meta_path))
+
+        removed = 0
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, meta_path in sorted(entries):
+            if now - mtime <= self.max_age_seconds and total <= self.max_bytes:
+                break
+            # Primero el json: sin él la entrada ya no se considera completa
+            for stale in (meta_path, meta_path.with_suffix(".bin")):
+                try:
+                    stale.unlink()
+                except FileNotFoundError:
+                    pass
+            total -= size
+            removed += 1
+
+        if removed:
+            logger.info(f"Entradas expulsadas de la caché compartida: {removed}")
+        return {"removed": removed, "bytes": total}
+
+    @staticmethod
+    def _write_atomic(path: Path, content: bytes) -> None:
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(content)
+        os.replace(tmp_path, path)
+
+
+# Instancia global de SharedCache
+shared_cache = SharedCache()
@@ -28,8 +28,8 @@ class LoggerConfig:
             #Formato para salida de consola
             console_formatter = self.__get_console_formatter__()
 
-            # Handler para salida de archivo
-            file_handler = logging.FileHandler(log_file_path, encoding="utf-8")
+            # Handler para salida de archivo, delay=True difiere la apertura del archivo hasta el primer registro
+            file_handler = logging.FileHandler(log_file_path, encoding="utf-8", delay=True)
             file_handler.setFormatter(file_formatter)
             self.__logger.addHandler(file_handler)
 
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Literal, Union
 
 class AthenaDatabase(BaseModel):
     name: str = Field(..., description="Nombre identificador de la base de datos")
@@ -12,12 +12,39 @@ class AthenaConnectionConfig(BaseModel):
     region: str = "us-west-2"
     database: str
     s3_output_location: Optional[str] = None
+    workgroup: str = "primary"
+    result_reuse_minutes: int = 0
+
+class AthenaWorkgroupConfig(BaseModel):
+    name: str = Field(..., description="Nombre del workgroup en Athena")
+    region: Optional[str] = Field(None, description="Región del workgroup, por defecto AWS_REGION")
+    s3_output_location: Optional[str] = Field(None, description="Bucket de resultados, por defecto ATHENA_S3_OUTPUT_LOCATION")
+    databases: Optional[List[str]] = Field(None, description="Claves de base de datos que atiende, None = todas")
+    priorities: Optional[List[str]] = Field(None, description="Prioridades que atiende (interactive, batch), None = todas")
+    max_concurrency: Optional[int] = Field(None, gt=0, description="Consultas simultáneas objetivo, pondera la selección por carga")
 
 class QueryRequest(BaseModel):
     database_key: str = Field(..., description="Clave de la base de datos (bustrax, analytics, etc.)")
-    query: str = Field(..., description="Consulta SQL a ejecutar")
+    query: str = Field(..., description="Consulta SQL a ejecutar, con marcadores '?' para los parámetros")
     timeout: Optional[int] = Field(600, description="Timeout en segundos")
+    parameters: Optional[List[Union[str, int, float, bool, None]]] = Field(
+        None, description="Valores para los marcadores '?' (se envían como ExecutionParameters, nunca concatenados al SQL)"
+    )
+    priority: Literal["interactive", "batch"] = Field(
+        "interactive", description="Prioridad para elegir workgroup: interactive (API) o batch (reportes)"
+    )
 
 class QueryResultRequest(BaseModel):
     database_key: str = Field(..., description="Clave de la base de datos")
-    query_execution_id: str = Field(..., description="ID de ejecución de la consulta")
\ No newline at end of file
+    query_execution_id: str = Field(..., description="ID de ejecución de la consulta")
+
+class ExportRequest(BaseModel):
+    database_key: str = Field(..., description="Clave de la base de datos")
+    query: str = Field(..., description="Consulta SQL cuyo resultado se exporta, con marcadores '?' para los parámetros")
+    parameters: Optional[List[Union[str, int, float, bool, None]]] = Field(None, description="Valores para los marcadores '?'")
+    name: str = Field(..., pattern=r"^[A-Za-z0-9_-]+$", description="Nombre del dataset (carpeta en DATA_DIR/exports)")
+    partition_by: List[str] = Field(
+        default_factory=list, description="Columnas de partición estilo Hive, p. ej. part_year, part_mont, part_day"
+    )
+    timeout: Optional[int] = Field(1800, description="Timeout en segundos de la consulta")
+    restart: bool = Field(False, description="Descarta el progreso guardado y exporta desde el inicio")
@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+import json
+import re
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TYPE_CHECKING
+
+from app.core.logger.config import LoggerConfig
+
+if TYPE_CHECKING:
+    import polars as pl
+
+# Nota: Path(__file__).stem == __name__.split('.')[-1]
+logger = LoggerConfig(file_name=Path(__file__).stem,debug=True,root_file=__name__).get_logger()
+
+# Valores que se leen como null al convertir a un schema del cliente, igual que read_csv en _crear_dataframe
+NULL_VALUES = ["", "NULL", "null"]
+
+# Formato en que Athena entrega date y timestamp; timestamp with time zone agrega " <zona>" al final
+DATE_FORMAT = "%Y-%m-%d"
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S%.f"
+
+_DECIMAL = re.compile(r"^decimal\((\d+)\s*,\s*(\d+)\)$")
+_INTEGER_TYPES = ("bigint", "integer", "int", "smallint", "tinyint")
+_FLOAT_TYPES = ("double", "float", "real")
+
+
+def athena_typed_series(values: pl.Series, athena_type: str) -> pl.Series:
+    """
+    Convierte una columna de texto (como la entrega Athena, con '' para null) al tipo declarado en ResultSetMetadata.
+    La conversión es exacta: decimal(p,s) se lee como Decimal(p,s) y timestamp with time zone conserva su zona.
+    Lanza ValueError si algún valor no se puede representar en el tipo; nunca lo reemplaza por null.
+    """
+    import polars as pl
+
+    athena_type = (athena_type or "varchar").lower().strip()
+    name = values.name
+    text = values.cast(pl.String)
+    present = text.replace("", None)
+
+    try:
+        if athena_type in _INTEGER_TYPES:
+            return present.cast(pl.Int64, strict=True)
+        if athena_type in _FLOAT_TYPES:
+            return present.cast(pl.Float64, strict=True)
+        decimal = _DECIMAL.match(athena_type)
+        if decimal:
+            precision, scale = int(decimal.group(1)), int(decimal.group(2))
+            # El cast a Decimal redondea los dígitos que sobran de la escala: se rechazan antes
+            digits = present.str.extract(r"\.(\d+)$").str.len_chars().max()
+            if digits is not None and digits > scale:
+                raise ValueError(f"más de {scale} decimales")
+            return present.cast(pl.Decimal(precision, scale), strict=True)
+        if athena_type == "boolean":
+            lowered = present.str.to_lowercase()
+            if not lowered.drop_nulls().is_in(["true", "false"]).all():
+                raise ValueError("valores que no son true/false")
+            return (lowered == "true").alias(name)
+        if athena_type == "date":
+            return present.str.to_date(DATE_FORMAT, strict=True)
+        if athena_type.startswith("timestamp") and athena_type.endswith("with time zone"):
+            # Polars no interpreta nombres de zona al parsear: se separa la zona y se aplica si es una sola
+            partes = present.str.extract_groups(r"^(.+?) (\S+)$")
+            zonas = partes.struct.field("2").drop_nulls().unique()
+            if partes.struct.field("1").null_count() != present.null_count() or zonas.len() > 1:
+                raise ValueError("zonas horarias mezcladas o valores sin zona")
+            parsed = partes.struct.field("1").str.to_datetime(TIMESTAMP_FORMAT, time_unit="us", strict=True)
+            if zonas.len() == 1:
+                parsed = parsed.dt.replace_time_zone(zonas[0])
+            return parsed.alias(name)
+        if athena_type.startswith("timestamp"):
+            return present.str.to_datetime(TIMESTAMP_FORMAT, time_unit="us", strict=True)
+    except pl.exceptions.PolarsError as e:
+        raise ValueError(str(e)) from e
+    return text
+
+
+def athena_typed(frame: pl.DataFrame, column_types: List[str]) -> pl.DataFrame:
+    """
+    El resultado de texto con cada columna en su tipo de Athena (Arrow IPC, exportaciones a Parquet).
+    Una columna con valores que no se pueden convertir sin pérdida se conserva como texto y se registra.
+    """
+    if not column_types or len(column_types) != frame.width:
+        return frame
+
+    columns = []
+    for series, athena_type in zip(frame.get_columns(), column_types):
+        try:
+            columns.append(athena_typed_series(series, athena_type))
+        except ValueError as e:
+            logger.warning(f"La columna '{series.name}' ({athena_type}) se conserva como texto: {str(e)}")
+            columns.append(series)
+    return frame.with_columns(columns)
+
+
+class QueryResult:
+    """
+    Resultado de una consulta en formato columnar: un DataFrame de Polars (memoria Arrow) con el texto exacto que
+    entregó Athena, en lugar de una lista de filas con una cadena de Python por celda. JSON, CSV y to_text devuelven
+    ese texto sin cambios; la vista tipada (athena_typed) solo se arma donde hace falta, p. ej. Arrow IPC.
+
+    Se construye página por página (solo una página de filas de Python vive a la vez), pasa sin copiarse por
+    cliente, repositorio, servicio y router, y se serializa directo a JSON o Arrow IPC. Para no romper a quien
+    usa el resultado como dict, acepta `result["status"]`, `result.get(...)` e `in`; la llave "data" materializa
+    las filas como texto y solo existe por compatibilidad.
+    """
+
+    __slots__ = ("query_execution_id", "frame", "column_types", "statistics", "query_state", "query_fingerprint", "source", "scan")
+
+    status = "success"
+
+    # Llaves disponibles como en un dict y las que se pueden asignar (p. ej. result["query_fingerprint"] = ...)
+    _KEYS = ("status", "query_execution_id", "query_state", "query_fingerprint", "source", "statistics", "scan",
+             "columns", "column_types", "row_count", "data")
+    _WRITABLE = ("statistics", "query_state", "query_fingerprint", "source", "scan")
+
+    def __init__(
+        self,
+        query_execution_id: str,
+        frame: pl.DataFrame,
+        column_types: Optional[List[str]] = None,
+        statistics: Optional[Dict[str, Any]] = None,
+        query_state: str = "SUCCEEDED",
+        query_fingerprint: Optional[str] = None,
+        source: str = "athena",
+        scan: Optional[Dict[str, Any]] = None,
+    ):
+        self.query_execution_id = query_execution_id
+        self.frame = frame
+        self.column_types = column_types or []
+        self.statistics = statistics
+        self.query_state = query_state
+        self.query_fingerprint = query_fingerprint
+        self.source = source
+        self.scan = scan
+
+    @classmethod
+    def from_pages(
+        cls,
+        query_execution_id: str,
+        pages: Iterable[Dict[str, Any]],
+        statistics: Optional[Dict[str, Any]] = None,
+    ) -> "QueryResult":
+        """
+        Arma el resultado a partir de las páginas de iter_query_results, convirtiendo cada página a columnas
+        de texto en cuanto llega
+        """
+        import polars as pl
+
+        columns: List[str] = []
+        column_types: List[str] = []
+        frames = []
+        for page in pages:
+            columns, column_types = page["columns"], page["column_types"]
+            if page["data"]:
+                frames.append(pl.DataFrame(page["data"], schema=[(c, pl.String) for c in columns], orient="row"))
+
+        if frames:
+            frame = pl.concat(frames, rechunk=True)
+        else:
+            frame = pl.DataFrame(schema=[(c, pl.String) for c in columns])
+        return cls(query_execution_id, frame, column_types, statistics)
+
+    @property
+    def columns(self) -> List[str]:
+        return self.frame.columns
+
+    @property
+    def row_count(self) -> int:
+        return self.frame.height
+
+    @property
+    def schema(self) -> Dict[str, str]:
+        """Columna -> tipo de Athena"""
+        if len(self.column_types) != self.frame.width:
+            return {c: "varchar" for c in self.frame.columns}
+        return dict(zip(self.frame.columns, self.column_types))
+
+    def to_polars(self, schema: Optional[Dict[str, pl.DataType]] = None) -> pl.DataFrame:
+        """
+        El resultado con cada columna en su tipo de Athena (ver athena_typed). Con un schema del cliente
+        (columna -> tipo de Polars) se seleccionan y convierten esas columnas con las reglas de _crear_dataframe:
+        '', 'NULL' y 'null' son null en las columnas de texto y los valores que no se pueden convertir quedan como null.
+        """
+        if schema is None:
+            return athena_typed(self.frame, self.column_types)
+
+        import polars as pl
+
+        return self.frame.select([
+            pl.col(c).cast(pl.String).replace(NULL_VALUES, None) if dtype == pl.String else pl.col(c).cast(dtype, strict=False)
+            for c, dtype in schema.items()
+        ])
+
+    def to_text(self) -> pl.DataFrame:
+        """Valores como texto y null como '', la forma en que los entrega Athena"""
+        import polars as pl
+
+        return self.frame.select(pl.all().cast(pl.String).fill_null(""))
+
+    def iter_rows(self) -> Iterator[tuple]:
+        return self.to_text().iter_rows()
+
+    def to_arrow(self) -> bytes:
+        """Serializa el resultado tipado en Arrow IPC (stream), legible con pyarrow, Polars, DuckDB, etc."""
+        buffer = BytesIO()
+        athena_typed(self.frame, self.column_types).write_ipc_stream(buffer)
+        return buffer.getvalue()
+
+    def metadata(self) -> Dict[str, Any]:
+        """Todo excepto las filas"""
+        return {
+            "status": self.status,
+            "query_execution_id": self.query_execution_id,
+            "query_state": self.query_state,
+            "query_fingerprint": self.query_fingerprint,
+            "source": self.source,
+            "statistics": self.statistics,
+            "scan": self.scan,
+            "columns": self.columns,
+            "column_types": self.column_types,
+            "row_count": self.row_count,
+        }
+
+    def to_json(self) -> bytes:
+        """
+        JSON con la forma histórica de la API ({..., "columns": [...], "data": [[...]]}) sin armar el dict completo:
+        las filas se serializan directo desde las columnas de texto
+        """
+        head = json.dumps(self.metadata(), ensure_ascii=False, default=str)
+        rows = ",".join(json.dumps(list(row), ensure_ascii=False) for row in self.iter_rows())
+        return f'{head[:-1]}, "data": [{rows}]}}'.encode("utf-8")
+
+    # Compatibilidad con el resultado como dict
+    def __getitem__(self, key: str) -> Any:
+        if key == "data":
+            return [list(row) for row in self.iter_rows()]
+        if key in self._KEYS:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key not in self._WRITABLE:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._KEYS
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self[key] if key in self._KEYS else default
+
+    def __repr__(self) -> str:
+        return f"QueryResult(query_execution_id={self.query_execution_id!r}, rows={self.row_count}, columns={self.columns})"
@@ -0,0 +1,38 @@
+import datetime as dt
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Optional
+
+from app.core.settings.environments import settings
+
+class ReporteAlertaClientesParams(BaseModel):
+    """
+    Parámetros de /alerta-clientes/reporte. Los filtros (fechas, udn y prefijo de cliente) se aplican en el WHERE
+    de la consulta a Athena, así el escaneo y el tamaño del Excel dependen de lo que se pidió.
+    """
+    database: str = Field("bustrax", pattern=r"^[A-Za-z0-9_]+$", description="Clave de la base de datos")
+    fecha_corte: Optional[dt.date] = Field(
+        None, description="Fecha de referencia: se consideran las semanas completas anteriores a la semana de esta fecha (por defecto hoy)"
+    )
+    semanas: int = Field(
+        settings.REPORT_DEFAULT_WEEKS, ge=1, le=settings.REPORT_MAX_WEEKS,
+        description="Número de semanas completas a considerar (p. ej. 52 para comparativo anual)"
+    )
+    # Cada cantidad de udn es un texto de SQL distinto (un prepared statement por cantidad), por eso se limita
+    udn: List[str] = Field(default_factory=list, max_length=20, description="Filtra por una o varias unidades de negocio")
+    cliente_prefijo: Optional[str] = Field(
+        None, min_length=1, max_length=100, description="Solo los clientes cuyo nombre empieza con este texto"
+    )
+    fan_out: bool = Field(settings.REPORT_FANOUT_ENABLED, description="Divide el rango en sub-rangos consultados en paralelo")
+
+    @field_validator("fecha_corte")
+    @classmethod
+    def validar_fecha_corte(cls, value: Optional[dt.date]) -> Optional[dt.date]:
+        if value is not None and value > dt.date.today():
+            raise ValueError("fecha_corte no puede ser una fecha futura")
+        return value
+
+    @field_validator("udn")
+    @classmethod
+    def normalizar_udn(cls, value: List[str]) -> List[str]:
+        # Sin vacíos ni repetidos y en orden, para que la misma selección produzca la misma consulta
+        return sorted({u.strip() for u in value if u.strip()})
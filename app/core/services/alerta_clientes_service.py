@@ -1,74 +1,204 @@
+from __future__ import annotations
+
 import csv
 import io
+import contextvars
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
-import polars as pl
 from io import BytesIO
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, List, Optional, TYPE_CHECKING
 import datetime as dt
+from app.core.database.athena.resilience import FATAL, classify_error_result
+from app.core.database.athena.table_catalog import table_catalog
+from app.core.database.client_dimension import client_dimension
+from app.core.database.report_store import report_store, write_parquet_atomic
+from app.core.database.shared_cache import cache_key, shared_cache
 from app.core.services.athena_service import AthenaService
 from app.core.models.athena_models import QueryRequest
 from app.core.logger.config import LoggerConfig
+from app.core.settings.environments import settings
+from app.utils.cpu_pool import cpu_pool, from_ipc, to_ipc
+from app.utils.file_lock import FileLock
+from app.utils.memory_profile import memory_stage
+from app.utils.tracing import current_span, span, traced
 
-#schemas del cliente
-
-from app.domain.schemas.viajes_facturacion import schema_vf,rename_vf
+# polars y los schemas del cliente se importan dentro de los métodos para no cargarlos al importar app.main
+if TYPE_CHECKING:
+    import polars as pl
 
 # Nota: Path(__file__).stem == __name__.split('.')[-1]
 logger = LoggerConfig(file_name=Path(__file__).stem,debug=True,root_file=__name__).get_logger()
 
+# Columnas de viajes_facturacion que usa el reporte, no se traen las demás para reducir escaneo y memoria
+COLUMNAS_VIAJES = ['business_unit', 'group', 'start_date', 'status', 'tipo_de_viaje']
+
+# Nombre con el que se guarda la salida del reporte en el historial (ReportStore) y en la caché compartida
+REPORTE = "alerta_clientes"
+
+# Tiempo máximo que una petición espera a que otro worker termine el mismo reporte antes de construirlo ella misma
+ESPERA_REPORTE_SEGUNDOS = 900
+
+# Cada cuánto se revisa cancel_event mientras se esperan los sub-rangos del fan-out
+ESPERA_CANCELACION_SEGUNDOS = 0.5
+
+def dividir_rango(desde: dt.date, hasta: dt.date, dias: int) -> List[tuple]:
+    """
+    Divide [desde, hasta] en sub-rangos consecutivos de `dias` días (el último puede ser más corto)
+    """
+    sub_rangos = []
+    inicio = desde
+    while inicio <= hasta:
+        fin = min(inicio + dt.timedelta(days=dias - 1), hasta)
+        sub_rangos.append((inicio, fin))
+        inicio = fin + dt.timedelta(days=1)
+    return sub_rangos
+
+def rango_semanas(hoy: dt.date, semanas: int) -> tuple:
+    """
+    Primer y último día de las `semanas` semanas completas (lunes a domingo) anteriores a la semana de `hoy`
+    """
+    fecha_ini = hoy - dt.timedelta(days=hoy.weekday() + (semanas * 7))
+    return fecha_ini, fecha_ini + dt.timedelta(days=(semanas * 7) - 1)
+
 class AlertaClientesService:
     def __init__(self, athena_service: AthenaService = None):
         self.athena_service = athena_service or AthenaService()
     
-    def generar_reporte_alerta_clientes(self, database_key: str = "bustrax") -> Dict[str, Any]:
+    @traced()
+    def generar_reporte_alerta_clientes(
+        self,
+        database_key: str = "bustrax",
+        cancel_event: Optional[threading.Event] = None,
+        semanas: Optional[int] = None,
+        fan_out: Optional[bool] = None,
+        fecha_corte: Optional[dt.date] = None,
+        udn: Optional[List[str]] = None,
+        cliente_prefijo: Optional[str] = None
+    ) -> Dict[str, Any]:
         """
-        Genera el reporte específico de alerta_clientes con query fija usando Polars
+        Genera el reporte específico de alerta_clientes usando Polars.
+        Si se activa cancel_event la consulta en Athena se cancela y no se procesa nada.
+
+        Se consideran las `semanas` semanas completas anteriores a la semana de fecha_corte (por defecto hoy).
+        Los filtros udn y cliente_prefijo se agregan al WHERE de la consulta, por lo que Athena solo devuelve esos
+        viajes y la malla del reporte solo contiene esos clientes. Un reporte filtrado o con un número de semanas distinto
+        de REPORT_DEFAULT_WEEKS no se guarda en el historial de /alertas, que siempre corresponde al reporte completo.
+
+        Los resultados se leen página por página y se agregan por bloques en parciales (udn, cliente, semana),
+        por lo que la memoria no crece con el número de semanas solicitadas.
+        Con fan_out (por defecto REPORT_FANOUT_ENABLED) el rango se divide en sub-rangos que se consultan en paralelo.
+
+        El xlsx se guarda en la caché compartida entre procesos: con SHARED_SINGLE_FLIGHT, si otro worker ya está
+        construyendo el mismo reporte se espera y se entrega el suyo, y con REPORT_CACHE_SECONDS > 0 se reutiliza
+        un reporte reciente con los mismos parámetros.
         """
+        hoy = fecha_corte or dt.date.today()
+        N = semanas or settings.REPORT_DEFAULT_WEEKS
+        clave = cache_key(REPORTE, database_key, hoy - dt.timedelta(days=hoy.weekday()), N, sorted(udn or []), cliente_prefijo)
+
+        cached = self._reporte_en_cache(clave, settings.REPORT_CACHE_SECONDS)
+        if cached is not None:
+            return cached
+        if not settings.SHARED_SINGLE_FLIGHT:
+            return self._generar_reporte(database_key, cancel_event, N, fan_out, hoy, udn, cliente_prefijo, clave)
+
+        lock = FileLock(f"reporte-{clave}")
+        esperando_desde = time.time()
+        if not lock.acquire(timeout=ESPERA_REPORTE_SEGUNDOS, cancel_event=cancel_event):
+            if cancel_event is not None and cancel_event.is_set():
+                return {
+                    "status": "error",
+                    "message": "Reporte cancelado: la petición fue abandonada"
+                }
+            logger.warning("Tiempo agotado esperando el mismo reporte en otro proceso, se construye de nuevo")
+            return self._generar_reporte(database_key, cancel_event, N, fan_out, hoy, udn, cliente_prefijo, clave)
+        try:
+            # Reporte que otro proceso terminó mientras se esperaba el candado
+            cached = self._reporte_en_cache(clave, max(settings.REPORT_CACHE_SECONDS, time.time() - esperando_desde))
+            if cached is not None:
+                return cached
+            return self._generar_reporte(database_key, cancel_event, N, fan_out, hoy, udn, cliente_prefijo, clave)
+        finally:
+            lock.release()
+
+    @staticmethod
+    def _reporte_en_cache(clave: str, max_age_seconds: float) -> Optional[Dict[str, Any]]:
+        if max_age_seconds <= 0:
+            return None
+        entry = shared_cache.get(REPORTE, clave, max_age_seconds)
+        if entry is None:
+            return None
+        meta, excel_bytes = entry
+        logger.info(f"Reporte {meta['report_name']} servido desde la caché compartida")
+        return {
+            "status": "success",
+            "report_name": meta["report_name"],
+            "row_count": meta["row_count"],
+            "file_size": len(excel_bytes),
+            "data": excel_bytes,
+            "source": "shared_cache"
+        }
+
+    def _generar_reporte(
+        self,
+        database_key: str,
+        cancel_event: Optional[threading.Event],
+        N: int,
+        fan_out: Optional[bool],
+        hoy: dt.date,
+        udn: Optional[List[str]],
+        cliente_prefijo: Optional[str],
+        clave: str
+    ) -> Dict[str, Any]:
         try:
+            import polars as pl
+
             logger.info("Realizando cálculo de fechas")
-            # Cálculo de fechas (preservado para comparativa del usuario)
-            N = 8  # número de semanas completas a considerar
-            
-            fecha_ini = dt.date.today() - dt.timedelta(days=dt.date.today().weekday() + (N * 7))
-            fecha_fin = fecha_ini + dt.timedelta(days=(N * 7) - 1)
+            # Cálculo de fechas (preservado para comparativa del usuario), N es el número de semanas completas a considerar
+            fecha_ini, fecha_fin = rango_semanas(hoy, N)
             
             semanas_lst = pl.date_range(start=fecha_ini, end=fecha_ini + pl.duration(weeks=N-1), interval='1w', eager=True)
             archivo_salida = 'alerta_clientes_' + semanas_lst[-1].strftime('%y%m%d') + '.xlsx'
             
-            # query unica para reemplaza las 56 consultas individuales (8 semanas × 7 días) generadas por el ciclo
-            logger.info("Generando query")
-            query = f"""
-            SELECT *
-            FROM viajes_facturacion
-            WHERE start_date >= '{fecha_ini.strftime('%Y-%m-%d')}'
-            AND start_date <= '{fecha_fin.strftime('%Y-%m-%d')}'
-            """
-
-            # Ejecutar consulta
-            query_request = QueryRequest(
-                database_key=database_key,
-                query=query,
-                timeout=300
-            )
-            logger.info("Ejecutando query")
-            result = self.athena_service.execute_and_wait_query(query_request)
-            
-            if result["status"] == "error":
-                return result
+            usar_fan_out = settings.REPORT_FANOUT_ENABLED if fan_out is None else fan_out
+            with memory_stage("extraccion"):
+                if usar_fan_out:
+                    vl_sem = self._extraer_en_paralelo(database_key, fecha_ini, fecha_fin, cancel_event, udn, cliente_prefijo)
+                else:
+                    vl_sem = self._extraer_rango(database_key, fecha_ini, fecha_fin, cancel_event, udn, cliente_prefijo)
+            if isinstance(vl_sem, dict):
+                return vl_sem
             
-            # Realizar operaciones específicas con Polars
-            processed_data = self._procesar_datos_alerta_clientes(result, semanas_lst)
-            
-            # Generar Excel
-            logger.info("Generando documento xlsx")
-            excel_buffer = self._generar_excel(processed_data)
+            # clientes_op y el Excel se construyen en el pool de CPU; el DataFrame viaja como Arrow IPC
+            # y clientes_op se guarda en el historial para el endpoint de alertas
+            logger.info("Generando clientes_op y documento xlsx")
+            # El historial de /alertas se guarda por semana más reciente: solo la ventana completa (sin filtros y con
+            # REPORT_DEFAULT_WEEKS semanas) lo escribe, para que un reporte de otra ventana no reemplace ese archivo
+            ruta_historial = None
+            if settings.REPORT_HISTORY_KEEP > 0 and N == settings.REPORT_DEFAULT_WEEKS and not (udn or cliente_prefijo):
+                ruta_historial = report_store.path_for(REPORTE, database_key, semanas_lst[-1])
+            dimension_ipc = None
+            if settings.REPORT_CLIENT_DIMENSION:
+                dimension_ipc = to_ipc(client_dimension.update(database_key, vl_sem.select(['udn', 'cliente'])))
+            with span("AlertaClientesService.clientes_op_excel") as etapa:
+                row_count, excel_bytes, tiempos = cpu_pool.run(
+                    _etapa_final, to_ipc(vl_sem), semanas_lst, ruta_historial, dimension_ipc
+                )
+                etapa.set(row_count=row_count, excel_bytes=len(excel_bytes), **tiempos)
+            if ruta_historial is not None:
+                report_store.prune(REPORTE, database_key)
+            if settings.SHARED_SINGLE_FLIGHT or settings.REPORT_CACHE_SECONDS > 0:
+                shared_cache.put(REPORTE, clave, {"report_name": archivo_salida, "row_count": row_count}, excel_bytes)
             
             return {
                 "status": "success",
                 "report_name": archivo_salida,
-                "row_count": processed_data.height,
-                "file_size": len(excel_buffer.getvalue()),
-                "data": excel_buffer.getvalue()
+                "row_count": row_count,
+                "file_size": len(excel_bytes),
+                "data": excel_bytes
             }
             
         except Exception as e:
@@ -78,6 +208,73 @@ class AlertaClientesService:
                 "message": f"Error generando reporte: {str(e)}"
             }
     
+    def alertas(self, database_key: str = "bustrax", udn: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Clientes que cambiaron de estado en la semana más reciente del último reporte guardado (viajes_N_a_0 o viajes_0_a_N),
+        con sus viajes contra la semana anterior. Con un anti-join contra el reporte guardado anterior se separan
+        las alertas nuevas de las que ya se habían reportado, y se listan las que se resolvieron.
+        Devuelve None si aún no hay reportes guardados.
+        """
+        import polars as pl
+
+        semanas = report_store.semanas(REPORTE, database_key)
+        if not semanas:
+            return None
+
+        actual = report_store.read(REPORTE, database_key, semanas[-1])
+        anterior = report_store.read(REPORTE, database_key, semanas[-2]) if len(semanas) > 1 else None
+
+        alertas = self._alertas_semana(actual, semanas[-1], udn)
+        llaves = ['udn', 'cliente', 'alerta']
+        if anterior is not None:
+            previas = self._alertas_semana(anterior, semanas[-2], udn)
+            nuevas = alertas.join(previas.select(llaves), on=llaves, how='anti')
+            resueltas = previas.join(alertas.select(llaves), on=llaves, how='anti')
+        else:
+            nuevas, resueltas = alertas, alertas.clear()
+
+        return {
+            "status": "success",
+            "semana": semanas[-1],
+            "semana_reporte_anterior": semanas[-2] if len(semanas) > 1 else None,
+            "resumen": alertas.group_by('alerta').len(name='clientes').sort('alerta').to_dicts(),
+            "row_count": alertas.height,
+            "alertas": alertas.to_dicts(),
+            "nuevas": nuevas.to_dicts(),
+            "resueltas": resueltas.select(llaves).to_dicts(),
+        }
+
+    @staticmethod
+    def _alertas_semana(clientes_op: pl.DataFrame, ultima: dt.date, udn: Optional[List[str]] = None) -> pl.DataFrame:
+        """
+        Filas de la semana `ultima` (la del archivo guardado) con cambio de estado, con los viajes de la semana
+        anterior y la diferencia; un reporte sin filas devuelve un DataFrame vacío
+        """
+        import polars as pl
+
+        if udn:
+            clientes_op = clientes_op.filter(pl.col('udn').is_in(udn))
+        semana_anterior = (
+            clientes_op
+            .filter(pl.col('fecha_ini') == pl.lit(ultima) - pl.duration(weeks=1))
+            .select(['udn', 'cliente', pl.col('viajes').alias('viajes_semana_anterior')])
+        )
+        return (
+            clientes_op
+            .filter((pl.col('fecha_ini') == ultima) & ((pl.col('viajes_N_a_0') == 1) | (pl.col('viajes_0_a_N') == 1)))
+            .join(semana_anterior, on=['udn', 'cliente'], how='left')
+            .select(
+                'udn',
+                'cliente',
+                'fecha_ini',
+                pl.when(pl.col('viajes_N_a_0') == 1).then(pl.lit('perdido')).otherwise(pl.lit('recuperado')).alias('alerta'),
+                'viajes',
+                'viajes_semana_anterior',
+                (pl.col('viajes').cast(pl.Int64) - pl.col('viajes_semana_anterior').cast(pl.Int64)).alias('cambio'),
+            )
+            .sort(['udn', 'cliente'])
+        )
+
     # def _procesar_datos_alerta_clientes(self, query_result: Dict[str, Any]) -> pl.DataFrame:
     #     """
     #     Realiza operaciones específicas para el reporte alerta_clientes usando Polars
@@ -104,6 +301,308 @@ class AlertaClientesService:
         Realiza operaciones específicas para el reporte alerta_clientes usando Polars
         """
         logger.info("Procesando Datos con Polars")
+        df = self._crear_dataframe(query_result)
+        
+        logger.info("Primera transformación del dataframe: vl_sem")
+        vl_sem = self._viajes_por_semana(df)
+        
+        clientes_op = self._clientes_op(vl_sem, semanas_lst)
+        
+        logger.info("Data frame clientes_op creado con éxito")
+        return clientes_op
+
+    @traced()
+    def _extraer_rango(
+        self,
+        database_key: str,
+        desde: dt.date,
+        hasta: dt.date,
+        cancel_event: Optional[threading.Event] = None,
+        udn: Optional[List[str]] = None,
+        cliente_prefijo: Optional[str] = None
+    ) -> Any:
+        """
+        Consulta los viajes de un rango de fechas (opcionalmente de ciertas udn y clientes) y los agrega por semana.
+        Devuelve el DataFrame (udn, cliente, fecha_ini, viajes) o el dict de error.
+        """
+        from app.domain.schemas.viajes_facturacion import schema_vf
+
+        # query unica para reemplaza las 56 consultas individuales (8 semanas × 7 días) generadas por el ciclo
+        # Las fechas viajan como parámetros: el texto del SQL es siempre el mismo y se registra como prepared statement
+        logger.info(f"Generando query {desde} - {hasta}")
+        columnas = ', '.join(f'"{c}"' for c in table_catalog.project(database_key, "viajes_facturacion", COLUMNAS_VIAJES))
+        parametros = [desde.strftime('%Y-%m-%d'), hasta.strftime('%Y-%m-%d')]
+        # Los filtros opcionales también son parámetros; cada combinación de filtros es un SQL distinto
+        # y se registra con su propio prepared statement
+        filtros = ""
+        prepared_statement = "alerta_clientes"
+        if udn:
+            filtros += f"\n        AND \"business_unit\" IN ({', '.join('?' for _ in udn)})"
+            parametros.extend(udn)
+            prepared_statement += f"_udn{len(udn)}"
+        if cliente_prefijo:
+            filtros += "\n        AND starts_with(\"group\", ?)"
+            parametros.append(cliente_prefijo)
+            prepared_statement += "_cliente"
+        query = f"""
+        SELECT {columnas}
+        FROM viajes_facturacion
+        WHERE start_date >= ?
+        AND start_date <= ?{filtros}
+        """
+
+        # Ejecutar consulta
+        query_request = QueryRequest(
+            database_key=database_key,
+            query=query,
+            timeout=300,
+            parameters=parametros,
+            priority="batch"
+        )
+        logger.info("Ejecutando query")
+        result = self.athena_service.execute_and_wait_query(
+            query_request, cancel_event, fetch_results=False, prepared_statement=prepared_statement
+        )
+        
+        if result["status"] == "error":
+            return result
+        
+        # Realizar operaciones específicas con Polars
+        logger.info("Procesando Datos con Polars por bloques")
+        paginas = self.athena_service.iter_query_results(database_key, result["query_execution_id"])
+        schema = {c: schema_vf[c] for c in COLUMNAS_VIAJES}
+        with span("AlertaClientesService.bloques", desde=str(desde), hasta=str(hasta)), memory_stage("bloques"):
+            vl_sem = self._viajes_por_semana_por_bloques(paginas, schema, cancel_event)
+        if vl_sem is None:
+            return {
+                "status": "error",
+                "message": "Reporte cancelado: la petición fue abandonada"
+            }
+        return vl_sem
+
+    def _extraer_en_paralelo(
+        self,
+        database_key: str,
+        desde: dt.date,
+        hasta: dt.date,
+        cancel_event: Optional[threading.Event] = None,
+        udn: Optional[List[str]] = None,
+        cliente_prefijo: Optional[str] = None
+    ) -> Any:
+        """
+        Divide el rango en sub-rangos de REPORT_FANOUT_SLICE_DAYS días y los consulta con hasta
+        REPORT_FANOUT_CONCURRENCY consultas simultáneas. Cada sub-rango se procesa con Polars en cuanto termina,
+        mientras los demás siguen en Athena, y se reintenta por separado hasta REPORT_FANOUT_RETRIES veces
+        salvo que el error no sea reintentable (FATAL, p. ej. un SQL inválido o el circuito abierto).
+
+        Todos los sub-rangos comparten un evento de detención: el primer sub-rango fallido (o cancel_event) lo activa,
+        las consultas en curso se cancelan en Athena y se devuelve el error sin esperar a que terminen.
+        """
+        import polars as pl
+
+        sub_rangos = dividir_rango(desde, hasta, settings.REPORT_FANOUT_SLICE_DAYS)
+        logger.info(f"Consultando {len(sub_rangos)} sub-rangos en paralelo")
+
+        detener = threading.Event()
+        fallos: List[Dict[str, Any]] = []
+        fallos_lock = threading.Lock()
+
+        def extraer_con_reintentos(sub_desde: dt.date, sub_hasta: dt.date) -> Any:
+            for intento in range(settings.REPORT_FANOUT_RETRIES + 1):
+                resultado = self._extraer_rango(database_key, sub_desde, sub_hasta, detener, udn, cliente_prefijo)
+                if not isinstance(resultado, dict):
+                    return resultado
+                if detener.is_set():
+                    break
+                logger.warning(f"Sub-rango {sub_desde} - {sub_hasta} fallido (intento {intento + 1}): {resultado.get('message')}")
+                if classify_error_result(resultado) == FATAL:
+                    break
+            with fallos_lock:
+                fallos.append(resultado)
+            detener.set()
+            return resultado
+
+        parciales = []
+        executor = ThreadPoolExecutor(max_workers=settings.REPORT_FANOUT_CONCURRENCY, thread_name_prefix="alerta_fanout")
+        # Cada sub-rango corre con una copia del contexto para que sus spans cuelguen del span del reporte
+        pendientes = {
+            executor.submit(contextvars.copy_context().run, extraer_con_reintentos, d, h)
+            for d, h in sub_rangos
+        }
+        try:
+            while pendientes:
+                terminados, pendientes = wait(pendientes, timeout=ESPERA_CANCELACION_SEGUNDOS, return_when=FIRST_COMPLETED)
+                if cancel_event is not None and cancel_event.is_set():
+                    detener.set()
+                if detener.is_set():
+                    # Un sub-rango falló (o se abandonó la petición): el reporte no se puede completar
+                    with fallos_lock:
+                        if fallos:
+                            return fallos[0]
+                    return {
+                        "status": "error",
+                        "message": "Reporte cancelado: la petición fue abandonada"
+                    }
+                parciales.extend(future.result() for future in terminados)
+        finally:
+            # Si se sale con sub-rangos pendientes, los que están en curso ven `detener` y cancelan su consulta
+            if pendientes:
+                detener.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        return (
+            pl.concat(parciales)
+            .group_by(['udn', 'cliente', 'fecha_ini'])
+            .agg(viajes=pl.col('viajes').sum().cast(pl.UInt32))
+        )
+
+    def _viajes_por_semana_por_bloques(
+        self,
+        paginas: Iterable[Dict[str, Any]],
+        schema: Dict[str, Any],
+        cancel_event: Optional[threading.Event] = None
+    ) -> Optional[pl.DataFrame]:
+        """
+        Agrega las páginas de resultados en bloques de REPORT_CHUNK_ROWS filas. Cada bloque se reduce a parciales
+        (udn, cliente, semana) y al final los parciales se suman; solo un bloque de filas crudas vive en memoria a la vez.
+        Con REPORT_SPILL_TO_DISK los parciales se escriben en Parquet en lugar de mantenerse en memoria.
+        Los bloques se procesan en el pool de CPU mientras se leen las páginas siguientes, con a lo más
+        CPU_POOL_WORKERS bloques pendientes. Devuelve None si se activa cancel_event.
+        """
+        import polars as pl
+
+        spill_dir = None
+        if settings.REPORT_SPILL_TO_DISK:
+            tmp_root = Path(settings.DATA_DIR) / "tmp"
+            tmp_root.mkdir(parents=True, exist_ok=True)
+            spill_dir = tempfile.TemporaryDirectory(dir=tmp_root, prefix="alerta_clientes_")
+
+        try:
+            parciales: List[Any] = []
+            pendientes: List[Any] = []
+            columns: List[str] = []
+            bloque: List[List[str]] = []
+            tiempos = {"paginas": 0, "filas": 0, "paginado_ms": 0.0, "csv_ms": 0.0, "polars_ms": 0.0}
+
+            def recibir_parcial():
+                ipc, tiempos_bloque = pendientes.pop(0).result()
+                tiempos["csv_ms"] += tiempos_bloque["csv_ms"]
+                tiempos["polars_ms"] += tiempos_bloque["polars_ms"]
+                parcial = from_ipc(ipc)
+                if spill_dir is not None:
+                    path = Path(spill_dir.name) / f"parcial_{len(parciales):05d}.parquet"
+                    parcial.write_parquet(path)
+                    parciales.append(path)
+                else:
+                    parciales.append(parcial)
+
+            def cerrar_bloque():
+                pendientes.append(cpu_pool.submit(_etapa_bloque, columns, bloque, schema))
+                if len(pendientes) > cpu_pool.workers:
+                    recibir_parcial()
+
+            try:
+                inicio_pagina = time.perf_counter()
+                for pagina in paginas:
+                    tiempos["paginado_ms"] += (time.perf_counter() - inicio_pagina) * 1000
+                    tiempos["paginas"] += 1
+                    tiempos["filas"] += len(pagina["data"])
+                    if cancel_event is not None and cancel_event.is_set():
+                        return None
+                    columns = pagina["columns"]
+                    bloque.extend(pagina["data"])
+                    if len(bloque) >= settings.REPORT_CHUNK_ROWS:
+                        cerrar_bloque()
+                        bloque = []
+                    inicio_pagina = time.perf_counter()
+                if bloque or not (parciales or pendientes):
+                    cerrar_bloque()
+                    bloque = []
+                while pendientes:
+                    recibir_parcial()
+            finally:
+                # Los bloques que quedaron pendientes al cancelar se descartan
+                pendientes.clear()
+                etapa = current_span()
+                if etapa is not None:
+                    etapa.set(**{k: round(v, 1) if isinstance(v, float) else v for k, v in tiempos.items()})
+
+            logger.info(f"Combinando {len(parciales)} bloques parciales")
+            with memory_stage("combinar_bloques"):
+                partes = pl.scan_parquet(parciales) if spill_dir is not None else pl.concat(parciales).lazy()
+                return (
+                    partes
+                    .group_by(['udn', 'cliente', 'fecha_ini'])
+                    .agg(viajes=pl.col('viajes').sum().cast(pl.UInt32))
+                    .collect()
+                )
+        finally:
+            if spill_dir is not None:
+                spill_dir.cleanup()
+
+    @staticmethod
+    def _clientes_op(vl_sem: pl.DataFrame, semanas_lst, dimension: Optional[pl.DataFrame] = None) -> pl.DataFrame:
+        """
+        Completa la malla udn × cliente × semana y marca los cambios de estado entre semanas consecutivas.
+
+        Con la dimensión de clientes, udn y cliente se codifican como Enum con las categorías ordenadas de la dimensión
+        (el orden de los códigos es el orden alfabético), así los joins, el ordenamiento y la ventana comparan enteros
+        en lugar de cadenas; la malla sale de las filas de la dimensión presentes en vl_sem. Al final las llaves
+        vuelven a texto, el resultado es el mismo que sin dimensión.
+        """
+        import polars as pl
+
+        logger.info("Segunda transformación del dataframe: udn_clientes")
+        with memory_stage("cross_join"):
+            if dimension is not None:
+                tipos = {c: pl.Enum(dimension[c].drop_nulls().unique().sort()) for c in ['udn', 'cliente']}
+                vl_sem = vl_sem.with_columns([pl.col(c).cast(tipo) for c, tipo in tipos.items()])
+                claves = (
+                    dimension
+                    .with_columns([pl.col(c).cast(tipo) for c, tipo in tipos.items()])
+                    .join(vl_sem.select(['udn', 'cliente']), on=['udn', 'cliente'], how='semi', nulls_equal=True)
+                )
+            else:
+                claves = vl_sem.select(['udn', 'cliente']).unique()
+            udn_clientes = (
+                claves
+                .sort(by=['udn', 'cliente'], descending=[False, False])
+                .join(pl.DataFrame({'fecha_ini': semanas_lst}), how='cross')
+            )
+        
+        logger.info("Tercera transformación del dataframe: clientes_op (resultado final)")
+        with memory_stage("clientes_op"):
+            clientes_op = (
+                udn_clientes
+                .join(vl_sem, on=['udn', 'cliente', 'fecha_ini'], how='left')
+                .with_columns(
+                    viajes=pl.col('viajes').fill_null(0)
+                )
+                .sort(by=['udn', 'cliente', 'fecha_ini'], descending=[False, False, False])
+                .with_columns(
+                    viajes_prev=pl.col('viajes').shift(1).over(['udn', 'cliente'])
+                )
+                .with_columns(
+                    viajes_N_a_0=((pl.col('viajes_prev').is_not_null()) & (pl.col('viajes') == 0) & (pl.col('viajes_prev') > 0)).cast(pl.Int8),
+                    viajes_0_a_N=((pl.col('viajes_prev').is_not_null()) & (pl.col('viajes') > 0) & (pl.col('viajes_prev') == 0)).cast(pl.Int8),
+                )
+                .drop(['viajes_prev'])
+            )
+            if dimension is not None:
+                clientes_op = clientes_op.with_columns(pl.col('udn').cast(pl.String), pl.col('cliente').cast(pl.String))
+        
+        return clientes_op
+    
+    @staticmethod
+    def _crear_dataframe(query_result: Dict[str, Any], schema: Dict[str, Any] = None) -> pl.DataFrame:
+        """
+        Crea el DataFrame de viajes_facturacion a partir del resultado de Athena
+        """
+        #schemas del cliente
+        from app.domain.schemas.viajes_facturacion import schema_vf
+
+        import polars as pl
+
         columns = query_result.get("columns", [])
         data = query_result.get("data", [])
         
@@ -114,16 +613,17 @@ class AlertaClientesService:
         
         
         # Crear un buffer CSV en memoria
-        csv_buffer = io.StringIO()
-        writer = csv.writer(csv_buffer)
-        
-        # Escribir headers
-        writer.writerow(columns)
-        # Escribir datos
-        writer.writerows(data)
-        
-        csv_content = csv_buffer.getvalue()
-        csv_buffer.close()
+        with memory_stage("csv"):
+            csv_buffer = io.StringIO()
+            writer = csv.writer(csv_buffer)
+            
+            # Escribir headers
+            writer.writerow(columns)
+            # Escribir datos
+            writer.writerows(data)
+            
+            csv_content = csv_buffer.getvalue()
+            csv_buffer.close()
         
         # Leer usando read_csv con ignore_errors=True (método probado por el usuario)
         # Si no se usa este metodo y se intenta realizar un casteo de los datos desde un dataframe normal de polars,
@@ -132,15 +632,25 @@ class AlertaClientesService:
         # en este caso, existen columnas que contienen datos númericos mezclados con datos strings que ignore_errors=True se encarga de manejar y por ello no le daba 
         # errores al crear el dataframe
         # Nota: reportar esto al líder del proyecto para comparar datos en data lake.
-        df = pl.read_csv(
-            csv_content.encode('utf-8'),
-            schema=schema_vf,
-            ignore_errors=True,
-            null_values=["", "NULL", "null"]
-        )
-        
-        logger.info("Primera transformación del dataframe: vl_sem")
-        vl_sem = (
+        with memory_stage("dataframe"):
+            return pl.read_csv(
+                csv_content.encode('utf-8'),
+                schema=schema or schema_vf,
+                ignore_errors=True,
+                null_values=["", "NULL", "null"]
+            )
+
+    @staticmethod
+    def _viajes_por_semana(df: pl.DataFrame) -> pl.DataFrame:
+        """
+        Cuenta los viajes válidos por udn, cliente y semana (lunes a domingo)
+        """
+        #schemas del cliente
+        from app.domain.schemas.viajes_facturacion import rename_vf
+
+        import polars as pl
+
+        return (
             df
             .rename(rename_vf)
             .filter(
@@ -155,38 +665,9 @@ class AlertaClientesService:
             .group_by_dynamic('fecha_ini', group_by=['udn', 'cliente'], every='1w', start_by='monday', closed='left', label='left')
             .agg(viajes=pl.col('cliente').count())
         )
-        
-        logger.info("Segunda transformación del dataframe: udn_clientes")
-        udn_clientes = (
-            vl_sem
-            .select(['udn', 'cliente'])
-            .unique()
-            .sort(by=['udn', 'cliente'], descending=[False, False])
-            .join(pl.DataFrame({'fecha_ini': semanas_lst}), how='cross')
-        )
-        
-        logger.info("Tercera transformación del dataframe: clientes_op (resultado final)")
-        clientes_op = (
-            udn_clientes
-            .join(vl_sem, on=['udn', 'cliente', 'fecha_ini'], how='left')
-            .with_columns(
-                viajes=pl.col('viajes').fill_null(0)
-            )
-            .sort(by=['udn', 'cliente', 'fecha_ini'], descending=[False, False, False])
-            .with_columns(
-                viajes_prev=pl.col('viajes').shift(1).over(['udn', 'cliente'])
-            )
-            .with_columns(
-                viajes_N_a_0=((pl.col('viajes_prev').is_not_null()) & (pl.col('viajes') == 0) & (pl.col('viajes_prev') > 0)).cast(pl.Int8),
-                viajes_0_a_N=((pl.col('viajes_prev').is_not_null()) & (pl.col('viajes') > 0) & (pl.col('viajes_prev') == 0)).cast(pl.Int8),
-            )
-            .drop(['viajes_prev'])
-        )
-        
-        logger.info("Data frame clientes_op creado con éxito")
-        return clientes_op
     
-    def _generar_excel(self, df: pl.DataFrame) -> BytesIO:
+    @staticmethod
+    def _generar_excel(df: pl.DataFrame) -> BytesIO:
         """Genera el archivo Excel a partir del DataFrame de Polars"""
         output = BytesIO()
         
@@ -202,4 +683,43 @@ class AlertaClientesService:
         )
         
         output.seek(0)
-        return output
\ No newline at end of file
+        return output
+
+
+def _etapa_bloque(columns: List[str], data: List[List[str]], schema: Dict[str, Any]) -> tuple:
+    """
+    Etapa de CPU por bloque (corre en el pool): filas de Athena -> parciales (udn, cliente, semana) en Arrow IPC.
+    Devuelve (ipc, tiempos en ms) para las trazas.
+    """
+    inicio = time.perf_counter()
+    df = AlertaClientesService._crear_dataframe({"columns": columns, "data": data}, schema=schema)
+    csv_ms = (time.perf_counter() - inicio) * 1000
+    inicio = time.perf_counter()
+    with memory_stage("viajes_por_semana"):
+        ipc = to_ipc(AlertaClientesService._viajes_por_semana(df))
+    return ipc, {"csv_ms": csv_ms, "polars_ms": (time.perf_counter() - inicio) * 1000}
+
+
+def _etapa_final(
+    vl_sem_ipc: bytes,
+    semanas_lst,
+    ruta_historial: Optional[Path] = None,
+    dimension_ipc: Optional[bytes] = None
+) -> tuple:
+    """
+    Etapa de CPU final (corre en el pool): clientes_op y su Excel; devuelve (filas, bytes del xlsx, tiempos en ms).
+    Si se indica ruta_historial, clientes_op se guarda ahí en Parquet; con dimension_ipc las llaves se codifican como Enum.
+    """
+    inicio = time.perf_counter()
+    dimension = from_ipc(dimension_ipc) if dimension_ipc is not None else None
+    clientes_op = AlertaClientesService._clientes_op(from_ipc(vl_sem_ipc), semanas_lst, dimension)
+    if ruta_historial is not None:
+        write_parquet_atomic(clientes_op, ruta_historial)
+    clientes_op_ms = (time.perf_counter() - inicio) * 1000
+    inicio = time.perf_counter()
+    with memory_stage("excel"):
+        excel = AlertaClientesService._generar_excel(clientes_op).getvalue()
+    return clientes_op.height, excel, {
+        "clientes_op_ms": round(clientes_op_ms, 1),
+        "excel_ms": round((time.perf_counter() - inicio) * 1000, 1),
+    }
@@ -1,7 +1,9 @@
-from typing import Dict, Any
+import threading
+from typing import Dict, Any, Iterator, List, Optional, Union
 from app.core.database.athena.repositories.athena_repository import AthenaRepository
 
 from app.core.models.athena_models import QueryRequest
+from app.core.models.query_result import QueryResult
 
 class AthenaService:
     def __init__(self, athena_repository: AthenaRepository = None):
@@ -19,11 +21,22 @@ class AthenaService:
         """
         return self.athena_repository.health_check_all()
     
-    def execute_query(self, query_request: QueryRequest) -> Dict[str, Any]:
+    def execute_query(self, query_request: QueryRequest, scan: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Ejecuta una consulta en la base de datos deseada de Athena
         """
-        return self.athena_repository.execute_query(query_request)
+        return self.athena_repository.execute_query(query_request, scan)
+
+    def preflight(
+        self,
+        query_request: QueryRequest,
+        cancel_event: Optional[threading.Event] = None,
+        explain: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Estima el escaneo de una consulta sin ejecutarla y aplica el presupuesto de escaneo de su base de datos
+        """
+        return self.athena_repository.preflight(query_request, cancel_event, explain)
     
     def get_available_databases(self) -> Dict[str, str]:
         """
@@ -31,14 +44,65 @@ class AthenaService:
         """
         return self.athena_repository.list_available_databases()
     
-    def get_query_results(self, database_key: str, query_execution_id: str) -> Dict[str, Any]:
+    def get_query_results(self, database_key: str, query_execution_id: str) -> Union[QueryResult, Dict[str, Any]]:
         """
         Obtiene resultados de una consulta por su ID de ejecución para verificación
         """
         return self.athena_repository.get_query_results(database_key, query_execution_id)
 
-    def execute_and_wait_query(self, query_request: QueryRequest) -> Dict[str, Any]:
+    def cancel_query(self, database_key: str, query_execution_id: str) -> Dict[str, Any]:
+        """
+        Cancela una consulta en ejecución por su ID
+        """
+        return self.athena_repository.cancel_query(database_key, query_execution_id)
+
+    def list_in_flight(self) -> Dict[str, Dict[str, float]]:
+        """
+        Lista las consultas en ejecución iniciadas por este proceso
+        """
+        return self.athena_repository.list_in_flight()
+
+    def describe_workgroups(self) -> List[Dict[str, Any]]:
+        """
+        Obtiene los workgroups configurados y su carga actual
+        """
+        return self.athena_repository.describe_workgroups()
+
+    def describe_circuit_breakers(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Obtiene el estado de los circuitos de Athena (closed, open, half_open) por base de datos
+        """
+        return self.athena_repository.describe_circuit_breakers()
+
+    def iter_query_results(
+        self,
+        database_key: str,
+        query_execution_id: str,
+        next_token: Optional[str] = None,
+        source: Optional[str] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Recorre los resultados de una consulta página por página, sin acumularlos en memoria.
+        `source` indica de dónde salió next_token (ver results_source).
+        """
+        return self.athena_repository.iter_query_results(database_key, query_execution_id, next_token, source)
+
+    def results_source(self, query_execution_id: str) -> str:
+        """
+        De dónde se leerían hoy los resultados de una ejecución: "store" (almacén local) o "athena"
+        """
+        return self.athena_repository.results_source(query_execution_id)
+
+    def execute_and_wait_query(
+        self,
+        query_request: QueryRequest,
+        cancel_event: Optional[threading.Event] = None,
+        fetch_results: bool = True,
+        scan: Optional[Dict[str, Any]] = None,
+        prepared_statement: Optional[str] = None
+    ) -> Union[QueryResult, Dict[str, Any]]:
         """
-        Ejecuta consulta SQL en texto y espera por los resultados (síncrono)
+        Ejecuta consulta SQL en texto y espera por los resultados (síncrono), cancelándola si se activa cancel_event.
+        prepared_statement es solo para los servicios internos (no es parte de QueryRequest ni de la API).
         """
-        return self.athena_repository.execute_and_wait_query(query_request)
\ No newline at end of file
+        return self.athena_repository.execute_and_wait_query(query_request, cancel_event, fetch_results, scan, prepared_statement)
\ No newline at end of file
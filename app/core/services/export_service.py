@@ -0,0 +1,317 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import threading
+import time
+import urllib.parse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.core.database.report_store import write_parquet_atomic
+from app.core.logger.config import LoggerConfig
+from app.core.models.athena_models import ExportRequest, QueryRequest
+from app.core.models.query_result import athena_typed
+from app.core.services.athena_service import AthenaService
+from app.core.settings.environments import settings
+from app.utils.file_lock import FileLock
+from app.utils.sql import query_fingerprint
+from app.utils.tracing import traced
+
+# Nota: Path(__file__).stem == __name__.split('.')[-1]
+logger = LoggerConfig(file_name=Path(__file__).stem,debug=True,root_file=__name__).get_logger()
+
+# Carpeta de partición para valores nulos, la misma que usan Hive y Athena
+HIVE_NULL = "__HIVE_DEFAULT_PARTITION__"
+
+# Archivo con el progreso de la exportación dentro de la carpeta del dataset
+PROGRESS_FILE = "_progress.json"
+
+
+def partition_path(columns: List[str], values: tuple) -> str:
+    """
+    Ruta relativa estilo Hive de una partición: part_year=2024/part_mont=5/part_day=17
+    """
+    parts = []
+    for column, value in zip(columns, values):
+        text = HIVE_NULL if value is None or value == "" else urllib.parse.quote(str(value), safe=" -_.")
+        parts.append(f"{column}={text}")
+    return "/".join(parts)
+
+
+def escribir_bloque(
+    rows: List[List[str]],
+    columns: List[str],
+    column_types: List[str],
+    destino: Path,
+    partition_by: List[str],
+    indice: int,
+) -> Dict[str, Any]:
+    """
+    Convierte un bloque de filas de Athena a sus tipos y escribe un archivo part-<bloque>.parquet por partición.
+    El nombre depende solo del número de bloque, así repetir un bloque al reanudar reemplaza sus archivos.
+    """
+    import polars as pl
+
+    df = athena_typed(pl.DataFrame(rows, schema=[(c, pl.String) for c in columns], orient="row"), column_types)
+
+    if partition_by:
+        grupos = df.partition_by(partition_by, as_dict=True, include_key=False, maintain_order=True)
+    else:
+        grupos = {(): df}
+
+    nombre = f"part-{indice:05d}.parquet"
+    total_bytes = 0
+    particiones = []
+    for key, parte in grupos.items():
+        carpeta = partition_path(partition_by, key) if partition_by else ""
+        total_bytes += write_parquet_atomic(parte, destino / carpeta / nombre, settings.EXPORT_COMPRESSION)
+        particiones.append(carpeta)
+    return {"rows": df.height, "bytes": total_bytes, "files": len(grupos), "partitions": particiones}
+
+
+class ExportService:
+    """
+    Exporta el resultado de una consulta de Athena como dataset Parquet particionado estilo Hive en
+    `<DATA_DIR>/exports/<ambiente>/<nombre>/<col>=<valor>/.../part-NNNNN.parquet`, para trabajos posteriores
+    (Polars, DuckDB, Spark o una tabla externa de Athena).
+
+    Las páginas se acumulan en bloques de EXPORT_CHUNK_ROWS filas que escriben EXPORT_WRITERS hilos en paralelo
+    mientras se sigue leyendo de Athena. Cada bloque termina en un límite de página y, cuando todos los bloques
+    anteriores están escritos, se guarda en `_progress.json` el NextToken de la siguiente página; una exportación
+    interrumpida (error, cancelación o reinicio del servidor) se reanuda desde ahí con la misma petición.
+    Junto al token se guarda su origen (token_source: "store" o "athena"), porque los tokens del almacén local y
+    los de Athena no son intercambiables; si el origen ya no está disponible se vuelve a exportar desde el bloque 0.
+    """
+
+    def __init__(self, athena_service: AthenaService = None, base_dir: Optional[Path] = None):
+        self.athena_service = athena_service or AthenaService()
+        self.base_dir = base_dir or Path(settings.DATA_DIR) / "exports" / settings.ENVIRONMENT
+
+    @traced()
+    def exportar(self, export_request: ExportRequest, cancel_event: Optional[threading.Event] = None) -> Dict[str, Any]:
+        """
+        Ejecuta (o reanuda) una exportación y devuelve las filas, archivos y bytes escritos
+        """
+        # El candado es entre procesos: dos workers no pueden escribir el mismo dataset
+        en_curso = FileLock(f"export-{export_request.name}")
+        if not en_curso.acquire(timeout=0):
+            return {"status": "error", "message": f"Ya hay una exportación en curso de '{export_request.name}'"}
+        try:
+            return self._exportar(export_request, cancel_event)
+        finally:
+            en_curso.release()
+
+    def _exportar(self, export_request: ExportRequest, cancel_event: Optional[threading.Event]) -> Dict[str, Any]:
+        destino = self.base_dir / export_request.name
+        database = self.athena_service.get_available_databases().get(export_request.database_key, "")
+        huella = query_fingerprint(export_request.query, export_request.parameters, database)
+
+        progreso = self.progreso(export_request.name)
+        if progreso is not None and not export_request.restart:
+            if progreso["query_fingerprint"] != huella or progreso["partition_by"] != export_request.partition_by:
+                return {
+                    "status": "error",
+                    "message": f"El dataset '{export_request.name}' ya existe con otra consulta o particiones, use restart=true para reemplazarlo"
+                }
+            if progreso["status"] == "complete":
+                return self._resumen(progreso, destino, resumed=False)
+        elif destino.exists():
+            shutil.rmtree(destino)
+            progreso = None
+
+        resumed = progreso is not None
+        if not resumed:
+            result = self.athena_service.execute_and_wait_query(
+                QueryRequest(
+                    database_key=export_request.database_key,
+                    query=export_request.query,
+                    parameters=export_request.parameters,
+                    timeout=export_request.timeout,
+                    priority="batch"
+                ),
+                cancel_event=cancel_event,
+                fetch_results=False
+            )
+            if result["status"] == "error":
+                return result
+            progreso = {
+                "name": export_request.name,
+                "database_key": export_request.database_key,
+                "query_execution_id": result["query_execution_id"],
+                "query_fingerprint": huella,
+                "partition_by": export_request.partition_by,
+                "compression": settings.EXPORT_COMPRESSION,
+                "next_token": None,
+                "token_source": None,
+                "chunks": 0,
+                "rows": 0,
+                "files": 0,
+                "bytes": 0,
+                "partitions": [],
+                "status": "running",
+                "started_at": time.time(),
+            }
+            self._guardar_progreso(destino, progreso)
+        else:
+            progreso["status"] = "running"
+            logger.info(
+                f"Reanudando exportación {export_request.name} desde el bloque {progreso['chunks']} "
+                f"({progreso['rows']} filas ya escritas)"
+            )
+
+        try:
+            self._escribir(progreso, destino, cancel_event)
+        except Exception as e:
+            progreso["status"] = "error"
+            self._guardar_progreso(destino, progreso)
+            logger.error(f"Error en la exportación {export_request.name}: {str(e)}")
+            # Un ValueError es un error de la petición (p. ej. columnas de partición), reintentar no lo corrige
+            reanudable = "" if isinstance(e, ValueError) else ", se puede reanudar repitiendo la petición"
+            return {
+                "status": "error",
+                "message": f"Error en la exportación{reanudable}: {str(e)}",
+                "rows": progreso["rows"],
+                "bytes": progreso["bytes"],
+            }
+
+        if progreso["status"] == "cancelled":
+            return {
+                "status": "error",
+                "message": "Exportación cancelada, se puede reanudar repitiendo la petición",
+                "rows": progreso["rows"],
+                "bytes": progreso["bytes"],
+            }
+        return self._resumen(progreso, destino, resumed=resumed)
+
+    def progreso(self, name: str) -> Optional[Dict[str, Any]]:
+        """
+        Progreso guardado de una exportación, None si no existe
+        """
+        try:
+            return json.loads((self.base_dir / name / PROGRESS_FILE).read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+
+    def _escribir(self, progreso: Dict[str, Any], destino: Path, cancel_event: Optional[threading.Event]) -> None:
+        """
+        Lee las páginas pendientes y envía los bloques a los hilos de escritura, guardando el avance en orden
+        """
+        disponible = self.athena_service.results_source(progreso["query_execution_id"])
+        if progreso["next_token"] is not None and progreso.get("token_source") not in ("athena", disponible):
+            # El token es del almacén local y el resultado ya se expulsó: no se puede continuar, se empieza de nuevo
+            logger.warning(
+                f"El progreso de {progreso['name']} apunta a resultados que ya no están en el almacén local, "
+                "se exporta de nuevo desde el bloque 0"
+            )
+            self._reiniciar(progreso, destino)
+        if progreso["next_token"] is None:
+            progreso["token_source"] = disponible
+
+        partition_by = progreso["partition_by"]
+        writers = max(1, settings.EXPORT_WRITERS)
+        pendientes: deque = deque()
+        particiones = set(progreso["partitions"])
+        indice = progreso["chunks"]
+        buffer: List[List[str]] = []
+        columns: List[str] = []
+        column_types: List[str] = []
+
+        def confirmar(maximo: int) -> None:
+            # Solo se avanza el NextToken guardado cuando todos los bloques anteriores están en disco;
+            # espera hasta que queden como mucho `maximo` bloques en escritura
+            while pendientes and (len(pendientes) > maximo or pendientes[0][1].done()):
+                next_token, future = pendientes.popleft()
+                escrito = future.result()
+                particiones.update(escrito["partitions"])
+                progreso["chunks"] += 1
+                progreso["rows"] += escrito["rows"]
+                progreso["files"] += escrito["files"]
+                progreso["bytes"] += escrito["bytes"]
+                progreso["next_token"] = next_token
+                progreso["partitions"] = sorted(particiones)
+                self._guardar_progreso(destino, progreso)
+
+        pages = self.athena_service.iter_query_results(
+            progreso["database_key"], progreso["query_execution_id"], progreso["next_token"], progreso["token_source"]
+        )
+        with ThreadPoolExecutor(max_workers=writers, thread_name_prefix="export") as executor:
+            def enviar(next_token: Optional[str]) -> None:
+                nonlocal indice, buffer
+                future = executor.submit(escribir_bloque, buffer, columns, column_types, destino, partition_by, indice)
+                pendientes.append((next_token, future))
+                indice += 1
+                buffer = []
+                # Como mucho 2 bloques por hilo en memoria
+                confirmar(maximo=writers * 2 - 1)
+
+            try:
+                for page in pages:
+                    if not columns:
+                        columns, column_types = page["columns"], page["column_types"]
+                        faltantes = [c for c in partition_by if c not in columns]
+                        if faltantes:
+                            raise ValueError(f"Columnas de partición inexistentes en el resultado: {', '.join(faltantes)}")
+                    if cancel_event is not None and cancel_event.is_set():
+                        progreso["status"] = "cancelled"
+                        break
+                    buffer.extend(page["data"])
+                    if len(buffer) >= settings.EXPORT_CHUNK_ROWS:
+                        enviar(page["next_token"])
+                else:
+                    if buffer or indice == 0:
+                        enviar(None)
+            finally:
+                close = getattr(pages, "close", None)
+                if close is not None:
+                    close()
+                # Los bloques ya enviados se terminan de escribir también al cancelar o fallar
+                confirmar(maximo=0)
+
+        if progreso["status"] == "running":
+            progreso["status"] = "complete"
+            progreso["finished_at"] = time.time()
+            self._guardar_progreso(destino, progreso)
+        elif progreso["status"] == "cancelled":
+            self._guardar_progreso(destino, progreso)
+
+    def _reiniciar(self, progreso: Dict[str, Any], destino: Path) -> None:
+        """
+        Descarta los archivos y el avance de una exportación para volver a escribirla desde el primer bloque
+        """
+        for path in destino.iterdir():
+            if path.name == PROGRESS_FILE:
+                continue
+            if path.is_dir():
+                shutil.rmtree(path)
+            else:
+                path.unlink()
+        progreso.update(next_token=None, token_source=None, chunks=0, rows=0, files=0, bytes=0, partitions=[])
+        self._guardar_progreso(destino, progreso)
+
+    @staticmethod
+    def _guardar_progreso(destino: Path, progreso: Dict[str, Any]) -> None:
+        destino.mkdir(parents=True, exist_ok=True)
+        tmp_path = destino / f"{PROGRESS_FILE}.tmp"
+        tmp_path.write_text(json.dumps(progreso, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, destino / PROGRESS_FILE)
+
+    @staticmethod
+    def _resumen(progreso: Dict[str, Any], destino: Path, resumed: bool) -> Dict[str, Any]:
+        return {
+            "status": "success",
+            "name": progreso["name"],
+            "path": str(destino),
+            "query_execution_id": progreso["query_execution_id"],
+            "partition_by": progreso["partition_by"],
+            "compression": progreso["compression"],
+            "rows": progreso["rows"],
+            "files": progreso["files"],
+            "bytes": progreso["bytes"],
+            "partitions": len(progreso["partitions"]),
+            "resumed": resumed,
+            "elapsed_seconds": round(progreso.get("finished_at", time.time()) - progreso["started_at"], 3),
+        }
@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import datetime as dt
+from pathlib import Path
+from typing import Any, Dict, List, Optional, TYPE_CHECKING
+
+from app.core.database.athena.table_catalog import table_catalog
+from app.core.database.kpi_store import KpiStore, kpi_store
+from app.core.logger.config import LoggerConfig
+from app.core.models.athena_models import QueryRequest
+from app.core.services.alerta_clientes_service import AlertaClientesService, COLUMNAS_VIAJES
+from app.core.settings.environments import settings
+from app.utils.file_lock import FileLock
+
+if TYPE_CHECKING:
+    import polars as pl
+
+# Nota: Path(__file__).stem == __name__.split('.')[-1]
+logger = LoggerConfig(file_name=Path(__file__).stem,debug=True,root_file=__name__).get_logger()
+
+# Nombre del candado que evita dos actualizaciones simultáneas (programada + manual, o en varios workers de uvicorn)
+REFRESH_LOCK = "kpi-refresh"
+
+
+class IndicadoresService:
+    def __init__(self, store: KpiStore = None, alerta_clientes_service: AlertaClientesService = None):
+        self.store = store or kpi_store
+        self.alerta_clientes_service = alerta_clientes_service or AlertaClientesService()
+
+    def actualizar(self, database_key: str = None) -> Dict[str, Any]:
+        """
+        Actualiza de forma incremental los viajes semanales materializados.
+        Solo vuelve a consultar desde la última semana almacenada (que pudo quedar incompleta) hasta hoy.
+        """
+        refresh_lock = FileLock(REFRESH_LOCK)
+        if not refresh_lock.acquire(timeout=0):
+            return {
+                "status": "error",
+                "message": "Ya hay una actualización de indicadores en curso"
+            }
+        try:
+            import polars as pl
+            from app.domain.schemas.viajes_facturacion import schema_vf
+
+            database_key = database_key or settings.KPI_DATABASE_KEY
+            hoy = dt.date.today()
+            lunes_actual = hoy - dt.timedelta(days=hoy.weekday())
+
+            ultima_semana = self.store.ultima_semana()
+            desde = ultima_semana or lunes_actual - dt.timedelta(weeks=settings.KPI_HISTORY_WEEKS)
+
+            columnas = ', '.join(f'"{c}"' for c in table_catalog.project(database_key, "viajes_facturacion", COLUMNAS_VIAJES))
+            query = f"""
+            SELECT {columnas}
+            FROM viajes_facturacion
+            WHERE start_date >= ?
+            AND start_date <= ?
+            """
+
+            logger.info(f"Actualizando indicadores desde {desde} hasta {hoy}")
+            result = self.alerta_clientes_service.athena_service.execute_and_wait_query(
+                QueryRequest(
+                    database_key=database_key,
+                    query=query,
+                    timeout=300,
+                    parameters=[desde.strftime('%Y-%m-%d'), hoy.strftime('%Y-%m-%d')],
+                    priority="batch"
+                ),
+                prepared_statement="kpi_viajes_semanales"
+            )
+            if result["status"] == "error":
+                return result
+
+            # El resultado ya es columnar: se convierte al schema del cliente sin pasar por filas ni CSV
+            df = result.to_polars({c: schema_vf[c] for c in COLUMNAS_VIAJES})
+            nuevos = (
+                self.alerta_clientes_service._viajes_por_semana(df)
+                .rename({'fecha_ini': 'semana'})
+                .select(['udn', 'cliente', 'semana', pl.col('viajes').cast(pl.UInt32)])
+            )
+
+            limite_retencion = lunes_actual - dt.timedelta(weeks=settings.KPI_RETENTION_WEEKS)
+            existentes = self.store.read_viajes_semanales()
+            if existentes is not None:
+                nuevos = pl.concat([
+                    existentes.filter((pl.col('semana') < desde) & (pl.col('semana') >= limite_retencion)),
+                    nuevos,
+                ])
+            nuevos = nuevos.sort(['udn', 'cliente', 'semana'])
+
+            self.store.write_viajes_semanales(nuevos)
+            estado = {
+                "ultima_actualizacion": dt.datetime.now().isoformat(timespec='seconds'),
+                "database_key": database_key,
+                "desde": desde,
+                "hasta": hoy,
+                "filas_consultadas": result.get("row_count", 0),
+                "filas_almacenadas": nuevos.height,
+                "semanas": nuevos['semana'].n_unique(),
+            }
+            self.store.write_estado(estado)
+            logger.info(f"Indicadores actualizados: {nuevos.height} filas materializadas")
+
+            return {"status": "success", **estado}
+
+        except Exception as e:
+            logger.error(f"Error actualizando indicadores: {str(e)}")
+            return {
+                "status": "error",
+                "message": f"Error actualizando indicadores: {str(e)}"
+            }
+        finally:
+            refresh_lock.release()
+
+    def estado(self) -> Dict[str, Any]:
+        """
+        Metadatos de la última actualización del almacén
+        """
+        return self.store.read_estado()
+
+    def viajes_semanales_udn(self, udn: Optional[List[str]] = None, semanas: Optional[int] = None) -> Optional[pl.DataFrame]:
+        """
+        Viajes y clientes activos por udn y semana
+        """
+        import polars as pl
+
+        df = self._filtrar(udn, semanas)
+        if df is None:
+            return None
+
+        return (
+            df
+            .group_by(['udn', 'semana'])
+            .agg(
+                viajes=pl.col('viajes').sum(),
+                clientes_activos=pl.col('cliente').n_unique(),
+            )
+            .with_columns(self._semana_completa())
+            .sort(['udn', 'semana'])
+        )
+
+    def clientes_churn(self, udn: Optional[List[str]] = None, semanas: Optional[int] = None) -> Optional[pl.DataFrame]:
+        """
+        Clientes perdidos (viajes_N_a_0) y recuperados (viajes_0_a_N) por udn y semana
+        """
+        import polars as pl
+
+        # El filtro de semanas se aplica al final para que la primera semana solicitada tenga contra qué compararse
+        df = self._filtrar(udn, None)
+        if df is None:
+            return None
+        if df.is_empty():
+            return pl.DataFrame(schema={'udn': pl.String, 'semana': pl.Date})
+
+        semanas_lst = pl.date_range(start=df['semana'].min(), end=df['semana'].max(), interval='1w', eager=True)
+        clientes_op = self.alerta_clientes_service._clientes_op(df.rename({'semana': 'fecha_ini'}), semanas_lst)
+
+        return (
+            clientes_op
+            .group_by(['udn', 'fecha_ini'])
+            .agg(
+                clientes_activos=(pl.col('viajes') > 0).sum(),
+                clientes_perdidos=pl.col('viajes_N_a_0').cast(pl.UInt32).sum(),
+                clientes_recuperados=pl.col('viajes_0_a_N').cast(pl.UInt32).sum(),
+            )
+            .rename({'fecha_ini': 'semana'})
+            .filter(self._desde_semanas(semanas))
+            .with_columns(self._semana_completa())
+            .sort(['udn', 'semana'])
+        )
+
+    def _filtrar(self, udn: Optional[List[str]], semanas: Optional[int]) -> Optional[pl.DataFrame]:
+        import polars as pl
+
+        df = self.store.read_viajes_semanales()
+        if df is None:
+            return None
+        if udn:
+            df = df.filter(pl.col('udn').is_in(udn))
+        return df.filter(self._desde_semanas(semanas))
+
+    def _desde_semanas(self, semanas: Optional[int]) -> pl.Expr:
+        """Limita a las últimas `semanas` semanas contando la semana en curso"""
+        import polars as pl
+
+        if not semanas:
+            return pl.lit(True)
+        hoy = dt.date.today()
+        desde = hoy - dt.timedelta(days=hoy.weekday()) - dt.timedelta(weeks=semanas - 1)
+        return pl.col('semana') >= desde
+
+    def _semana_completa(self) -> pl.Expr:
+        """La semana en curso se marca como incompleta"""
+        import polars as pl
+
+        hoy = dt.date.today()
+        return (pl.col('semana') <= hoy - dt.timedelta(days=hoy.weekday() + 7)).alias('semana_completa')
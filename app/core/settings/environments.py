@@ -1,8 +1,9 @@
 import json
 import os
+from functools import cached_property
 from pydantic_settings import BaseSettings
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Any, Dict, List, Optional
 from app.utils.utils import find_dotenv
 
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
@@ -22,6 +23,22 @@ class Settings(BaseSettings):
     # Para manejo de múltiples bases de datos Athena 
     ATHENA_DATABASES: Optional[str] = '{"bustrax": "s3_bustrax", "analytics": "s3_prod_analytics"}'
 
+    ATHENA_WORKGROUP: str = 'primary'
+    # Enrutamiento entre varios workgroups/regiones, JSON con una lista de AthenaWorkgroupConfig. Ejemplo:
+    # '[{"name": "api", "priorities": ["interactive"]}, {"name": "reportes", "priorities": ["batch"], "region": "us-east-1"}]'
+    # Si no se define se usa un único workgroup con ATHENA_WORKGROUP, AWS_REGION y ATHENA_S3_OUTPUT_LOCATION
+    ATHENA_WORKGROUPS: Optional[str] = None
+    # Reutilización de resultados del lado de Athena para consultas idénticas (0 desactiva)
+    ATHENA_RESULT_REUSE_MINUTES: int = 0
+
+    # Backend de Athena: 'aws' o 'local' (motor SQL de Polars sobre archivos, para pruebas y benchmarks sin red)
+    ATHENA_BACKEND: str = 'aws'
+    ATHENA_LOCAL_DATA_DIR: str = './data/athena_local'
+    ATHENA_LOCAL_QUEUE_SECONDS: float = 0.0
+    ATHENA_LOCAL_RUN_SECONDS: float = 0.0
+    ATHENA_LOCAL_FAILURE_RATE: float = 0.0
+    ATHENA_LOCAL_THROTTLE_RATE: float = 0.0
+
     #FastApi
     API_PREFIX: str = '/demo/api/v1'
 
@@ -37,13 +54,107 @@ class Settings(BaseSettings):
     MONGO_PORT: str = '27017'
     MONGO_DB: str = 'tu_db'
 
-    @property
+    # Reintentos y circuito por base de datos ante limitación (ThrottlingException, TooManyRequestsException) o fallas temporales
+    ATHENA_RETRY_MAX_ATTEMPTS: int = 5
+    ATHENA_RETRY_BASE_SECONDS: float = 0.2
+    ATHENA_RETRY_MAX_SECONDS: float = 5.0
+    ATHENA_RETRY_BUDGET_RATIO: float = 0.1  # fichas de reintento que aporta cada llamada exitosa
+    ATHENA_RETRY_BUDGET_MAX: float = 20.0
+    ATHENA_BREAKER_FAILURE_THRESHOLD: int = 5
+    ATHENA_BREAKER_RESET_SECONDS: float = 30.0
+    ATHENA_BREAKER_HALF_OPEN_PROBES: int = 1
+
+    # Trazas (spans por capa): none | file | otlp
+    TRACING_EXPORTER: str = 'none'
+    TRACING_FILE: str = './data/traces/spans.jsonl'
+    TRACING_OTLP_ENDPOINT: str = 'http://localhost:4318/v1/traces'
+    TRACING_SERVICE_NAME: str = 'indicadores-excelencia-operativa'
+
+    # Perfil de memoria por petición con el encabezado X-Memory-Profile: 1 (solo development/devel)
+    MEMORY_PROFILE_TOP: int = 10  # sitios de asignación por etapa, 0 no toma snapshots
+    MEMORY_PROFILE_SAMPLE_MS: int = 10  # intervalo de muestreo del RSS
+    MEMORY_PROFILE_KEEP: int = 20  # perfiles recientes consultables en /test/memory
+
+    # Catálogo de metadatos de tablas (list_table_metadata / get_table_metadata)
+    CATALOG_ENABLED: bool = True
+    CATALOG_TTL_SECONDS: int = 3600
+    CATALOG_VALIDATE_ON_STARTUP: bool = True
+
+    # Arranque
+    WARMUP_ON_STARTUP: bool = True
+
+    # Almacenamiento local (volumen ./data en docker-compose)
+    DATA_DIR: str = './data'
+
+    # Almacén persistente de resultados de Athena (DATA_DIR/results)
+    RESULT_STORE_ENABLED: bool = True
+    RESULT_STORE_MAX_MB: int = 1024
+    RESULT_STORE_MAX_AGE_HOURS: int = 24
+    RESULT_STORE_REUSE_SECONDS: int = 0  # >0 reutiliza el resultado de una consulta con la misma huella sin ir a Athena
+
+    # Varios workers de uvicorn (--workers, WEB_CONCURRENCY) sobre el mismo DATA_DIR
+    WEB_CONCURRENCY: int = 1  # workers de uvicorn del ambiente; el pool de CPU por defecto se reparte entre ellos
+    SHARED_SINGLE_FLIGHT: bool = True  # una consulta o reporte idéntico se ejecuta una sola vez entre procesos (DATA_DIR/locks)
+    SHARED_CACHE_MAX_MB: int = 512  # caché compartida entre procesos (DATA_DIR/cache)
+    SHARED_CACHE_MAX_AGE_HOURS: int = 24
+
+    # Presupuesto de escaneo de las consultas ad hoc (/athena/query), estimado con el historial de la misma huella y EXPLAIN
+    QUERY_SCAN_BUDGET_MB: int = 0  # bytes estimados por consulta para las bases sin presupuesto propio, 0 = sin límite
+    QUERY_SCAN_BUDGETS: Optional[str] = None  # JSON por base de datos en MB, p. ej. '{"bustrax": 10240, "analytics": 51200}'
+    QUERY_SCAN_OVER_BUDGET: str = 'reject'  # reject | batch (se envía con prioridad batch a los workgroups de reportes)
+    QUERY_SCAN_EXPLAIN: bool = True  # sin historial se estima con EXPLAIN (TYPE IO), una consulta extra sin escaneo
+    QUERY_SCAN_HISTORY_KEEP: int = 20  # escaneos recientes que se conservan por huella (DATA_DIR/scan_history)
+
+    # Exportación de resultados a datasets Parquet particionados (DATA_DIR/exports)
+    EXPORT_CHUNK_ROWS: int = 100_000  # filas por bloque; cada bloque escribe un archivo por partición
+    EXPORT_WRITERS: int = 4  # hilos que escriben bloques en paralelo
+    EXPORT_COMPRESSION: str = 'zstd'
+
+    # Reporte alerta_clientes
+    REPORT_DEFAULT_WEEKS: int = 8
+    REPORT_MAX_WEEKS: int = 104
+    REPORT_CHUNK_ROWS: int = 50_000  # filas de Athena que se agregan por bloque
+    REPORT_SPILL_TO_DISK: bool = False  # guarda los parciales en DATA_DIR/tmp en lugar de memoria
+    REPORT_FANOUT_ENABLED: bool = False  # divide el rango de fechas en sub-rangos consultados en paralelo
+    REPORT_FANOUT_SLICE_DAYS: int = 7
+    REPORT_FANOUT_CONCURRENCY: int = 4
+    REPORT_FANOUT_RETRIES: int = 2
+    REPORT_CLIENT_DIMENSION: bool = True  # codifica udn y cliente con la dimensión de clientes (DATA_DIR/dimensiones)
+    REPORT_CACHE_SECONDS: int = 0  # >0 reutiliza el xlsx de un reporte con los mismos parámetros entre procesos
+    REPORT_HISTORY_KEEP: int = 12  # semanas de salida de clientes_op que se guardan para /alertas, 0 no guarda
+
+    # Pool para las etapas de CPU de los reportes (Polars, Excel)
+    CPU_POOL_MODE: str = 'process'  # process | thread | inline
+    CPU_POOL_WORKERS: int = 0  # 0 = la mitad de los núcleos repartida entre los WEB_CONCURRENCY workers
+    CPU_POOL_POLARS_THREADS: int = 0  # hilos de Polars por proceso, 0 = núcleos / CPU_POOL_WORKERS
+
+    # Indicadores consolidados materializados
+    KPI_DATABASE_KEY: str = 'bustrax'
+    KPI_HISTORY_WEEKS: int = 8
+    KPI_RETENTION_WEEKS: int = 52
+    KPI_REFRESH_INTERVAL_MINUTES: int = 60  # 0 desactiva la actualización programada
+
+    @cached_property
     def athena_databases(self) -> Dict[str, str]:
-        """Parse ATHENA_DATABASES from JSON string to dict"""
+        """Parse ATHENA_DATABASES from JSON string to dict (se parsea una sola vez por proceso)"""
         if self.ATHENA_DATABASES:
             return json.loads(self.ATHENA_DATABASES)
         return {"default": self.ATHENA_DEFAULT_DATABASE or "default"}
+
+    @cached_property
+    def athena_workgroups(self) -> List[Dict[str, Any]]:
+        """Parse ATHENA_WORKGROUPS from JSON string to list (se parsea una sola vez por proceso)"""
+        if self.ATHENA_WORKGROUPS:
+            return json.loads(self.ATHENA_WORKGROUPS)
+        return [{"name": self.ATHENA_WORKGROUP}]
     
+    @cached_property
+    def query_scan_budgets(self) -> Dict[str, int]:
+        """Parse QUERY_SCAN_BUDGETS from JSON string to dict (se parsea una sola vez por proceso)"""
+        if self.QUERY_SCAN_BUDGETS:
+            return json.loads(self.QUERY_SCAN_BUDGETS)
+        return {}
+
     # Solo para uso en local, colocar en la raiz el archivo .env deseado
     class Config:
         env_file = BASE_DIR / '.env' if (BASE_DIR / '.env').exists() else None
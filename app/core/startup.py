@@ -0,0 +1,115 @@
+import asyncio
+import datetime as dt
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Dict
+
+from fastapi import FastAPI
+
+from app.core.logger.config import LoggerConfig
+from app.core.settings.environments import settings
+
+# Nota: Path(__file__).stem == __name__.split('.')[-1]
+logger = LoggerConfig(file_name=Path(__file__).stem,debug=True,root_file=__name__).get_logger()
+
+# Resultado del último calentamiento, expuesto en el endpoint de depuración
+warmup_report: Dict[str, Any] = {"status": "pending"}
+
+
+def warm_up() -> Dict[str, Any]:
+    """
+    Precarga los módulos pesados, los clientes de Athena y el catálogo de tablas (validando los schemas del cliente)
+    para que la primera petición no pague el costo
+    """
+    stages = {}
+
+    start = time.perf_counter()
+    from app.core.database.athena.athena_factory import athena_factory
+    clients = athena_factory.warm_up()
+    stages["athena_clients_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    start = time.perf_counter()
+    import polars  # noqa: F401
+    import app.domain.schemas.viajes_facturacion  # noqa: F401
+    stages["polars_schemas_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    catalog = {}
+    if settings.CATALOG_ENABLED and settings.CATALOG_VALIDATE_ON_STARTUP:
+        start = time.perf_counter()
+        from app.core.database.athena.table_catalog import table_catalog
+        catalog = table_catalog.validate_all()
+        stages["catalog_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    return {
+        "status": "success",
+        "clients": clients,
+        "catalog": catalog,
+        "stages": stages,
+        "total_ms": round(sum(stages.values()), 1),
+    }
+
+
+async def _run_warm_up() -> None:
+    global warmup_report
+    try:
+        warmup_report = await asyncio.to_thread(warm_up)
+        logger.info(f"Calentamiento completado en {warmup_report['total_ms']} ms")
+    except Exception as e:
+        logger.error(f"Error durante el calentamiento: {str(e)}")
+        warmup_report = {"status": "error", "message": str(e)}
+
+
+async def _refresh_kpis_periodically() -> None:
+    """
+    Actualiza los indicadores materializados cada KPI_REFRESH_INTERVAL_MINUTES.
+    Con varios workers cada uno tiene este ciclo: se omite la actualización si otro ya la hizo en el intervalo.
+    Un error en una vuelta se registra y el ciclo continúa en el siguiente intervalo.
+    """
+    from app.core.services.indicadores_service import IndicadoresService
+
+    indicadores_service = IndicadoresService()
+    intervalo = dt.timedelta(minutes=settings.KPI_REFRESH_INTERVAL_MINUTES)
+    while True:
+        try:
+            ultima = indicadores_service.estado().get("ultima_actualizacion")
+            try:
+                ultima_dt = dt.datetime.fromisoformat(ultima) if ultima else None
+            except (TypeError, ValueError):
+                # Una fecha ilegible se trata como si no hubiera actualización; actualizar reescribe el estado
+                logger.warning(f"ultima_actualizacion ilegible en el estado de indicadores: {ultima!r}")
+                ultima_dt = None
+            if ultima_dt and dt.datetime.now() - ultima_dt < intervalo:
+                logger.info(f"Indicadores actualizados en {ultima}, se omite la actualización programada")
+            else:
+                result = await asyncio.to_thread(indicadores_service.actualizar)
+                if result["status"] == "error":
+                    logger.warning(f"Actualización programada de indicadores fallida: {result['message']}")
+        except Exception as e:
+            logger.error(f"Error en la actualización programada de indicadores: {str(e)}")
+        await asyncio.sleep(intervalo.total_seconds())
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Ciclo de vida de la aplicación: el calentamiento y las tareas programadas corren en segundo plano para no retrasar el arranque
+    """
+    background_tasks = []
+    if settings.WARMUP_ON_STARTUP:
+        background_tasks.append(asyncio.create_task(_run_warm_up()))
+    if settings.KPI_REFRESH_INTERVAL_MINUTES > 0:
+        background_tasks.append(asyncio.create_task(_refresh_kpis_periodically()))
+    yield
+    for task in background_tasks:
+        if not task.done():
+            task.cancel()
+
+    # Las consultas que siguen en Athena al apagar ya no tienen quién lea su resultado
+    from app.core.database.athena.athena_factory import athena_factory
+    cancelled = await asyncio.to_thread(athena_factory.cancel_all_in_flight)
+    if any(cancelled.values()):
+        logger.warning(f"Consultas canceladas al apagar: {cancelled}")
+
+    from app.utils.cpu_pool import cpu_pool
+    cpu_pool.shutdown()
@@ -371,3 +371,8 @@ rename_vf = {
     'start_date':'fecha_ini',
 }
 
+
+# Tabla de Athena que describe cada schema, para validarlos contra el catálogo al arrancar
+schemas_por_tabla = {
+    'viajes_facturacion': schema_vf,
+}
@@ -1,13 +1,61 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+import asyncio
+from typing import Any, Dict, Literal, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Request, status, Query
+from fastapi.responses import Response, StreamingResponse
+from app.core.database.athena.resilience import CIRCUIT_OPEN_CODE, THROTTLE_CODES
+from app.core.database.athena.scan_budget import SCAN_BUDGET_CODE
 from app.core.services.athena_service import AthenaService
-from app.core.models.athena_models import QueryRequest
+from app.core.services.export_service import ExportService
+from app.core.models.athena_models import ExportRequest, QueryRequest
 from app.core.settings.environments import settings
+from app.utils.cancellation import run_cancellable
+from app.utils.streaming import MEDIA_TYPES, stream_pages
 
 router = APIRouter(prefix="/athena", tags=["AWS Athena"])
 
 def get_athena_service() -> AthenaService:
     return AthenaService()
 
+def get_export_service() -> ExportService:
+    return ExportService()
+
+def error_status(result) -> int:
+    """
+    503 cuando Athena está limitado o degradado (el cliente puede reintentar), 422 si la consulta excede el
+    presupuesto de escaneo, 400 para los demás errores
+    """
+    if result.get("error_code") in THROTTLE_CODES or result.get("error_code") == CIRCUIT_OPEN_CODE:
+        return status.HTTP_503_SERVICE_UNAVAILABLE
+    if result.get("error_code") == SCAN_BUDGET_CODE:
+        return status.HTTP_422_UNPROCESSABLE_CONTENT
+    return status.HTTP_400_BAD_REQUEST
+
+def scan_headers(result) -> Dict[str, str]:
+    """
+    Escaneo estimado y real como encabezados, para las respuestas que no son JSON
+    """
+    scan = result.get("scan") or {}
+    return {
+        f"X-Scan-{name}": str(scan[key])
+        for name, key in (("Estimated-Bytes", "estimated_bytes"), ("Estimate-Source", "estimate_source"), ("Scanned-Bytes", "scanned_bytes"))
+        if scan.get(key) is not None
+    }
+
+async def check_scan_budget(request: Request, query_request: QueryRequest, athena_service: AthenaService) -> Tuple[QueryRequest, Dict[str, Any]]:
+    """
+    Pre-flight de costo de una consulta ad hoc: la rechaza si excede el presupuesto de escaneo de su base de datos
+    o la pasa a prioridad batch (QUERY_SCAN_OVER_BUDGET). Devuelve la petición a ejecutar y la estimación.
+    """
+    preflight = await run_cancellable(request, athena_service.preflight, query_request)
+    if preflight["status"] == "error":
+        raise HTTPException(
+            status_code=error_status(preflight),
+            detail=preflight["message"]
+        )
+    if preflight["priority"] != query_request.priority:
+        query_request = query_request.model_copy(update={"priority": preflight["priority"]})
+    return query_request, preflight["scan_estimate"]
+
 @router.get("/health")
 async def athena_health_check(
     database: str = Query("bustrax", description="Clave de la base de datos"),
@@ -46,6 +94,49 @@ async def athena_health_check_all(
         "results": results
     }
 
+@router.delete("/query/{query_execution_id}")
+async def cancel_query(
+    query_execution_id: str,
+    database: str = Query("bustrax", description="Clave de la base de datos"),
+    athena_service: AthenaService = Depends(get_athena_service)
+):
+    """
+    Cancela una consulta en ejecución por su ID para liberar capacidad de Athena
+    """
+    # Lee el estado y cancela en Athena (llamadas bloqueantes con reintentos): fuera del event loop
+    result = await asyncio.to_thread(athena_service.cancel_query, database, query_execution_id)
+
+    if result["status"] == "error":
+        raise HTTPException(
+            status_code=error_status(result),
+            detail=result["message"]
+        )
+
+    return result
+
+@router.get("/queries/in-flight")
+async def list_in_flight_queries(
+    athena_service: AthenaService = Depends(get_athena_service)
+):
+    """
+    Lista las consultas en ejecución iniciadas por este proceso y sus segundos transcurridos
+    """
+    return {
+        "in_flight": athena_service.list_in_flight()
+    }
+
+@router.get("/workgroups")
+async def list_workgroups(
+    athena_service: AthenaService = Depends(get_athena_service)
+):
+    """
+    Lista los workgroups configurados para el enrutamiento, sus consultas pendientes y el estado de los circuitos
+    """
+    return {
+        "workgroups": athena_service.describe_workgroups(),
+        "circuit_breakers": athena_service.describe_circuit_breakers()
+    }
+
 if settings.ENVIRONMENT == 'development' or settings.ENVIRONMENT == "devel":
 
     @router.get("/databases")
@@ -60,19 +151,45 @@ if settings.ENVIRONMENT == 'development' or settings.ENVIRONMENT == "devel":
             "available_databases": databases
         }
 
+    @router.post("/query/explain")
+    async def explain_query(
+        request: Request,
+        query_request: QueryRequest,
+        athena_service: AthenaService = Depends(get_athena_service)
+    ):
+        """
+        Estima el escaneo de una consulta sin ejecutarla: historial de ejecuciones con la misma huella o,
+        si no lo hay, EXPLAIN (TYPE IO) con el plan de entrada por tabla. Indica si excede el presupuesto de su base de datos.
+        """
+        result = await run_cancellable(request, athena_service.preflight, query_request, explain=True)
+
+        if result["status"] == "error" and result.get("error_code") != SCAN_BUDGET_CODE:
+            raise HTTPException(
+                status_code=error_status(result),
+                detail=result["message"]
+            )
+
+        return {
+            **result["scan_estimate"],
+            "priority": result.get("priority"),
+            "action": "reject" if result["status"] == "error" else ("batch" if result["scan_estimate"]["over_budget"] else "run"),
+        }
+
     @router.post("/query")
     async def execute_query(
+        request: Request,
         query_request: QueryRequest,
         athena_service: AthenaService = Depends(get_athena_service)
     ):
         """
-        Ejecuta una consulta en una base de datos específica
+        Ejecuta una consulta en una base de datos específica, si su escaneo estimado está dentro del presupuesto
         """
-        result = athena_service.execute_query(query_request)
+        query_request, scan = await check_scan_budget(request, query_request, athena_service)
+        result = await asyncio.to_thread(athena_service.execute_query, query_request, scan)
         
         if result["status"] == "error":
             raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
+                status_code=error_status(result),
                 detail=result["message"]
             )
         
@@ -87,30 +204,92 @@ if settings.ENVIRONMENT == 'development' or settings.ENVIRONMENT == "devel":
         """
         Obtiene los resultados de una consulta por su ID de ejecución
         """
-        result = athena_service.get_query_results(database, query_execution_id)
+        # Recorre todas las páginas y guarda el resultado en el almacén local: fuera del event loop
+        result = await asyncio.to_thread(athena_service.get_query_results, database, query_execution_id)
         
         if result["status"] == "error":
             raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
+                status_code=error_status(result),
                 detail=result["message"]
             )
         
-        return result
+        return Response(content=result.to_json(), media_type="application/json")
 
     @router.post("/query/sync")
     async def execute_query_sync(
+        request: Request,
         query_request: QueryRequest,
+        format: Literal["json", "arrow", "csv", "ndjson"] = Query("json", description="json y arrow (Arrow IPC) acumulan el resultado; csv y ndjson lo envían página por página"),
         athena_service: AthenaService = Depends(get_athena_service)
     ):
         """
-        Ejecuta una consulta y espera por los resultados
+        Ejecuta una consulta y espera por los resultados; si el cliente se desconecta la consulta se cancela.
+        Con format=csv o ndjson las filas se envían en streaming conforme llega cada página de Athena;
+        format=arrow devuelve el resultado tipado en Arrow IPC (stream).
+        Antes de ejecutarla se estima su escaneo (ver /query/explain); el estimado y el real van en "scan" o en X-Scan-*.
         """
-        result = athena_service.execute_and_wait_query(query_request)
+        query_request, scan = await check_scan_budget(request, query_request, athena_service)
+        fetch_results = format in ("json", "arrow")
+        result = await run_cancellable(request, athena_service.execute_and_wait_query, query_request, fetch_results=fetch_results, scan=scan)
         
         if result["status"] == "error":
             raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
+                status_code=error_status(result),
                 detail=result["message"]
             )
         
-        return result
\ No newline at end of file
+        if format == "arrow":
+            return Response(
+                content=result.to_arrow(),
+                media_type="application/vnd.apache.arrow.stream",
+                headers={"X-Query-Execution-Id": result["query_execution_id"], **scan_headers(result)}
+            )
+        if fetch_results:
+            return Response(content=result.to_json(), media_type="application/json")
+
+        pages = athena_service.iter_query_results(query_request.database_key, result["query_execution_id"])
+        return StreamingResponse(
+            stream_pages(pages, format),
+            media_type=MEDIA_TYPES[format],
+            headers={
+                "X-Query-Execution-Id": result["query_execution_id"],
+                "X-Query-Fingerprint": result.get("query_fingerprint", ""),
+                **scan_headers(result),
+            }
+        )
+
+    @router.post("/export")
+    async def export_query(
+        request: Request,
+        export_request: ExportRequest,
+        export_service: ExportService = Depends(get_export_service)
+    ):
+        """
+        Exporta el resultado de una consulta a un dataset Parquet particionado (estilo Hive) en DATA_DIR/exports.
+        Si la exportación se interrumpe, repetir la misma petición la reanuda desde el último bloque escrito.
+        """
+        result = await run_cancellable(request, export_service.exportar, export_request)
+
+        if result["status"] == "error":
+            raise HTTPException(
+                status_code=error_status(result),
+                detail=result["message"]
+            )
+
+        return result
+
+    @router.get("/export/{name}")
+    async def get_export_progress(
+        name: str,
+        export_service: ExportService = Depends(get_export_service)
+    ):
+        """
+        Progreso de una exportación: bloques, filas y bytes escritos y NextToken desde el que se reanudaría
+        """
+        progreso = export_service.progreso(name)
+        if progreso is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"No existe la exportación '{name}'"
+            )
+        return progreso
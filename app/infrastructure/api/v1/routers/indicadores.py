@@ -1,7 +1,83 @@
+import asyncio
+from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from app.core.models.athena_models import QueryRequest
+from app.core.services.indicadores_service import IndicadoresService
 from app.core.settings.environments import settings
 
 
 # metricas
-router = APIRouter(prefix="/consolidados", tags=["Indicadores"])
\ No newline at end of file
+router = APIRouter(prefix="/consolidados", tags=["Indicadores"])
+
+def get_indicadores_service() -> IndicadoresService:
+    return IndicadoresService()
+
+def _sin_datos():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Los indicadores aún no han sido materializados, ejecute una actualización"
+    )
+
+@router.get("/viajes-semanales")
+async def viajes_semanales_udn(
+    udn: Optional[List[str]] = Query(None, description="Filtra por una o varias unidades de negocio"),
+    semanas: Optional[int] = Query(None, ge=1, le=settings.KPI_RETENTION_WEEKS, description="Número de semanas más recientes"),
+    indicadores_service: IndicadoresService = Depends(get_indicadores_service)
+):
+    """
+    Viajes semanales por unidad de negocio, servidos desde el almacén materializado
+    """
+    df = indicadores_service.viajes_semanales_udn(udn, semanas)
+    if df is None:
+        raise _sin_datos()
+
+    return {
+        "actualizado": indicadores_service.estado().get("ultima_actualizacion"),
+        "row_count": df.height,
+        "data": df.to_dicts()
+    }
+
+@router.get("/clientes-churn")
+async def clientes_churn(
+    udn: Optional[List[str]] = Query(None, description="Filtra por una o varias unidades de negocio"),
+    semanas: Optional[int] = Query(None, ge=1, le=settings.KPI_RETENTION_WEEKS, description="Número de semanas más recientes"),
+    indicadores_service: IndicadoresService = Depends(get_indicadores_service)
+):
+    """
+    Clientes perdidos y recuperados por unidad de negocio y semana
+    """
+    df = indicadores_service.clientes_churn(udn, semanas)
+    if df is None:
+        raise _sin_datos()
+
+    return {
+        "actualizado": indicadores_service.estado().get("ultima_actualizacion"),
+        "row_count": df.height,
+        "data": df.to_dicts()
+    }
+
+@router.get("/estado")
+async def estado_indicadores(
+    indicadores_service: IndicadoresService = Depends(get_indicadores_service)
+):
+    """
+    Metadatos de la última actualización de los indicadores materializados
+    """
+    return indicadores_service.estado()
+
+@router.post("/actualizar")
+async def actualizar_indicadores(
+    database: str = Query(settings.KPI_DATABASE_KEY, description="Clave de la base de datos"),
+    indicadores_service: IndicadoresService = Depends(get_indicadores_service)
+):
+    """
+    Fuerza una actualización incremental de los indicadores desde Athena
+    """
+    result = await asyncio.to_thread(indicadores_service.actualizar, database)
+
+    if result["status"] == "error":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=result["message"]
+        )
+
+    return result
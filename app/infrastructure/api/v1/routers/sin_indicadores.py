@@ -1,8 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, Response, status, Query
+from typing import Annotated, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status, Query
 from fastapi.responses import JSONResponse
 from app.core.models.athena_models import QueryRequest
+from app.core.models.reportes_models import ReporteAlertaClientesParams
 from app.core.services.alerta_clientes_service import AlertaClientesService
 from app.core.settings.environments import settings
+from app.utils.cancellation import run_cancellable
+from app.utils.tracing import span
 
 #metricas
 
@@ -23,12 +27,33 @@ def get_alerta_clientes_service() -> AlertaClientesService:
 
 @router.get("/alerta-clientes/reporte")
 async def generar_reporte_alerta_clientes(
+    request: Request,
+    params: Annotated[ReporteAlertaClientesParams, Query()],
     alerta_clientes_service: AlertaClientesService = Depends(get_alerta_clientes_service)
 ):
     """
-    Genera el reporte específico de alerta_clientes usando Polars
+    Genera el reporte específico de alerta_clientes usando Polars; si el cliente se desconecta la consulta se cancela.
+    Los filtros de udn y prefijo de cliente se aplican en la consulta a Athena.
     """
-    result = alerta_clientes_service.generar_reporte_alerta_clientes("bustrax")
+    with span(
+        "sin_indicadores.reporte_alerta_clientes",
+        database=params.database,
+        fecha_corte=str(params.fecha_corte or ""),
+        semanas=params.semanas,
+        udn=len(params.udn),
+        cliente_prefijo=bool(params.cliente_prefijo),
+        fan_out=params.fan_out
+    ):
+        result = await run_cancellable(
+            request,
+            alerta_clientes_service.generar_reporte_alerta_clientes,
+            params.database,
+            semanas=params.semanas,
+            fan_out=params.fan_out,
+            fecha_corte=params.fecha_corte,
+            udn=params.udn,
+            cliente_prefijo=params.cliente_prefijo
+        )
     
     if result["status"] == "error":
         raise HTTPException(
@@ -45,3 +70,26 @@ async def generar_reporte_alerta_clientes(
         }
     )
 
+@router.get("/alerta-clientes/alertas")
+async def alertas_clientes(
+    database: str = Query("bustrax", pattern=r"^[A-Za-z0-9_]+$", description="Clave de la base de datos"),
+    udn: Optional[List[str]] = Query(None, description="Filtra por una o varias unidades de negocio"),
+    alerta_clientes_service: AlertaClientesService = Depends(get_alerta_clientes_service)
+):
+    """
+    Solo los clientes que cambiaron de estado en la semana más reciente del último reporte generado,
+    con las alertas nuevas y resueltas respecto al reporte anterior
+    """
+    if database not in alerta_clientes_service.athena_service.get_available_databases():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Base de datos '{database}' no configurada"
+        )
+    result = alerta_clientes_service.alertas(database, udn)
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No hay reportes guardados, genere primero /alerta-clientes/reporte"
+        )
+
+    return result
@@ -1,5 +1,6 @@
+import asyncio
 import datetime
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from fastapi.responses import JSONResponse
 from app.core.settings.environments import settings
 
@@ -20,3 +21,49 @@ async def health_check():
     status = 200
 
     return JSONResponse(content=response, status_code=status)
+
+
+if settings.ENVIRONMENT == 'development' or settings.ENVIRONMENT == "devel":
+
+    @router.get("/startup")
+    async def startup_profile(
+        top: int = Query(20, ge=1, le=200, description="Número de módulos a mostrar")
+    ):
+        """
+        Desglose de tiempos de importación de app.main y resultado del calentamiento del lifespan
+        """
+        from app.core.startup import warmup_report
+        from app.utils.startup_profile import profile_imports
+
+        imports = await asyncio.to_thread(profile_imports, "app.main", top)
+
+        return {
+            "imports": imports,
+            "warmup": warmup_report
+        }
+
+    @router.get("/memory")
+    async def list_memory_profiles():
+        """
+        Perfiles de memoria recientes (peticiones enviadas con el encabezado X-Memory-Profile: 1)
+        """
+        from app.utils.memory_profile import list_profiles
+
+        return {
+            "profiles": list_profiles()
+        }
+
+    @router.get("/memory/{profile_id}")
+    async def get_memory_profile(profile_id: str):
+        """
+        Detalle de un perfil de memoria: RSS y memoria de Python por etapa, pico y principales sitios de asignación
+        """
+        from app.utils.memory_profile import get_profile
+
+        profile = get_profile(profile_id)
+        if profile is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"No existe el perfil de memoria '{profile_id}'"
+            )
+        return profile
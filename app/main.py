@@ -1,9 +1,10 @@
 from fastapi import FastAPI
-import uvicorn
 
 from app.core.settings.environments import settings
+from app.core.startup import lifespan
+from app.utils.tracing import TracingMiddleware
 #routers
-from app.infrastructure.api.v1.routers import testing, athena, sin_indicadores
+from app.infrastructure.api.v1.routers import testing, athena, sin_indicadores, indicadores
 
 env = f"/{settings.ENVIRONMENT}" if settings.ENVIRONMENT != 'prod' else ""
 
@@ -12,12 +13,23 @@ app = FastAPI(
     description= f"API para consultas Athena",
     version=settings.VERSIONAPP,
     docs_url=f"{env}{settings.API_PREFIX}/docs",
-    redoc_url=f"{env}{settings.API_PREFIX}/redoc"
+    redoc_url=f"{env}{settings.API_PREFIX}/redoc",
+    lifespan=lifespan
 )
 
+# Span raíz por petición y X-Trace-Id en la respuesta
+app.add_middleware(TracingMiddleware)
+
+# Perfil de memoria por etapa para las peticiones con X-Memory-Profile: 1
+if settings.ENVIRONMENT == 'development' or settings.ENVIRONMENT == "devel":
+    from app.utils.memory_profile import MemoryProfileMiddleware
+    app.add_middleware(MemoryProfileMiddleware)
+
 app.include_router(testing.router,prefix=settings.API_PREFIX)
 app.include_router(athena.router, prefix=settings.API_PREFIX)
 app.include_router(sin_indicadores.router,prefix=settings.API_PREFIX)
+app.include_router(indicadores.router,prefix=settings.API_PREFIX)
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
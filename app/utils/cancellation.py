@@ -0,0 +1,36 @@
+import asyncio
+import threading
+from pathlib import Path
+from typing import Any, Callable
+
+from fastapi import Request
+
+from app.core.logger.config import LoggerConfig
+
+# Nota: Path(__file__).stem == __name__.split('.')[-1]
+logger = LoggerConfig(file_name=Path(__file__).stem,debug=True,root_file=__name__).get_logger()
+
+
+async def run_cancellable(request: Request, func: Callable[..., Any], *args, poll_interval: float = 0.5, **kwargs) -> Any:
+    """
+    Ejecuta una función bloqueante en un hilo pasándole `cancel_event`, y lo activa si el cliente HTTP se desconecta
+    o si la petición es cancelada (p. ej. al apagar el servidor).
+
+    La función debe aceptar el argumento `cancel_event: threading.Event` y terminar pronto cuando se active.
+    """
+    cancel_event = threading.Event()
+    task = asyncio.ensure_future(asyncio.to_thread(func, *args, cancel_event=cancel_event, **kwargs))
+
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                break
+            if await request.is_disconnected():
+                logger.warning(f"Cliente desconectado, cancelando trabajo de {request.url.path}")
+                cancel_event.set()
+                break
+        return await task
+    except asyncio.CancelledError:
+        cancel_event.set()
+        raise
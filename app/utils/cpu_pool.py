@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Callable, Optional, TYPE_CHECKING
+
+from app.core.logger.config import LoggerConfig
+from app.core.settings.environments import settings
+from app.utils import memory_profile
+
+if TYPE_CHECKING:
+    import polars as pl
+
+# Nota: Path(__file__).stem == __name__.split('.')[-1]
+logger = LoggerConfig(file_name=Path(__file__).stem,debug=True,root_file=__name__).get_logger()
+
+
+def to_ipc(df: pl.DataFrame) -> bytes:
+    """Serializa un DataFrame en Arrow IPC para pasarlo entre procesos sin convertir a objetos de Python"""
+    buffer = BytesIO()
+    df.write_ipc(buffer, compression="uncompressed")
+    return buffer.getvalue()
+
+
+def from_ipc(data: bytes) -> pl.DataFrame:
+    import polars as pl
+
+    return pl.read_ipc(BytesIO(data))
+
+
+def _init_worker(polars_threads: int) -> None:
+    """
+    Inicializa cada proceso del pool: limita los hilos de Polars antes de importarlo para que varios reportes
+    en paralelo no sobre-suscriban los núcleos
+    """
+    os.environ["POLARS_MAX_THREADS"] = str(polars_threads)
+
+
+class CpuTask:
+    """
+    Tarea enviada al pool; si el pool de procesos se rompe (worker muerto por memoria, etc.) se repite en el hilo actual
+    """
+
+    def __init__(self, pool: "CpuPool", future: Future, func: Callable[..., Any], args: tuple):
+        self._pool = pool
+        self._future = future
+        self._func = func
+        self._args = args
+
+    def result(self) -> Any:
+        try:
+            return self._future.result()
+        except BrokenProcessPool:
+            self._pool.fall_back_to_threads("el pool de procesos se detuvo")
+            return self._func(*self._args)
+
+
+class CpuPool:
+    """
+    Ejecutor acotado para las etapas intensivas en CPU de los reportes (Polars, Excel).
+
+    Con CPU_POOL_MODE='process' usa un pool de procesos (contexto spawn) con CPU_POOL_POLARS_THREADS hilos de Polars
+    por proceso, así varios reportes se construyen en paralelo sin competir por el GIL ni bloquear la API. Si el pool de
+    procesos no se puede crear o se rompe, cae a un pool de hilos. Como mucho hay 2 × CPU_POOL_WORKERS tareas en cola o
+    en ejecución: `submit` se bloquea cuando se alcanza el límite y cada lugar se libera al terminar su tarea.
+    """
+
+    def __init__(self):
+        self.mode = settings.CPU_POOL_MODE
+        # Con varios workers de uvicorn cada uno tiene su pool: por defecto se reparten la mitad de los núcleos
+        self.workers = settings.CPU_POOL_WORKERS or max(1, (os.cpu_count() or 1) // 2 // max(1, settings.WEB_CONCURRENCY))
+        self.polars_threads = settings.CPU_POOL_POLARS_THREADS or max(1, (os.cpu_count() or 1) // self.workers)
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.workers * 2)
+
+    @property
+    def executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._create_executor()
+            return self._executor
+
+    def _create_executor(self) -> Executor:
+        if self.mode == "process":
+            try:
+                executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.polars_threads,)
+                )
+                logger.info(f"Pool de procesos creado: {self.workers} procesos, {self.polars_threads} hilos de Polars c/u")
+                return executor
+            except (OSError, NotImplementedError, PermissionError) as e:
+                logger.warning(f"No se pudo crear el pool de procesos, se usan hilos: {str(e)}")
+                self.mode = "thread"
+        return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="cpu_pool")
+
+    def fall_back_to_threads(self, reason: str) -> None:
+        with self._lock:
+            if self.mode != "process":
+                return
+            logger.warning(f"Cambiando el pool de CPU a hilos: {reason}")
+            broken, self.mode = self._executor, "thread"
+            self._executor = None
+        if broken is not None:
+            broken.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, func: Callable[..., Any], *args) -> CpuTask:
+        """
+        Envía una función de módulo (serializable con pickle) y sus argumentos; se bloquea si el pool está lleno.
+        Mientras la petición tenga un perfil de memoria activo se ejecuta en el hilo actual, para que la memoria
+        de la tarea se atribuya a sus etapas.
+        """
+        if self.mode == "inline" or memory_profile.active():
+            future: Future = Future()
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+            return CpuTask(self, future, func, args)
+
+        self._slots.acquire()
+        try:
+            future = self.executor.submit(func, *args)
+        except BrokenProcessPool:
+            self.fall_back_to_threads("el pool de procesos se detuvo")
+            future = self.executor.submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return CpuTask(self, future, func, args)
+
+    def run(self, func: Callable[..., Any], *args) -> Any:
+        """Ejecuta func en el pool y espera su resultado"""
+        return self.submit(func, *args).result()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Instancia global de CpuPool
+cpu_pool = CpuPool()
@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: el candado solo excluye dentro del proceso
+    fcntl = None
+
+from app.core.settings.environments import settings
+
+# Candados por ruta para la variante sin fcntl
+_local_locks: Dict[Path, threading.Lock] = {}
+_local_locks_guard = threading.Lock()
+
+
+def lock_path(name: str) -> Path:
+    return Path(settings.DATA_DIR) / "locks" / settings.ENVIRONMENT / f"{name}.lock"
+
+
+class FileLock:
+    """
+    Candado exclusivo entre procesos sobre un archivo en DATA_DIR/locks (flock), con el que los workers de uvicorn
+    que comparten ./data se coordinan: uno ejecuta la consulta o construye el reporte y los demás esperan su resultado.
+
+    El sistema operativo libera el candado si el proceso muere, así que nunca queda uno huérfano. El archivo se borra
+    al liberar; quien lo bloquea comprueba que sigue siendo el archivo de la ruta y si no vuelve a intentar.
+    Dos hilos del mismo proceso también se excluyen entre sí (cada acquire abre su propio descriptor).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.path = lock_path(name)
+        self._fd: Optional[int] = None
+        self._local: Optional[threading.Lock] = None
+
+    def acquire(
+        self,
+        timeout: Optional[float] = None,
+        cancel_event: Optional[threading.Event] = None,
+        poll_interval: float = 0.1
+    ) -> bool:
+        """
+        Espera el candado; devuelve False si se agota el timeout o se activa cancel_event
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if fcntl is None:
+            return self._acquire_local(deadline, cancel_event, poll_interval)
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                try:
+                    current = os.stat(self.path)
+                except FileNotFoundError:
+                    current = None
+                if current is not None and current.st_ino == os.fstat(fd).st_ino:
+                    self._fd = fd
+                    return True
+                # Otro proceso liberó y borró el archivo entre el open y el flock
+            except BlockingIOError:
+                pass
+            os.close(fd)
+
+            if cancel_event is not None and cancel_event.is_set():
+                return False
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(poll_interval)
+
+    def _acquire_local(self, deadline: Optional[float], cancel_event: Optional[threading.Event], poll_interval: float) -> bool:
+        with _local_locks_guard:
+            lock = _local_locks.setdefault(self.path, threading.Lock())
+        while not lock.acquire(timeout=poll_interval):
+            if cancel_event is not None and cancel_event.is_set():
+                return False
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+        self._local = lock
+        return True
+
+    def release(self) -> None:
+        if self._fd is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        elif self._local is not None:
+            self._local.release()
+            self._local = None
+
+    @property
+    def locked(self) -> bool:
+        return self._fd is not None or self._local is not None
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
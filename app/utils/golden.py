@@ -0,0 +1,456 @@
+"""
+Regresión de salida exacta (golden) y presupuestos de tiempo y memoria del pipeline de alerta_clientes.
+
+Uso:
+    python -m app.utils.golden                       # verifica todos los casos
+    python -m app.utils.golden --cases bordes --json
+    python -m app.utils.golden --freeze              # regenera los casos sintéticos: entrada, salida esperada y presupuestos
+    python -m app.utils.golden --freeze --from extracto.parquet --name anonimizado --as-of 2026-03-18 --weeks 8
+    python -m app.utils.golden --rebudget            # solo vuelve a medir los presupuestos (p. ej. en otra máquina)
+
+Cada caso vive en app/domain/golden/alerta_clientes/<caso>/:
+    entrada.parquet   columnas de viajes_facturacion que lee el reporte, como texto, tal como las entrega Athena
+    esperado.parquet  clientes_op esperado
+    caso.json         fecha de corte, semanas, presupuestos por variante y etapa y lo medido al congelar
+
+Cada variante del pipeline (legado con CSV completo, por bloques y por bloques con la dimensión de clientes) debe
+producir exactamente esperado.parquet, con los mismos tipos, orden y nulos, y cada etapa (agregacion, malla, excel)
+debe quedar dentro de su presupuesto de tiempo, de memoria de Python (tracemalloc) y de crecimiento del RSS.
+Una implementación más rápida se puede cambiar con seguridad si la suite sigue pasando; una más lenta la hace fallar.
+Termina con código 1 si algún caso falla.
+"""
+import argparse
+import datetime as dt
+import json
+import os
+import random
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+CASOS_DIR = Path(__file__).resolve().parent.parent / "domain" / "golden" / "alerta_clientes"
+
+VARIANTES = ("legado", "bloques", "dimension")
+ETAPAS = ("agregacion", "malla", "excel")
+
+# Filas por página, igual que Athena
+PAGE_SIZE = 1000
+
+# Presupuesto = medido × factor + holgura, para que el ruido de máquinas pequeñas no falle la suite
+FACTOR_TIEMPO, HOLGURA_MS = 2.0, 50.0
+FACTOR_MEMORIA, HOLGURA_MB = 1.5, 8.0
+
+# Prefijo de los clientes que el reporte excluye (ver AlertaClientesService._viajes_por_semana)
+PREFIJO_ESPECIAL = 'GRUPO VIAJES ESPECIALES - '
+
+# Casos generados por código; --freeze los vuelve a generar y congelar
+CASOS_SINTETICOS = {
+    "sintetico": {
+        "descripcion": "Datos sintéticos de local_data: 150 clientes en 5 udn, 10% deja de operar a mitad del periodo",
+        "fecha_corte": "2026-03-18",
+        "semanas": 8,
+    },
+    "bordes": {
+        "descripcion": "Casos límite: inicio y fin de semana, status 9 y no numérico, VA, vacíos, clientes especiales, udn nula",
+        "fecha_corte": "2026-03-18",
+        "semanas": 3,
+    },
+}
+
+
+def _prepare_environment() -> None:
+    """
+    Configura el proceso antes de importar la aplicación (settings se instancia al importar): el pool de CPU corre
+    en el hilo actual para medir solo el cálculo, y los bloques son pequeños para ejercitar la combinación de parciales
+    """
+    os.environ["CPU_POOL_MODE"] = "inline"
+    os.environ["REPORT_SPILL_TO_DISK"] = "0"
+    os.environ["KPI_REFRESH_INTERVAL_MINUTES"] = "0"
+    os.environ.setdefault("REPORT_CHUNK_ROWS", "5000")
+
+
+def semanas_del_caso(caso: Dict[str, Any]):
+    import polars as pl
+    from app.core.services.alerta_clientes_service import rango_semanas
+
+    N = caso["semanas"]
+    fecha_ini, _ = rango_semanas(dt.date.fromisoformat(caso["fecha_corte"]), N)
+    return pl.date_range(start=fecha_ini, end=fecha_ini + pl.duration(weeks=N-1), interval='1w', eager=True)
+
+
+def paginas(entrada) -> Iterator[Dict[str, Any]]:
+    """Páginas con la misma forma que AthenaClient.iter_query_results"""
+    columns = entrada.columns
+    for offset in range(0, max(entrada.height, 1), PAGE_SIZE):
+        following = offset + PAGE_SIZE
+        yield {
+            "columns": columns,
+            "column_types": ["varchar"] * len(columns),
+            "data": [list(row) for row in entrada.slice(offset, PAGE_SIZE).iter_rows()],
+            "next_token": str(following) if following < entrada.height else None,
+        }
+
+
+# Entradas
+
+def entrada_sintetica(caso: Dict[str, Any]):
+    import polars as pl
+    from app.core.database.athena.local_data import generar_viajes_facturacion
+    from app.core.services.alerta_clientes_service import COLUMNAS_VIAJES, rango_semanas
+
+    _, fecha_fin = rango_semanas(dt.date.fromisoformat(caso["fecha_corte"]), caso["semanas"])
+    df = generar_viajes_facturacion(filas=20_000, dias=caso["semanas"] * 7, clientes=150, fecha_fin=fecha_fin, seed=7)
+    return a_texto(df.select(COLUMNAS_VIAJES))
+
+
+def entrada_bordes(caso: Dict[str, Any]):
+    """
+    Filas escritas a mano (business_unit, group, start_date, status, tipo_de_viaje) para 3 semanas:
+    2026-02-23, 2026-03-02 y 2026-03-09
+    """
+    import polars as pl
+    from app.core.services.alerta_clientes_service import COLUMNAS_VIAJES
+
+    filas = [
+        # Lunes y domingo de la primera semana, nada en la segunda, vuelve en la tercera: N_a_0 y 0_a_N
+        ("MONTERREY", "CLIENTE A", "2026-02-23", "1", "N"),
+        ("MONTERREY", "CLIENTE A", "2026-03-01", "2", "E"),
+        ("MONTERREY", "CLIENTE A", "2026-03-15", "1", "N"),
+        # Solo la segunda semana (lunes y domingo): 0_a_N en la segunda y N_a_0 en la tercera
+        ("MONTERREY", "CLIENTE B", "2026-03-02", "1", "N"),
+        ("MONTERREY", "CLIENTE B", "2026-03-08", "1", "N"),
+        # Solo viajes con status 9, VA, status vacío o no numérico y tipo vacío: no aparece en el reporte
+        ("MONTERREY", "CLIENTE C", "2026-02-24", "9", "N"),
+        ("MONTERREY", "CLIENTE C", "2026-03-03", "1", "VA"),
+        ("MONTERREY", "CLIENTE C", "2026-03-10", "", "N"),
+        ("MONTERREY", "CLIENTE C", "2026-03-10", "abc", "N"),
+        ("MONTERREY", "CLIENTE C", "2026-03-11", "1", ""),
+        # Mezcla de válidos e inválidos en la misma semana
+        ("MONTERREY", "CLIENTE D", "2026-03-09", "1", "N"),
+        ("MONTERREY", "CLIENTE D", "2026-03-09", "9", "N"),
+        ("MONTERREY", "CLIENTE D", "2026-03-09", "1", "VA"),
+        # Clientes especiales: con el prefijo completo se excluyen, sin el guion no
+        ("TOLUCA", "GRUPO VIAJES ESPECIALES - EVENTOS", "2026-02-25", "1", "N"),
+        ("TOLUCA", "GRUPO VIAJES ESPECIALES", "2026-02-25", "1", "N"),
+        # Mismo nombre de cliente en otra udn, solo la última semana
+        ("TOLUCA", "CLIENTE A", "2026-03-14", "1", "N"),
+        # Cliente vacío se descarta; udn vacía (null) se conserva pero no empata en el join de la malla
+        ("TOLUCA", "", "2026-02-26", "1", "N"),
+        ("", "CLIENTE SIN UDN", "2026-02-26", "1", "N"),
+        ("", "CLIENTE SIN UDN", "2026-03-04", "1", "N"),
+        # Orden: minúsculas y acentos después de mayúsculas (orden de bytes)
+        ("QUERÉTARO", "cliente minúsculas", "2026-03-05", "1", "N"),
+        ("QUERETARO", "Cliente Mixto", "2026-03-12", "1", "N"),
+        ("QUERETARO", "CLIENTE Z", "2026-03-12", "2", "E"),
+        ("QUERETARO", "CLIENTE Z", "2026-03-12", "2", "E"),
+    ]
+    return pl.DataFrame(filas, schema=[(c, pl.String) for c in COLUMNAS_VIAJES], orient="row")
+
+
+def entrada_desde_parquet(path: Path, caso: Dict[str, Any], seed: int = 0):
+    """
+    Extracto real anonimizado: solo las columnas del reporte y las filas del rango (como el WHERE de la consulta),
+    con udn y clientes reemplazados por nombres sin relación con los reales. Los clientes especiales conservan
+    el prefijo para que el filtro del reporte se siga ejercitando.
+    """
+    import polars as pl
+    from app.core.services.alerta_clientes_service import COLUMNAS_VIAJES, rango_semanas
+
+    fecha_ini, fecha_fin = rango_semanas(dt.date.fromisoformat(caso["fecha_corte"]), caso["semanas"])
+    df = a_texto(pl.read_parquet(path, columns=COLUMNAS_VIAJES)).filter(
+        (pl.col("start_date") >= fecha_ini.isoformat()) & (pl.col("start_date") <= fecha_fin.isoformat())
+    )
+
+    rng = random.Random(seed)
+
+    def seudonimos(valores: List[str], nombre: Callable[[int, str], str]) -> Dict[str, str]:
+        valores = sorted(v for v in valores if v)
+        rng.shuffle(valores)
+        return {v: nombre(i, v) for i, v in enumerate(valores)}
+
+    udns = seudonimos(df["business_unit"].unique().to_list(), lambda i, _: f"UDN {i:02d}")
+    clientes = seudonimos(
+        df["group"].unique().to_list(),
+        lambda i, v: f"{PREFIJO_ESPECIAL}{i:05d}" if v.startswith(PREFIJO_ESPECIAL) else f"CLIENTE {i:05d}"
+    )
+    return df.with_columns(
+        pl.col("business_unit").replace(udns),
+        pl.col("group").replace(clientes),
+    )
+
+
+def a_texto(df):
+    """Valores como texto y null como '', la forma en que los entrega Athena"""
+    import polars as pl
+
+    return df.select(pl.all().cast(pl.String).fill_null(""))
+
+
+# Ejecución
+
+class Medicion:
+    """Tiempo por etapa; la memoria la registra el perfil activo a través de memory_stage"""
+
+    def __init__(self):
+        self.tiempos: Dict[str, float] = {}
+
+    @contextmanager
+    def etapa(self, nombre: str) -> Iterator[None]:
+        from app.utils.memory_profile import memory_stage
+
+        inicio = time.perf_counter()
+        with memory_stage(nombre):
+            yield
+        self.tiempos[nombre] = self.tiempos.get(nombre, 0.0) + (time.perf_counter() - inicio) * 1000
+
+
+def ejecutar_variante(variante: str, entrada, semanas_lst, medicion: Medicion):
+    """
+    Corre una variante del pipeline sobre la entrada y devuelve clientes_op
+    """
+    import polars as pl
+    from app.core.services.alerta_clientes_service import AlertaClientesService, COLUMNAS_VIAJES
+    from app.domain.schemas.viajes_facturacion import schema_vf
+
+    service = AlertaClientesService()
+    schema = {c: schema_vf[c] for c in COLUMNAS_VIAJES}
+
+    with medicion.etapa("agregacion"):
+        if variante == "legado":
+            # Mismos pasos que _procesar_datos_alerta_clientes: todo el resultado a CSV y un solo DataFrame
+            df = service._crear_dataframe({"columns": entrada.columns, "data": [list(r) for r in entrada.iter_rows()]}, schema=schema)
+            vl_sem = service._viajes_por_semana(df)
+        else:
+            vl_sem = service._viajes_por_semana_por_bloques(paginas(entrada), schema)
+
+    with medicion.etapa("malla"):
+        if variante == "dimension":
+            # La dimensión real acumula clientes de reportes anteriores: se agregan parejas que no están en vl_sem
+            extra = pl.DataFrame({"udn": ["AAA", "ZZZ", None], "cliente": ["CLIENTE FANTASMA", "CLIENTE FANTASMA", "CLIENTE NULO"]})
+            dimension = pl.concat([vl_sem.select(["udn", "cliente"]).unique(), extra]).sort(["udn", "cliente"])
+            clientes_op = service._clientes_op(vl_sem, semanas_lst, dimension)
+        else:
+            clientes_op = service._clientes_op(vl_sem, semanas_lst)
+
+    with medicion.etapa("excel"):
+        service._generar_excel(clientes_op)
+    return clientes_op
+
+
+def comparar(actual, esperado) -> Optional[str]:
+    """None si son idénticos; si no, una descripción de la diferencia"""
+    if actual.equals(esperado):
+        return None
+    if actual.schema != esperado.schema:
+        return f"schema distinto: {dict(actual.schema)} != {dict(esperado.schema)}"
+    solo_actual = actual.join(esperado, on=actual.columns, how="anti", nulls_equal=True)
+    solo_esperado = esperado.join(actual, on=esperado.columns, how="anti", nulls_equal=True)
+    if actual.height == esperado.height and solo_actual.height == 0 and solo_esperado.height == 0:
+        return "mismas filas en distinto orden"
+    return (
+        f"{actual.height} filas (esperadas {esperado.height}); {solo_actual.height} solo en la salida, "
+        f"{solo_esperado.height} solo en la esperada; p. ej. {solo_actual.head(3).to_dicts()} / {solo_esperado.head(3).to_dicts()}"
+    )
+
+
+def medir(entrada, semanas_lst, variantes: List[str], repeticiones: int) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    Por variante y etapa: el mejor tiempo de `repeticiones` corridas sin perfil y la memoria de una corrida perfilada
+    (pico de Python y crecimiento del pico de RSS respecto al inicio de la corrida)
+    """
+    from app.utils.memory_profile import profiling
+
+    medido: Dict[str, Dict[str, Dict[str, float]]] = {}
+    for variante in variantes:
+        # Corrida de calentamiento: importaciones, cachés de Polars y arenas del allocator
+        ejecutar_variante(variante, entrada, semanas_lst, Medicion())
+
+        mejores: Dict[str, float] = {}
+        for _ in range(max(1, repeticiones)):
+            medicion = Medicion()
+            ejecutar_variante(variante, entrada, semanas_lst, medicion)
+            for etapa, ms in medicion.tiempos.items():
+                mejores[etapa] = min(mejores.get(etapa, ms), ms)
+
+        with profiling(f"golden/{variante}") as profile:
+            ejecutar_variante(variante, entrada, semanas_lst, Medicion())
+        etapas = {stage["name"]: stage for stage in profile.result["stages"]}
+
+        medido[variante] = {
+            etapa: {
+                "time_ms": round(mejores[etapa], 1),
+                "python_peak_mb": round(etapas[etapa]["python_peak_bytes"] / 2**20, 2),
+                "rss_growth_mb": round(max(0, etapas[etapa]["rss_peak_bytes"] - profile.result["rss_start_bytes"]) / 2**20, 2),
+            }
+            for etapa in ETAPAS
+        }
+    return medido
+
+
+def presupuestos(medido: Dict[str, Dict[str, Dict[str, float]]]) -> Dict[str, Dict[str, Dict[str, float]]]:
+    return {
+        variante: {
+            etapa: {
+                "time_ms": round(valores["time_ms"] * FACTOR_TIEMPO + HOLGURA_MS, 1),
+                "python_peak_mb": round(valores["python_peak_mb"] * FACTOR_MEMORIA + HOLGURA_MB, 2),
+                "rss_growth_mb": round(valores["rss_growth_mb"] * FACTOR_MEMORIA + HOLGURA_MB, 2),
+            }
+            for etapa, valores in etapas.items()
+        }
+        for variante, etapas in medido.items()
+    }
+
+
+# Casos
+
+def leer_caso(nombre: str):
+    import polars as pl
+
+    carpeta = CASOS_DIR / nombre
+    caso = json.loads((carpeta / "caso.json").read_text(encoding="utf-8"))
+    return caso, pl.read_parquet(carpeta / "entrada.parquet"), pl.read_parquet(carpeta / "esperado.parquet")
+
+
+def congelar(nombre: str, caso: Dict[str, Any], entrada, repeticiones: int) -> Dict[str, Any]:
+    """
+    Calcula la salida esperada con todas las variantes (deben coincidir), mide los presupuestos y guarda el caso
+    """
+    semanas_lst = semanas_del_caso(caso)
+    salidas = {v: ejecutar_variante(v, entrada, semanas_lst, Medicion()) for v in VARIANTES}
+    esperado = salidas["legado"]
+    for variante, salida in salidas.items():
+        diferencia = comparar(salida, esperado)
+        if diferencia:
+            raise ValueError(f"La variante {variante} no coincide con legado, no se congela {nombre}: {diferencia}")
+
+    medido = medir(entrada, semanas_lst, list(VARIANTES), repeticiones)
+    caso = {
+        **caso,
+        "filas_entrada": entrada.height,
+        "filas_esperadas": esperado.height,
+        "congelado": dt.date.today().isoformat(),
+        "presupuestos": presupuestos(medido),
+        "medido": medido,
+    }
+    carpeta = CASOS_DIR / nombre
+    carpeta.mkdir(parents=True, exist_ok=True)
+    entrada.write_parquet(carpeta / "entrada.parquet", compression="zstd")
+    esperado.write_parquet(carpeta / "esperado.parquet", compression="zstd")
+    (carpeta / "caso.json").write_text(json.dumps(caso, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    return caso
+
+
+def verificar(nombre: str, repeticiones: int, con_presupuestos: bool = True) -> List[Dict[str, Any]]:
+    """
+    Corre todas las variantes de un caso: salida exacta y, opcionalmente, presupuestos por etapa
+    """
+    caso, entrada, esperado = leer_caso(nombre)
+    semanas_lst = semanas_del_caso(caso)
+
+    resultados = []
+    for variante in VARIANTES:
+        diferencia = comparar(ejecutar_variante(variante, entrada, semanas_lst, Medicion()), esperado)
+        resultados.append({"caso": nombre, "variante": variante, "etapa": "salida", "ok": diferencia is None, "detalle": diferencia})
+
+    if con_presupuestos:
+        medido = medir(entrada, semanas_lst, list(VARIANTES), repeticiones)
+        for variante, etapas in medido.items():
+            for etapa, valores in etapas.items():
+                limites = caso["presupuestos"][variante][etapa]
+                excedidos = [k for k, v in valores.items() if v > limites[k]]
+                resultados.append({
+                    "caso": nombre,
+                    "variante": variante,
+                    "etapa": etapa,
+                    "ok": not excedidos,
+                    "detalle": f"excede {', '.join(excedidos)}" if excedidos else None,
+                    "medido": valores,
+                    "presupuesto": limites,
+                })
+    return resultados
+
+
+def casos_existentes() -> List[str]:
+    return sorted(p.parent.name for p in CASOS_DIR.glob("*/caso.json"))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Regresión golden y presupuestos del pipeline de alerta_clientes")
+    parser.add_argument("--cases", default="", help="Casos separados por comas (por defecto todos)")
+    parser.add_argument("--freeze", action="store_true", help="Congela los casos sintéticos, o uno nuevo con --from")
+    parser.add_argument("--from", dest="source", help="Parquet con un extracto real de viajes_facturacion a anonimizar")
+    parser.add_argument("--name", help="Nombre del caso que se congela con --from")
+    parser.add_argument("--as-of", help="Fecha de corte del caso que se congela con --from (AAAA-MM-DD)")
+    parser.add_argument("--weeks", type=int, default=8, help="Semanas del caso que se congela con --from")
+    parser.add_argument("--rebudget", action="store_true", help="Vuelve a medir los presupuestos de los casos existentes")
+    parser.add_argument("--no-budgets", action="store_true", help="Solo verifica la salida exacta")
+    parser.add_argument("--repeats", type=int, default=3, help="Corridas por variante para medir tiempos (se toma la mejor)")
+    parser.add_argument("--json", action="store_true", help="Imprime los resultados como JSON")
+    args = parser.parse_args()
+
+    _prepare_environment()
+
+    if args.freeze:
+        if args.source:
+            if not args.name or not args.as_of:
+                parser.error("--from requiere --name y --as-of")
+            caso = {"descripcion": f"Extracto anonimizado de {Path(args.source).name}", "fecha_corte": args.as_of, "semanas": args.weeks}
+            congelados = {args.name: congelar(args.name, caso, entrada_desde_parquet(Path(args.source), caso), args.repeats)}
+        else:
+            generadores = {"sintetico": entrada_sintetica, "bordes": entrada_bordes}
+            congelados = {
+                nombre: congelar(nombre, dict(caso), generadores[nombre](caso), args.repeats)
+                for nombre, caso in CASOS_SINTETICOS.items()
+            }
+        for nombre, caso in congelados.items():
+            print(f"{nombre}: {caso['filas_entrada']} filas de entrada, {caso['filas_esperadas']} filas esperadas")
+        return
+
+    nombres = [c.strip() for c in args.cases.split(",") if c.strip()] or casos_existentes()
+    desconocidos = [c for c in nombres if c not in casos_existentes()]
+    if desconocidos:
+        parser.error(f"Casos desconocidos: {', '.join(desconocidos)}")
+
+    if args.rebudget:
+        for nombre in nombres:
+            caso, entrada, esperado = leer_caso(nombre)
+            congelar(nombre, {k: caso[k] for k in ("descripcion", "fecha_corte", "semanas")}, entrada, args.repeats)
+            _, _, nuevo = leer_caso(nombre)
+            if not nuevo.equals(esperado):
+                esperado.write_parquet(CASOS_DIR / nombre / "esperado.parquet", compression="zstd")
+                raise SystemExit(f"{nombre}: la salida ya no coincide con la esperada, no se actualizan sus presupuestos")
+            print(f"{nombre}: presupuestos actualizados")
+        return
+
+    resultados = []
+    for nombre in nombres:
+        resultados.extend(verificar(nombre, args.repeats, con_presupuestos=not args.no_budgets))
+    fallidos = [r for r in resultados if not r["ok"]]
+
+    if args.json:
+        json.dump(resultados, sys.stdout, indent=2, ensure_ascii=False, default=str)
+        print()
+    else:
+        header = f"{'caso':<12} {'variante':<10} {'etapa':<11} {'ms':>15} {'python MB':>15} {'rss MB':>15}  estado"
+        print(header)
+        print("-" * len(header))
+        for r in resultados:
+            if r["etapa"] == "salida":
+                columnas = f"{'':>15} {'':>15} {'':>15}"
+            else:
+                m, p = r["medido"], r["presupuesto"]
+                columnas = " ".join(
+                    f"{f'{m[k]:g}/{p[k]:g}':>15}" for k in ("time_ms", "python_peak_mb", "rss_growth_mb")
+                )
+            estado = "ok" if r["ok"] else f"FALLA: {r['detalle']}"
+            print(f"{r['caso']:<12} {r['variante']:<10} {r['etapa']:<11} {columnas}  {estado}")
+        print(f"\n{len(resultados) - len(fallidos)}/{len(resultados)} verificaciones correctas")
+
+    if fallidos:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Prueba de carga en proceso contra la API con el backend local de Athena.
+
+Uso:
+    python -m app.utils.load_test --concurrency 1,4,16 --requests 40
+    python -m app.utils.load_test --endpoints sync,health --queue-seconds 0.5 --json
+
+La aplicación se ejecuta en el mismo event loop que el generador de carga (httpx.ASGITransport), por lo que
+cualquier bloqueo del event loop dentro de las rutas aparece directamente como latencia y como `loop_lag_ms`,
+igual que en el despliegue actual de un solo proceso uvicorn por servicio.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+ENDPOINTS = {
+    "sync": (
+        "POST",
+        "/athena/query/sync",
+        {
+            "database_key": "bustrax",
+            "query": "SELECT business_unit, count(*) AS viajes FROM viajes_facturacion GROUP BY business_unit",
+            "timeout": 120,
+        },
+    ),
+    "health": ("GET", "/athena/health/all", None),
+    "reporte": ("GET", "/no-consolidados/alerta-clientes/reporte", None),
+}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Percentil por rango más cercano"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def _monitor_loop_lag(stop: asyncio.Event, interval: float = 0.01) -> float:
+    """Mide el retraso máximo del event loop respecto a un temporizador de `interval` segundos"""
+    max_lag = 0.0
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        max_lag = max(max_lag, loop.time() - expected)
+    return max_lag
+
+
+async def run_level(client, endpoint: str, concurrency: int, total_requests: int) -> Dict[str, Any]:
+    """
+    Ejecuta `total_requests` peticiones a un endpoint con `concurrency` trabajadores simultáneos
+    """
+    method, path, payload = ENDPOINTS[endpoint]
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    pending = iter(range(total_requests))
+
+    async def worker():
+        for _ in pending:
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=payload)
+                key = None if response.status_code < 400 else str(response.status_code)
+            except Exception as e:
+                key = type(e).__name__
+            latencies.append((time.perf_counter() - start) * 1000)
+            if key:
+                errors[key] = errors.get(key, 0) + 1
+
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(_monitor_loop_lag(stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    loop_lag = await monitor
+
+    error_count = sum(errors.values())
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "throughput_rps": round(total_requests / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "error_rate": round(error_count / total_requests, 4) if total_requests else 0.0,
+        "errors": errors,
+        "loop_lag_ms": round(loop_lag * 1000, 1),
+    }
+
+
+async def run(endpoints: List[str], levels: List[int], total_requests: int) -> List[Dict[str, Any]]:
+    import httpx
+    from app.core.settings.environments import settings
+    from app.main import app
+
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url=f"http://loadtest{settings.API_PREFIX}", timeout=None) as client:
+        for endpoint in endpoints:
+            # Petición de calentamiento para no medir importaciones ni creación de clientes
+            method, path, payload = ENDPOINTS[endpoint]
+            await client.request(method, path, json=payload)
+            for concurrency in levels:
+                results.append(await run_level(client, endpoint, concurrency, total_requests))
+    return results
+
+
+def _prepare_environment(args) -> None:
+    """
+    Configura el backend local antes de importar la aplicación (settings se instancia al importar)
+    """
+    os.environ["ATHENA_BACKEND"] = "local"
+    os.environ.setdefault("ENVIRONMENT", "development")
+    os.environ["KPI_REFRESH_INTERVAL_MINUTES"] = "0"
+    os.environ["ATHENA_LOCAL_DATA_DIR"] = args.data_dir
+    os.environ["ATHENA_LOCAL_QUEUE_SECONDS"] = str(args.queue_seconds)
+    os.environ["ATHENA_LOCAL_RUN_SECONDS"] = str(args.run_seconds)
+    os.environ["ATHENA_LOCAL_FAILURE_RATE"] = str(args.failure_rate)
+
+    from app.core.settings.environments import settings
+    database = settings.athena_databases["bustrax"]
+    table = Path(args.data_dir) / database / "viajes_facturacion.parquet"
+    if not table.exists():
+        from app.core.database.athena.local_data import generar_viajes_facturacion
+        table.parent.mkdir(parents=True, exist_ok=True)
+        generar_viajes_facturacion(filas=args.rows).write_parquet(table)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Prueba de carga en proceso con backend Athena local")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="Lista separada por comas: " + ", ".join(ENDPOINTS))
+    parser.add_argument("--concurrency", default="1,4,16", help="Niveles de concurrencia separados por comas")
+    parser.add_argument("--requests", type=int, default=40, help="Peticiones por nivel de concurrencia")
+    parser.add_argument("--data-dir", default="./data/athena_local")
+    parser.add_argument("--rows", type=int, default=50_000, help="Filas sintéticas si no existe la tabla local")
+    parser.add_argument("--queue-seconds", type=float, default=0.0)
+    parser.add_argument("--run-seconds", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--json", action="store_true", help="Imprime los resultados como JSON")
+    args = parser.parse_args()
+
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    unknown = [e for e in endpoints if e not in ENDPOINTS]
+    if unknown:
+        parser.error(f"Endpoints desconocidos: {', '.join(unknown)}")
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    _prepare_environment(args)
+    results = asyncio.run(run(endpoints, levels, args.requests))
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+        return
+
+    header = f"{'endpoint':<10} {'conc':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errores':>8} {'lag ms':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['endpoint']:<10} {r['concurrency']:>5} {r['throughput_rps']:>9} {r['p50_ms']:>9} "
+            f"{r['p95_ms']:>9} {r['p99_ms']:>9} {r['error_rate']:>8.1%} {r['loop_lag_ms']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
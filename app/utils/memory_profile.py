@@ -0,0 +1,325 @@
+import contextvars
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.core.logger.config import LoggerConfig
+from app.core.settings.environments import settings
+
+# Nota: Path(__file__).stem == __name__.split('.')[-1]
+logger = LoggerConfig(file_name=Path(__file__).stem,debug=True,root_file=__name__).get_logger()
+
+# Encabezado con el que una petición pide su perfil de memoria (solo en desarrollo)
+PROFILE_HEADER = "X-Memory-Profile"
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+# Perfil activo del contexto actual (se propaga a asyncio.to_thread igual que los spans)
+_current_profile: contextvars.ContextVar[Optional["MemoryProfile"]] = contextvars.ContextVar("memory_profile", default=None)
+
+# tracemalloc es global al proceso: solo se perfila una petición a la vez
+_profile_lock = threading.Lock()
+
+# Perfiles recientes para /test/memory
+_recent: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_recent_lock = threading.Lock()
+
+
+def rss_bytes() -> Optional[int]:
+    """Memoria residente actual del proceso (Linux); None si no se puede leer"""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class StageStats:
+    """
+    Estadísticas acumuladas de una etapa; una etapa que se repite (p. ej. un bloque) suma sus llamadas
+    """
+    __slots__ = ("name", "calls", "duration_ms", "python_net", "python_peak", "rss_delta", "rss_peak", "top")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.duration_ms = 0.0
+        self.python_net = 0
+        self.python_peak = 0
+        self.rss_delta = 0
+        self.rss_peak = 0
+        self.top: List[Dict[str, Any]] = []
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "duration_ms": round(self.duration_ms, 1),
+            "python_net_bytes": self.python_net,
+            "python_peak_bytes": self.python_peak,
+            "rss_delta_bytes": self.rss_delta,
+            "rss_peak_bytes": self.rss_peak,
+            "top_allocations": self.top,
+        }
+
+
+class _OpenStage:
+    __slots__ = ("stats", "start", "python_start", "python_peak", "rss_start", "rss_peak", "snapshot")
+
+    def __init__(self, stats: StageStats, rss: Optional[int], snapshot: Optional[tracemalloc.Snapshot]):
+        self.stats = stats
+        self.start = time.perf_counter()
+        self.python_start = tracemalloc.get_traced_memory()[0]
+        self.python_peak = self.python_start
+        self.rss_start = rss or 0
+        self.rss_peak = rss or 0
+        self.snapshot = snapshot
+
+
+class MemoryProfile:
+    """
+    Perfil de memoria de una petición: memoria de Python (tracemalloc) y RSS del proceso por etapa del pipeline.
+
+    tracemalloc solo ve las asignaciones de Python (filas JSON, CSV en texto, BytesIO del Excel); lo que reserva
+    Polars en Rust solo aparece en el RSS, que un hilo muestrea cada MEMORY_PROFILE_SAMPLE_MS para obtener el pico
+    de cada etapa. Las etapas se pueden anidar y el pico de una etapa incluye el de sus etapas internas.
+    """
+
+    def __init__(self, path: str):
+        self.id = uuid.uuid4().hex[:16]
+        self.path = path
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._stages: "OrderedDict[str, StageStats]" = OrderedDict()
+        self._open: List[_OpenStage] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self.rss_start = rss_bytes() or 0
+        self.rss_peak = self.rss_start
+        self.python_peak = 0
+        self.peak_stage: Optional[str] = None
+        self.result: Optional[Dict[str, Any]] = None
+
+    def start(self) -> None:
+        tracemalloc.start(1)
+        tracemalloc.reset_peak()
+        self._sampler = threading.Thread(target=self._sample, name="memory_profile", daemon=True)
+        self._sampler.start()
+
+    def _sample(self) -> None:
+        interval = max(1, settings.MEMORY_PROFILE_SAMPLE_MS) / 1000
+        while not self._stop.wait(interval):
+            rss = rss_bytes()
+            if rss is None:
+                return
+            with self._lock:
+                self._observe_rss(rss)
+
+    def _observe_rss(self, rss: int) -> None:
+        # El RSS casi nunca baja (el allocator conserva la memoria), así que el pico se atribuye a la etapa
+        # más interna abierta cuando el RSS alcanza un nuevo máximo
+        if rss > self.rss_peak:
+            self.rss_peak = rss
+            if self._open:
+                self.peak_stage = self._open[-1].stats.name
+        for stage in self._open:
+            stage.rss_peak = max(stage.rss_peak, rss)
+
+    def _fold_python_peak(self) -> None:
+        # El pico de tracemalloc se reinicia en cada límite de etapa; antes se reparte entre las etapas abiertas
+        peak = tracemalloc.get_traced_memory()[1]
+        self.python_peak = max(self.python_peak, peak)
+        for stage in self._open:
+            stage.python_peak = max(stage.python_peak, peak)
+        tracemalloc.reset_peak()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        rss = rss_bytes()
+        with self._lock:
+            stats = self._stages.get(name)
+            if stats is None:
+                stats = self._stages[name] = StageStats(name)
+            # Los sitios de asignación se calculan solo en la primera llamada de cada etapa (tomar snapshots es caro)
+            snapshot = tracemalloc.take_snapshot() if stats.calls == 0 and settings.MEMORY_PROFILE_TOP > 0 else None
+            self._fold_python_peak()
+            if rss is not None:
+                self._observe_rss(rss)
+            current = _OpenStage(stats, rss, snapshot)
+            self._open.append(current)
+        try:
+            yield
+        finally:
+            rss = rss_bytes() or 0
+            with self._lock:
+                self._fold_python_peak()
+                self._observe_rss(rss)
+                self._open.remove(current)
+                stats.calls += 1
+                stats.duration_ms += (time.perf_counter() - current.start) * 1000
+                stats.python_net += tracemalloc.get_traced_memory()[0] - current.python_start
+                stats.python_peak = max(stats.python_peak, current.python_peak - current.python_start)
+                stats.rss_delta += rss - current.rss_start
+                stats.rss_peak = max(stats.rss_peak, current.rss_peak, rss)
+                if current.snapshot is not None:
+                    stats.top = self._top_allocations(current.snapshot)
+
+    @staticmethod
+    def _top_allocations(before: tracemalloc.Snapshot) -> List[Dict[str, Any]]:
+        """Líneas de código que más memoria de Python retienen al terminar la etapa respecto a su inicio"""
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ]
+        after = tracemalloc.take_snapshot().filter_traces(filters)
+        diff = after.compare_to(before.filter_traces(filters), "lineno")
+        return [
+            {"site": str(stat.traceback[0]), "size_bytes": stat.size_diff, "count": stat.count_diff}
+            for stat in diff[:settings.MEMORY_PROFILE_TOP]
+            if stat.size_diff > 0
+        ]
+
+    def stop(self) -> Dict[str, Any]:
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join(timeout=1)
+        with self._lock:
+            self._fold_python_peak()
+            python_end = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        stages = [stats.to_dict() for stats in self._stages.values()]
+        self.result = {
+            "id": self.id,
+            "path": self.path,
+            "started_at": self.started_at,
+            "duration_ms": round((time.perf_counter() - self._start) * 1000, 1),
+            "rss_start_bytes": self.rss_start,
+            "rss_end_bytes": rss_bytes(),
+            "rss_peak_bytes": self.rss_peak,
+            "python_peak_bytes": self.python_peak,
+            "python_end_bytes": python_end,
+            "peak_stage": self.peak_stage,
+            "stages": stages,
+        }
+        return self.result
+
+    def headers(self) -> List[tuple]:
+        result = self.result or {}
+        return [
+            (b"x-memory-profile-id", self.id.encode()),
+            (b"x-memory-peak-rss", str(result.get("rss_peak_bytes", 0)).encode()),
+            (b"x-memory-peak-python", str(result.get("python_peak_bytes", 0)).encode()),
+            (b"x-memory-peak-stage", str(result.get("peak_stage") or "").encode()),
+        ]
+
+
+def active() -> bool:
+    """Indica si la petición actual se está perfilando"""
+    return _current_profile.get() is not None
+
+
+@contextmanager
+def memory_stage(name: str) -> Iterator[None]:
+    """
+    Marca una etapa del pipeline; no hace nada si la petición actual no pidió perfil de memoria
+    """
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+    with profile.stage(name):
+        yield
+
+
+@contextmanager
+def profiling(path: str) -> Iterator[MemoryProfile]:
+    """
+    Perfila un bloque de código fuera de una petición HTTP (p. ej. la regresión de app.utils.golden);
+    al salir el detalle por etapa queda en `profile.result`
+    """
+    with _profile_lock:
+        profile = MemoryProfile(path)
+        token = _current_profile.set(profile)
+        profile.start()
+        try:
+            yield profile
+        finally:
+            _current_profile.reset(token)
+            profile.stop()
+
+
+def get_profile(profile_id: str) -> Optional[Dict[str, Any]]:
+    with _recent_lock:
+        return _recent.get(profile_id)
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    with _recent_lock:
+        return [
+            {k: v for k, v in profile.items() if k != "stages"}
+            for profile in reversed(_recent.values())
+        ]
+
+
+def _remember(result: Dict[str, Any]) -> None:
+    with _recent_lock:
+        _recent[result["id"]] = result
+        while len(_recent) > settings.MEMORY_PROFILE_KEEP:
+            _recent.popitem(last=False)
+
+
+class MemoryProfileMiddleware:
+    """
+    Middleware ASGI (solo desarrollo): si la petición trae `X-Memory-Profile: 1` la perfila completa, devuelve el pico
+    de RSS, el de Python y la etapa del pico en encabezados X-Memory-*, y guarda el detalle por etapa en /test/memory/{id}.
+    Si ya hay otra petición perfilándose se responde `X-Memory-Profile: busy` sin perfilar.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        if headers.get(PROFILE_HEADER.lower().encode(), b"").decode("latin-1").lower() not in ("1", "true", "yes"):
+            return await self.app(scope, receive, send)
+
+        if not _profile_lock.acquire(blocking=False):
+            async def send_busy(message):
+                if message["type"] == "http.response.start":
+                    message["headers"] = list(message.get("headers", [])) + [(PROFILE_HEADER.lower().encode(), b"busy")]
+                await send(message)
+            return await self.app(scope, receive, send_busy)
+
+        profile = MemoryProfile(scope["path"])
+        token = _current_profile.set(profile)
+        profile.start()
+        try:
+            async def send_with_profile(message):
+                if message["type"] == "http.response.start":
+                    _remember(profile.stop())
+                    logger.info(
+                        f"Perfil de memoria {profile.id} {scope['path']}: pico RSS {profile.rss_peak / 2**20:.1f} MB, "
+                        f"pico Python {profile.python_peak / 2**20:.1f} MB, etapa {profile.result['peak_stage']}"
+                    )
+                    message["headers"] = list(message.get("headers", [])) + profile.headers()
+                await send(message)
+
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            _current_profile.reset(token)
+            if profile.result is None:
+                profile.stop()
+            _profile_lock.release()
@@ -0,0 +1,68 @@
+import datetime as dt
+import hashlib
+import json
+import re
+from typing import Any, List, Optional, Sequence
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sql(query: str) -> str:
+    """
+    Normaliza el texto de una consulta para compararla: colapsa espacios y quita el ';' final.
+    No cambia mayúsculas/minúsculas porque afectarían a las literales de texto.
+    """
+    return _WHITESPACE.sub(" ", query).strip().rstrip(";").strip()
+
+
+def sql_literal(value: Any) -> str:
+    """
+    Convierte un valor de Python en una literal SQL de Athena para ExecutionParameters.
+    Las comillas simples se duplican, por lo que el valor nunca puede cerrar la literal e inyectar SQL.
+    """
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, dt.datetime):
+        return f"TIMESTAMP '{value.strftime('%Y-%m-%d %H:%M:%S')}'"
+    if isinstance(value, dt.date):
+        # Las fechas de viajes_facturacion se guardan como texto YYYY-MM-DD
+        return f"'{value.strftime('%Y-%m-%d')}'"
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def query_fingerprint(query: str, parameters: Optional[Sequence[Any]] = None, database: str = "") -> str:
+    """
+    Huella estable de una consulta: misma base, mismo SQL normalizado y mismos parámetros producen la misma huella.
+    Sin parámetros identifica la plantilla de la consulta.
+    """
+    payload = json.dumps(
+        [database, normalize_sql(query), [sql_literal(p) for p in parameters or []]],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def bind_parameters(query: str, literals: List[str]) -> str:
+    """
+    Sustituye los marcadores `?` fuera de literales de texto por las literales dadas, en orden
+    """
+    parts = []
+    pending = iter(literals)
+    in_string = False
+    for char in query:
+        if char == "'":
+            in_string = not in_string
+        if char == "?" and not in_string:
+            try:
+                parts.append(next(pending))
+            except StopIteration:
+                raise ValueError("Hay más marcadores '?' que parámetros")
+            continue
+        parts.append(char)
+    if next(pending, None) is not None:
+        raise ValueError("Hay más parámetros que marcadores '?'")
+    return "".join(parts)
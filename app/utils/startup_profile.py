@@ -0,0 +1,70 @@
+import re
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+_IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+def profile_imports(module: str = "app.main", top: int = 20) -> Dict[str, Any]:
+    """
+    Ejecuta `python -X importtime` en un subproceso limpio y devuelve el desglose de tiempos de importación.
+
+    Args:
+        module: Módulo a importar (por defecto app.main)
+        top: Número de módulos a devolver ordenados por tiempo acumulado
+
+    Returns:
+        Diccionario con el tiempo total en ms y los módulos más costosos
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+
+    modules: List[Dict[str, Any]] = []
+    for line in completed.stderr.splitlines():
+        match = _IMPORT_TIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        modules.append({
+            "module": name,
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+            "depth": len(indent) // 2,
+        })
+
+    if completed.returncode != 0:
+        return {
+            "status": "error",
+            "message": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "Error desconocido",
+            "module": module,
+        }
+
+    total_ms = next((m["cumulative_ms"] for m in reversed(modules) if m["module"] == module), 0)
+    heaviest = sorted(modules, key=lambda m: m["cumulative_ms"], reverse=True)
+
+    return {
+        "status": "success",
+        "module": module,
+        "total_ms": total_ms,
+        "top": heaviest[:top],
+    }
+
+
+if __name__ == "__main__":
+    # Uso: python -m app.utils.startup_profile [modulo] [top]
+    target = sys.argv[1] if len(sys.argv) > 1 else "app.main"
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    report = profile_imports(target, limit)
+    if report["status"] == "error":
+        print(f"Error importando {target}: {report['message']}")
+        sys.exit(1)
+
+    print(f"Importación de {target}: {report['total_ms']:.1f} ms")
+    print(f"{'acumulado ms':>14} {'propio ms':>10}  módulo")
+    for item in report["top"]:
+        print(f"{item['cumulative_ms']:>14.1f} {item['self_ms']:>10.1f}  {'  ' * item['depth']}{item['module']}")
@@ -0,0 +1,67 @@
+import asyncio
+import csv
+import io
+import json
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator
+
+from app.core.logger.config import LoggerConfig
+
+# Nota: Path(__file__).stem == __name__.split('.')[-1]
+logger = LoggerConfig(file_name=Path(__file__).stem,debug=True,root_file=__name__).get_logger()
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+_END = object()
+
+
+def encode_page(page: Dict[str, Any], fmt: str, include_header: bool) -> bytes:
+    """
+    Serializa una página de resultados ({"columns", "data"}) como CSV o NDJSON (un objeto JSON por fila)
+    """
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if include_header:
+            writer.writerow(page["columns"])
+        writer.writerows(page["data"])
+        return buffer.getvalue().encode("utf-8")
+
+    columns = page["columns"]
+    return "".join(
+        json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in page["data"]
+    ).encode("utf-8")
+
+
+async def stream_pages(pages: Iterator[Dict[str, Any]], fmt: str) -> AsyncIterator[bytes]:
+    """
+    Convierte un iterador bloqueante de páginas en un stream de bytes para StreamingResponse.
+
+    Cada página se pide en un hilo solo cuando la anterior ya se entregó al cliente, así que la memoria del servidor
+    se mantiene en una página y un cliente lento frena la lectura de Athena (backpressure). Si el cliente se
+    desconecta, Starlette cancela el generador y se cierra el iterador.
+
+    Un error al leer una página se registra y se vuelve a lanzar: el servidor corta la conexión sin el chunk final
+    y el cliente ve una transferencia incompleta en lugar de un extracto truncado con estado 200.
+    """
+    include_header = True
+    try:
+        while True:
+            page = await asyncio.to_thread(next, pages, _END)
+            if page is _END:
+                break
+            chunk = encode_page(page, fmt, include_header)
+            include_header = False
+            if chunk:
+                yield chunk
+    except Exception as e:
+        # Los encabezados HTTP ya se enviaron: se registra y se propaga para abortar el stream, nunca terminarlo limpio
+        logger.error(f"Error enviando resultados en streaming: {str(e)}")
+        raise
+    finally:
+        close = getattr(pages, "close", None)
+        if close is not None:
+            await asyncio.to_thread(close)
@@ -0,0 +1,248 @@
+import contextvars
+import functools
+import json
+import os
+import queue
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from app.core.logger.config import LoggerConfig
+from app.core.settings.environments import settings
+
+# Nota: Path(__file__).stem == __name__.split('.')[-1]
+logger = LoggerConfig(file_name=Path(__file__).stem,debug=True,root_file=__name__).get_logger()
+
+TRACE_HEADER = "X-Trace-Id"
+
+# Span activo del contexto actual (se propaga a asyncio.to_thread; para otros hilos usar copy_context)
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+def _new_id(n_bytes: int) -> str:
+    return os.urandom(n_bytes).hex()
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "start_ns", "end_ns", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.error: Optional[str] = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    @property
+    def duration_ms(self) -> float:
+        return round((self.end_ns - self.start_ns) / 1e6, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class SpanExporter:
+    """
+    Exporta los spans terminados en un hilo de fondo para no agregar latencia a las peticiones:
+    - file: una línea JSON por span en TRACING_FILE
+    - otlp: lotes OTLP/HTTP JSON a TRACING_OTLP_ENDPOINT (p. ej. un collector local en :4318)
+    """
+
+    def __init__(self, exporter: str):
+        self.exporter = exporter
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=10_000)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="span_exporter", daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            # Se prefiere perder spans a bloquear una petición
+            pass
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            # Agrupa lo que llegue en los siguientes instantes para exportar por lotes
+            deadline = time.time() + 0.5
+            while len(batch) < 512 and time.time() < deadline:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.time())))
+                except queue.Empty:
+                    break
+            try:
+                if self.exporter == "otlp":
+                    self._export_otlp(batch)
+                else:
+                    self._export_file(batch)
+            except Exception as e:
+                logger.warning(f"No se pudieron exportar {len(batch)} spans: {str(e)}")
+
+    def _export_file(self, batch: List[Span]) -> None:
+        path = Path(settings.TRACING_FILE)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("a", encoding="utf-8") as f:
+            for span in batch:
+                f.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+
+    def _export_otlp(self, batch: List[Span]) -> None:
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    {"key": "service.name", "value": {"stringValue": settings.TRACING_SERVICE_NAME}},
+                    {"key": "deployment.environment", "value": {"stringValue": settings.ENVIRONMENT}},
+                ]},
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": [span.to_otlp() for span in batch]}],
+            }]
+        }
+        request = urllib.request.Request(
+            settings.TRACING_OTLP_ENDPOINT,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=5):
+            pass
+
+
+_exporter = SpanExporter(settings.TRACING_EXPORTER) if settings.TRACING_EXPORTER in ("file", "otlp") else None
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_trace_id() -> Optional[str]:
+    current = _current_span.get()
+    return current.trace_id if current else None
+
+
+@contextmanager
+def span(name: str, trace_id: Optional[str] = None, parent_id: Optional[str] = None, **attributes) -> Iterator[Span]:
+    """
+    Abre un span hijo del span activo (o la raíz de una traza nueva). Los errores se registran en el span y se propagan.
+    """
+    parent = _current_span.get()
+    if parent is not None and trace_id is None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    current = Span(name, trace_id or _new_id(16), parent_id, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end_ns = time.time_ns()
+        if _exporter is not None:
+            _exporter.export(current)
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """
+    Decorador que envuelve una función en un span; sin nombre se usa Clase.método
+    """
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _exporter is None:
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def parse_traceparent(value: Optional[str]) -> tuple:
+    """
+    Extrae (trace_id, parent_span_id) de un encabezado W3C traceparent: 00-<32 hex>-<16 hex>-<flags>
+    """
+    parts = (value or "").split("-")
+    if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+        return parts[1], parts[2]
+    return None, None
+
+
+class TracingMiddleware:
+    """
+    Middleware ASGI: abre el span raíz de cada petición HTTP (continuando un traceparent entrante si existe)
+    y devuelve el id de la traza en X-Trace-Id y traceparent
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        trace_id, parent_id = parse_traceparent(headers.get(b"traceparent", b"").decode("latin-1"))
+        with span(f"{scope['method']} {scope['path']}", trace_id=trace_id, parent_id=parent_id, **{
+            "http.method": scope["method"],
+            "http.target": scope["path"],
+        }) as root:
+            async def send_with_trace(message):
+                if message["type"] == "http.response.start":
+                    root.set(**{"http.status_code": message["status"]})
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [
+                        (TRACE_HEADER.lower().encode(), root.trace_id.encode()),
+                        (b"traceparent", f"00-{root.trace_id}-{root.span_id}-01".encode()),
+                    ]
+                await send(message)
+
+            await self.app(scope, receive, send_with_trace)
@@ -1,8 +1,22 @@
+from __future__ import annotations
+
+import os
 from datetime import datetime
-from zoneinfo import ZoneInfo
-from typing import Optional
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from typing import Iterable, Optional, TYPE_CHECKING, Union
 # import pytz
 
+if TYPE_CHECKING:
+    import polars as pl
+
+
+@lru_cache(maxsize=None)
+def _get_zone(timezone_str: str) -> ZoneInfo:
+    """Devuelve la zona horaria cacheada para no construirla en cada llamada"""
+    return ZoneInfo(timezone_str)
+
+
 def format_datetime_with_timezone(
     dt: datetime,
     timezone_str: str = "America/Mexico_City",
@@ -22,9 +36,114 @@ def format_datetime_with_timezone(
         String formateado en la zona horaria deseada
     """
     if dt.tzinfo is None and assume_utc_if_naive:
-        dt = dt.replace(tzinfo=ZoneInfo("UTC"))
+        dt = dt.replace(tzinfo=_get_zone("UTC"))
     
-    target_tz = ZoneInfo(timezone_str)
+    target_tz = _get_zone(timezone_str)
     localized_dt = dt.astimezone(target_tz)
     
-    return localized_dt.strftime(format_str)
\ No newline at end of file
+    return localized_dt.strftime(format_str)
+
+
+@lru_cache(maxsize=1)
+def _local_timezone_name() -> str:
+    """
+    Nombre IANA de la zona horaria del sistema (TZ o /etc/localtime), equivalente a lo que usa astimezone()
+    con un datetime naive. En el contenedor es America/Mexico_City.
+    """
+    candidates = [os.environ.get("TZ")]
+    if os.path.islink("/etc/localtime"):
+        target = os.path.realpath("/etc/localtime")
+        if "zoneinfo/" in target:
+            candidates.append(target.split("zoneinfo/", 1)[1])
+
+    for name in candidates:
+        if not name:
+            continue
+        try:
+            _get_zone(name)
+            return name
+        except (ZoneInfoNotFoundError, ValueError):
+            continue
+    return "UTC"
+
+
+def convert_datetime_timezone_expr(
+    column: Union[str, pl.Expr],
+    timezone_str: str = "America/Mexico_City",
+    assume_utc_if_naive: bool = True,
+    is_naive: bool = True
+) -> pl.Expr:
+    """
+    Expresión de Polars que convierte una columna Datetime a la zona horaria deseada, de forma vectorizada.
+
+    Args:
+        column: Nombre de la columna o expresión Datetime
+        timezone_str: Zona horaria destino (ej. "America/Mexico_City")
+        assume_utc_if_naive: Si es True, los valores naive se interpretan como UTC; si no, en la zona del sistema
+        is_naive: Indica si la columna no tiene timezone; las columnas con timezone solo se convierten
+
+    Returns:
+        Expresión Datetime con timezone_str
+    """
+    import polars as pl
+
+    expr = pl.col(column) if isinstance(column, str) else column
+    if is_naive:
+        source_tz = "UTC" if assume_utc_if_naive else _local_timezone_name()
+        expr = expr.dt.replace_time_zone(source_tz, ambiguous="earliest", non_existent="null")
+    return expr.dt.convert_time_zone(timezone_str)
+
+
+def format_datetime_with_timezone_expr(
+    column: Union[str, pl.Expr],
+    timezone_str: str = "America/Mexico_City",
+    format_str: str = "%d/%m/%Y %H:%M",
+    assume_utc_if_naive: bool = True,
+    is_naive: bool = True
+) -> pl.Expr:
+    """
+    Equivalente vectorizado de format_datetime_with_timezone: convierte y formatea una columna completa en Polars.
+
+    Returns:
+        Expresión String formateada en la zona horaria deseada
+    """
+    return convert_datetime_timezone_expr(column, timezone_str, assume_utc_if_naive, is_naive).dt.strftime(format_str)
+
+
+def format_datetime_columns(
+    df: pl.DataFrame,
+    columns: Iterable[str],
+    timezone_str: str = "America/Mexico_City",
+    format_str: Optional[str] = "%d/%m/%Y %H:%M",
+    assume_utc_if_naive: bool = True
+) -> pl.DataFrame:
+    """
+    Convierte (y formatea si format_str no es None) varias columnas de un DataFrame, p. ej. start_datetime y end_datetime.
+    Detecta por el schema si cada columna es naive o tiene timezone. Las columnas String se parsean antes ('' es null):
+    las que traen offset (p. ej. +02:00) quedan con timezone y solo se convierten, y un valor que no se puede
+    parsear lanza ValueError en lugar de quedar como null.
+    """
+    import polars as pl
+
+    exprs = []
+    for name in columns:
+        dtype = df.schema[name]
+        expr = pl.col(name)
+        if dtype == pl.String:
+            try:
+                parsed = df.get_column(name).replace("", None).str.to_datetime(strict=True)
+            except pl.exceptions.PolarsError as e:
+                raise ValueError(f"La columna '{name}' tiene valores que no son fechas: {str(e)}") from e
+            expr = pl.lit(parsed)
+            is_naive = parsed.dtype.time_zone is None
+        elif isinstance(dtype, pl.Datetime):
+            is_naive = dtype.time_zone is None
+        else:
+            raise TypeError(f"La columna '{name}' no es Datetime ni String: {dtype}")
+
+        if format_str is None:
+            exprs.append(convert_datetime_timezone_expr(expr, timezone_str, assume_utc_if_naive, is_naive).alias(name))
+        else:
+            exprs.append(format_datetime_with_timezone_expr(expr, timezone_str, format_str, assume_utc_if_naive, is_naive).alias(name))
+
+    return df.with_columns(exprs)